@@ -1,29 +1,62 @@
 """
 Legal Question Analysis API endpoints
 """
+import asyncio
 import logging
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, status
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
-from pydantic import BaseModel, Field
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, ConfigDict, Field
 
-from ..core.database import get_db
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal, cache_delete, cache_get, cache_set, get_db
+from ..core.rate_limit import enforce_rate_limit
+from ..core.pagination import PaginationInfo, decode_cursor, next_cursor
+from ..core.responses import StaticJSON, not_modified, record_etag
 from .auth import get_current_user
-from ..services.analysis_service import analysis_service
+from ..services.analysis_service import analysis_service, stats_cache_key
+from ..services.batch_service import batch_analysis_service
+from ..tasks.analysis_tasks import analyze_question_task
+from ..models.question_analysis import DIFFICULTY_LEVELS
 from ..models.user import User
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/analysis", tags=["analysis"])
 
+# Per-user statistics are cached briefly and dropped whenever the user's analyses change
+STATS_CACHE_TTL_SECONDS = 60
+
+# Largest request analyzed immediately; bigger ones belong on the Batch API
+IMMEDIATE_BATCH_MAX_QUESTIONS = 50
+
+# Static filter options, serialized once at import time
+_QUESTION_TYPES = StaticJSON({
+    "question_types": [
+        {"value": "選擇題", "label": "選擇題"},
+        {"value": "問答題", "label": "問答題"},
+        {"value": "申論題", "label": "申論題"},
+        {"value": "案例分析", "label": "案例分析"},
+        {"value": "未分類", "label": "未分類"}
+    ],
+    "difficulty_levels": [{"value": level, "label": level} for level in DIFFICULTY_LEVELS]
+}, headers={"Cache-Control": "public, max-age=86400"})
+
 
 class QuestionAnalysisRequest(BaseModel):
     """Request model for question analysis"""
     question_text: str = Field(..., min_length=10, max_length=5000, description="Legal question to analyze")
     document_id: Optional[str] = Field(None, description="Document ID if question is from uploaded document")
     context: Optional[str] = Field(None, max_length=1000, description="Additional context about the question")
-    question_type_hint: Optional[str] = Field(None, description="Hint about question type")
+    question_type_hint: Optional[str] = Field(None, max_length=50, description="Hint about question type")
+
+
+class BatchAnalysisRequest(BaseModel):
+    """Request model for queuing many questions for batch analysis"""
+    questions: List[QuestionAnalysisRequest] = Field(..., min_length=1, max_length=500, description="Questions to analyze")
 
 
 class AnalysisRatingRequest(BaseModel):
@@ -32,11 +65,59 @@ class AnalysisRatingRequest(BaseModel):
     feedback: Optional[str] = Field(None, max_length=1000, description="Optional feedback")
 
 
-@router.post("/question", status_code=status.HTTP_201_CREATED)
+class AnalysisPublic(BaseModel):
+    """Question analysis response model, read straight from ORM objects or list rows"""
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: uuid.UUID
+    user_id: uuid.UUID
+    document_id: Optional[uuid.UUID] = None
+    question_text: str
+    question_type: Optional[str] = None
+    question_difficulty: Optional[str] = None
+    status: str
+    analysis_result: Optional[Dict[str, Any]] = None
+    confidence_score: Optional[float] = None
+    relevant_laws: Optional[List[Dict[str, Any]]] = None
+    legal_concepts: Optional[List[Dict[str, Any]]] = None
+    key_points: Optional[List[Any]] = None
+    study_suggestions: Optional[str] = None
+    similar_questions: Optional[List[Dict[str, Any]]] = None
+    practice_materials: Optional[List[Dict[str, Any]]] = None
+    ai_model_used: Optional[str] = None
+    processing_time_ms: Optional[float] = None
+    user_rating: Optional[float] = None
+    user_feedback: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+
+class AnalysisDetailResponse(BaseModel):
+    """Single analysis response model"""
+    analysis: AnalysisPublic
+
+
+class AnalysisListResponse(BaseModel):
+    """Analysis listing response model"""
+    analyses: List[AnalysisPublic]
+    pagination: PaginationInfo
+
+
+async def analysis_rate_limit(current_user: User = Depends(get_current_user)) -> None:
+    """Dependency to throttle question analysis per user"""
+    await enforce_rate_limit(f"analysis:{current_user.id}", settings.analysis_rate_limit)
+
+
+@router.post(
+    "/question",
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(analysis_rate_limit)]
+)
 async def analyze_question(
     request: QuestionAnalysisRequest,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Analyze a legal question using AI
@@ -47,9 +128,15 @@ async def analyze_question(
     - Relevant law identification
     - Key concept extraction
     - Study recommendations
+    
+    When the task queue is enabled the analysis runs on a background worker:
+    the response is 202 with a pending analysis_id to poll via GET /analysis/{analysis_id}.
     """
     try:
-        logger.info(f"Analyzing question for user {current_user.id}")
+        logger.info("Analyzing question for user %s", current_user.id)
+        
+        if settings.analysis_task_queue_enabled:
+            return await _enqueue_analysis(request, response, current_user, db)
         
         # Perform analysis
         result = await analysis_service.analyze_question(
@@ -60,6 +147,7 @@ async def analyze_question(
             context=request.context,
             question_type_hint=request.question_type_hint
         )
+        await cache_delete(stats_cache_key(current_user.id))
         
         return {
             "message": "Question analysis completed successfully",
@@ -67,23 +155,166 @@ async def analyze_question(
         }
         
     except Exception as e:
-        logger.error(f"Question analysis failed for user {current_user.id}: {e}")
+        logger.error("Question analysis failed for user %s: %s", current_user.id, e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to analyze question"
         )
 
 
-@router.get("/{analysis_id}")
+async def _enqueue_analysis(
+    request: QuestionAnalysisRequest,
+    response: Response,
+    current_user: User,
+    db: AsyncSession
+) -> dict:
+    """
+    Create a pending analysis and hand it to a Celery worker
+    
+    If the broker is unreachable the pending analysis is completed inline instead.
+    """
+    question_analysis = await analysis_service.create_pending_analysis(
+        question_text=request.question_text,
+        user_id=str(current_user.id),
+        db=db,
+        document_id=request.document_id
+    )
+    analysis_id = str(question_analysis.id)
+    await cache_delete(stats_cache_key(current_user.id))
+    
+    try:
+        # Publishing talks to the broker synchronously, keep it off the event loop
+        await asyncio.to_thread(
+            analyze_question_task.delay,
+            analysis_id,
+            str(current_user.id),
+            request.context,
+            request.question_type_hint
+        )
+    except Exception as e:
+        logger.error("Failed to queue analysis %s, running inline: %s", analysis_id, e)
+        result = await analysis_service.complete_pending_analysis(
+            analysis_id=analysis_id,
+            db=db,
+            context=request.context,
+            question_type_hint=request.question_type_hint
+        )
+        return {
+            "message": "Question analysis completed successfully",
+            "analysis": result
+        }
+    
+    response.status_code = status.HTTP_202_ACCEPTED
+    return {
+        "message": "Question analysis queued",
+        "analysis_id": analysis_id,
+        "status": question_analysis.status
+    }
+
+
+@router.post(
+    "/batch",
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(analysis_rate_limit)]
+)
+async def analyze_questions_batch(
+    request: BatchAnalysisRequest,
+    response: Response,
+    defer: bool = Query(True, description="Use the OpenAI Batch API (results within 24h) instead of analyzing now"),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Analyze many legal questions at once
+    
+    By default the questions are queued for the OpenAI Batch API, meant for bulk
+    ingestion where results are not needed right away: it costs about half as much
+    as live analysis and completes within 24 hours. Poll each analysis_id via
+    GET /analysis/{analysis_id}.
+    
+    With defer=false (up to 50 questions) they are analyzed immediately with
+    concurrent LLM calls and the response is 201 with the results.
+    """
+    if not defer:
+        return await _analyze_batch_now(request, response, current_user, db)
+    
+    try:
+        analysis_ids = await batch_analysis_service.enqueue_for_batch(
+            questions=[question.model_dump() for question in request.questions],
+            user_id=str(current_user.id),
+            db=db
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error("Queuing batch analysis failed for user %s: %s", current_user.id, e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to queue questions for batch analysis"
+        )
+    await cache_delete(stats_cache_key(current_user.id))
+    
+    return {
+        "message": "Questions queued for batch analysis",
+        "analysis_ids": analysis_ids,
+        "status": "pending"
+    }
+
+
+async def _analyze_batch_now(
+    request: BatchAnalysisRequest,
+    response: Response,
+    current_user: User,
+    db: AsyncSession
+) -> dict:
+    """Analyze a small batch of questions in this request with concurrent LLM calls"""
+    if len(request.questions) > IMMEDIATE_BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {IMMEDIATE_BATCH_MAX_QUESTIONS} questions can be analyzed immediately; use defer=true"
+        )
+    
+    try:
+        results = await analysis_service.analyze_questions_bulk(
+            questions=[question.model_dump() for question in request.questions],
+            user_id=str(current_user.id),
+            db=db
+        )
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    except Exception as e:
+        logger.error("Bulk analysis failed for user %s: %s", current_user.id, e)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to analyze questions"
+        )
+    await cache_delete(stats_cache_key(current_user.id))
+    
+    response.status_code = status.HTTP_201_CREATED
+    return {
+        "message": "Question analysis completed successfully",
+        "analyses": results
+    }
+
+
+@router.get("/{analysis_id}", response_model=AnalysisDetailResponse)
 async def get_analysis(
     analysis_id: str,
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get analysis results by ID
     """
-    analysis = analysis_service.get_analysis(
+    analysis = await analysis_service.get_analysis(
         analysis_id=analysis_id,
         user_id=str(current_user.id),
         db=db
@@ -95,36 +326,66 @@ async def get_analysis(
             detail="Analysis not found"
         )
     
+    # Rating or finishing a queued analysis bumps updated_at, which changes the ETag
+    etag = record_etag(analysis.id, analysis.updated_at)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    response.headers["ETag"] = etag
+    
     return {
-        "analysis": analysis.to_dict()
+        "analysis": analysis
     }
 
 
-@router.get("/")
+@router.get("/", response_model=AnalysisListResponse)
 async def list_analyses(
     limit: int = Query(20, ge=1, le=100, description="Number of analyses to return"),
-    offset: int = Query(0, ge=0, description="Number of analyses to skip"),
+    offset: int = Query(0, ge=0, description="Number of analyses to skip (ignored when cursor is set)"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page, for keyset pagination"),
     question_type: Optional[str] = Query(None, description="Filter by question type"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     List user's question analyses with pagination and filtering
     """
-    analyses = analysis_service.get_user_analyses(
-        user_id=str(current_user.id),
-        db=db,
-        limit=limit,
-        offset=offset,
-        question_type_filter=question_type
-    )
+    page_cursor = decode_cursor(cursor)
+    
+    def fetch_page():
+        return analysis_service.get_user_analyses(
+            user_id=str(current_user.id),
+            db=db,
+            limit=limit,
+            offset=offset,
+            question_type_filter=question_type,
+            cursor=page_cursor
+        )
+    
+    def count(session: AsyncSession):
+        return analysis_service.count_user_analyses(
+            user_id=str(current_user.id),
+            db=session,
+            question_type_filter=question_type
+        )
+    
+    if db.bind.dialect.name == "sqlite":
+        # The SQLite engine shares one connection (StaticPool), which cannot overlap queries
+        analyses = await fetch_page()
+        total = await count(db)
+    else:
+        # The count runs on its own session so both queries can be in flight at
+        # once, at the cost of a second pooled connection per request
+        async with AsyncSessionLocal() as count_db:
+            analyses, total = await asyncio.gather(fetch_page(), count(count_db))
     
     return {
-        "analyses": [analysis.to_dict() for analysis in analyses],
+        "analyses": analyses,
         "pagination": {
             "limit": limit,
             "offset": offset,
-            "total": len(analyses)
+            "total": total,
+            "next_cursor": next_cursor(analyses, limit)
         }
     }
 
@@ -134,7 +395,7 @@ async def rate_analysis(
     analysis_id: str,
     request: AnalysisRatingRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Rate an analysis result and provide feedback
@@ -152,6 +413,7 @@ async def rate_analysis(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Analysis not found or could not be rated"
         )
+    await cache_delete(stats_cache_key(current_user.id))
     
     return {
         "message": "Analysis rated successfully",
@@ -163,15 +425,19 @@ async def rate_analysis(
 @router.get("/stats/summary")
 async def get_analysis_stats(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get analysis statistics for the current user
     """
-    stats = analysis_service.get_analysis_stats(
-        user_id=str(current_user.id),
-        db=db
-    )
+    cache_key = stats_cache_key(current_user.id)
+    stats = await cache_get(cache_key)
+    if stats is None:
+        stats = await analysis_service.get_analysis_stats(
+            user_id=str(current_user.id),
+            db=db
+        )
+        await cache_set(cache_key, stats, STATS_CACHE_TTL_SECONDS)
     
     return {
         "user_id": str(current_user.id),
@@ -180,22 +446,8 @@ async def get_analysis_stats(
 
 
 @router.get("/types/available")
-async def get_question_types():
+async def get_question_types(request: Request):
     """
     Get available question types for filtering
     """
-    return {
-        "question_types": [
-            {"value": "選擇題", "label": "選擇題"},
-            {"value": "問答題", "label": "問答題"},
-            {"value": "申論題", "label": "申論題"},
-            {"value": "案例分析", "label": "案例分析"},
-            {"value": "未分類", "label": "未分類"}
-        ],
-        "difficulty_levels": [
-            {"value": "初級", "label": "初級"},
-            {"value": "中級", "label": "中級"},
-            {"value": "高級", "label": "高級"},
-            {"value": "專業", "label": "專業"}
-        ]
-    }
\ No newline at end of file
+    return _QUESTION_TYPES.response(request)
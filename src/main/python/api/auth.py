@@ -2,14 +2,18 @@
 Authentication API endpoints for user registration, login, and profile management
 """
 import logging
+from datetime import datetime
 from typing import Any, Dict, Optional, Union
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import HTTPAuthorizationCredentials
-from pydantic import BaseModel, EmailStr, validator
-from sqlalchemy.orm import Session
+from pydantic import BaseModel, ConfigDict, EmailStr, field_validator, validator
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from ..core.config import settings
 from ..core.database import get_db
+from ..core.rate_limit import enforce_rate_limit
 from ..models.user import User
 from ..services.auth_service import auth_service, security
 
@@ -48,6 +52,8 @@ class Token(BaseModel):
 
 class UserProfile(BaseModel):
     """User profile response model"""
+    model_config = ConfigDict(from_attributes=True)
+    
     id: str
     email: str
     full_name: str = None
@@ -56,21 +62,15 @@ class UserProfile(BaseModel):
     created_at: str
     last_login_at: Union[str, None] = None
     
+    @field_validator("id", mode="before")
     @classmethod
-    def from_orm(cls, user: User) -> "UserProfile":
-        """Create UserProfile from User model"""
-        return cls(
-            id=str(user.id),
-            email=user.email,
-            full_name=user.full_name,
-            subscription_type=user.subscription_type,
-            is_active=user.is_active,
-            created_at=user.created_at.isoformat(),
-            last_login_at=user.last_login_at.isoformat() if user.last_login_at else None
-        )
+    def serialize_id(cls, v):
+        return str(v)
     
-    class Config:
-        from_attributes = True
+    @field_validator("created_at", "last_login_at", mode="before")
+    @classmethod
+    def serialize_datetime(cls, v):
+        return v.isoformat() if isinstance(v, datetime) else v
 
 
 class UserProfileUpdate(BaseModel):
@@ -79,12 +79,12 @@ class UserProfileUpdate(BaseModel):
 
 
 # Authentication dependencies
-def get_current_user(
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> User:
     """Dependency to get current authenticated user"""
-    return auth_service.get_current_user(db, credentials)
+    return await auth_service.get_current_user(db, credentials)
 
 
 def get_current_admin_user(current_user: User = Depends(get_current_user)) -> User:
@@ -92,11 +92,17 @@ def get_current_admin_user(current_user: User = Depends(get_current_user)) -> Us
     return auth_service.require_admin(current_user)
 
 
+async def login_rate_limit(request: Request) -> None:
+    """Dependency to throttle login attempts per client IP"""
+    client_ip = request.client.host if request.client else "unknown"
+    await enforce_rate_limit(f"login:{client_ip}", settings.login_rate_limit)
+
+
 # API Endpoints
 @router.post("/register", response_model=UserProfile, status_code=status.HTTP_201_CREATED)
 async def register_user(
     user_data: UserRegister,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> UserProfile:
     """
     Register a new user account
@@ -112,38 +118,30 @@ async def register_user(
         HTTPException: If registration fails
     """
     try:
-        user = auth_service.create_user(
+        user = await auth_service.create_user(
             db=db,
             email=user_data.email,
             password=user_data.password,
             full_name=user_data.full_name
         )
         
-        logger.info(f"User registered successfully: {user.email}")
-        return UserProfile(
-            id=str(user.id),
-            email=user.email,
-            full_name=user.full_name,
-            subscription_type=user.subscription_type,
-            is_active=user.is_active,
-            created_at=user.created_at.isoformat(),
-            last_login_at=user.last_login_at.isoformat() if user.last_login_at else None
-        )
+        logger.info("User registered successfully: %s", user.email)
+        return UserProfile.model_validate(user)
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Registration error: {e}")
+        logger.error("Registration error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Registration failed"
         )
 
 
-@router.post("/login", response_model=Token)
+@router.post("/login", response_model=Token, dependencies=[Depends(login_rate_limit)])
 async def login_user(
     user_credentials: UserLogin,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> Token:
     """
     Authenticate user and return access token
@@ -159,7 +157,7 @@ async def login_user(
         HTTPException: If authentication fails
     """
     try:
-        user = auth_service.authenticate_user(
+        user = await auth_service.authenticate_user(
             db=db,
             email=user_credentials.email,
             password=user_credentials.password
@@ -177,7 +175,7 @@ async def login_user(
             data={"sub": str(user.id), "email": user.email}
         )
         
-        logger.info(f"User logged in successfully: {user.email}")
+        logger.info("User logged in successfully: %s", user.email)
         return Token(
             access_token=access_token,
             token_type="bearer",
@@ -187,7 +185,7 @@ async def login_user(
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Login error: {e}")
+        logger.error("Login error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Login failed"
@@ -207,28 +205,22 @@ async def get_user_profile(
     Returns:
         UserProfile: User profile data
     """
-    return UserProfile(
-        id=str(current_user.id),
-        email=current_user.email,
-        full_name=current_user.full_name,
-        subscription_type=current_user.subscription_type,
-        is_active=current_user.is_active,
-        created_at=current_user.created_at.isoformat(),
-        last_login_at=current_user.last_login_at.isoformat() if current_user.last_login_at else None
-    )
+    return UserProfile.model_validate(current_user)
 
 
 @router.put("/profile", response_model=UserProfile)
 async def update_user_profile(
     profile_update: UserProfileUpdate,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> UserProfile:
     """
     Update current user's profile information
     
     Args:
         profile_update: Profile update data
+        credentials: HTTP Authorization credentials
         current_user: Current authenticated user
         db: Database session
         
@@ -239,27 +231,28 @@ async def update_user_profile(
         HTTPException: If update fails
     """
     try:
-        # Update user profile
-        if profile_update.full_name is not None:
-            current_user.full_name = profile_update.full_name
+        changes = profile_update.model_dump(exclude_none=True)
+        if not changes:
+            user = await db.get(User, current_user.id)
+            return UserProfile.model_validate(user)
         
-        db.commit()
-        db.refresh(current_user)
+        # Update the stored row in one round-trip; current_user may be a detached cached copy
+        result = await db.execute(
+            update(User)
+            .where(User.id == current_user.id)
+            .values(**changes)
+            .returning(User)
+        )
+        user = result.scalar_one()
+        await db.commit()
+        await auth_service.invalidate_cached_user(credentials.credentials)
         
-        logger.info(f"User profile updated: {current_user.email}")
-        return UserProfile(
-        id=str(current_user.id),
-        email=current_user.email,
-        full_name=current_user.full_name,
-        subscription_type=current_user.subscription_type,
-        is_active=current_user.is_active,
-        created_at=current_user.created_at.isoformat(),
-        last_login_at=current_user.last_login_at.isoformat() if current_user.last_login_at else None
-    )
+        logger.info("User profile updated: %s", user.email)
+        return UserProfile.model_validate(user)
         
     except Exception as e:
-        logger.error(f"Profile update error: {e}")
-        db.rollback()
+        logger.error("Profile update error: %s", e)
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Profile update failed"
@@ -268,18 +261,21 @@ async def update_user_profile(
 
 @router.post("/logout")
 async def logout_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
     current_user: User = Depends(get_current_user)
 ) -> Dict[str, str]:
     """
     Log out current user (invalidate token on client side)
     
     Args:
+        credentials: HTTP Authorization credentials
         current_user: Current authenticated user
         
     Returns:
         Dict[str, str]: Success message
     """
-    logger.info(f"User logged out: {current_user.email}")
+    await auth_service.invalidate_cached_user(credentials.credentials)
+    logger.info("User logged out: %s", current_user.email)
     return {"message": "Successfully logged out"}
 
 
@@ -310,7 +306,7 @@ async def list_users(
     skip: int = 0,
     limit: int = 100,
     current_admin: User = Depends(get_current_admin_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ) -> list[UserProfile]:
     """
     Get list of all users (admin only)
@@ -325,21 +321,12 @@ async def list_users(
         list[UserProfile]: List of user profiles
     """
     try:
-        users = db.query(User).offset(skip).limit(limit).all()
-        return [
-            UserProfile(
-                id=str(user.id),
-                email=user.email,
-                full_name=user.full_name,
-                subscription_type=user.subscription_type,
-                is_active=user.is_active,
-                created_at=user.created_at.isoformat(),
-                last_login_at=user.last_login_at.isoformat() if user.last_login_at else None
-            )
-            for user in users
-        ]
+        # Fetch only the profile columns as plain rows instead of hydrating ORM objects
+        profile_columns = [User.__table__.c[name] for name in UserProfile.model_fields]
+        result = await db.execute(select(*profile_columns).offset(skip).limit(limit))
+        return [UserProfile.model_validate(dict(row)) for row in result.mappings()]
     except Exception as e:
-        logger.error(f"Error listing users: {e}")
+        logger.error("Error listing users: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Error retrieving users"
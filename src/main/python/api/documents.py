@@ -1,94 +1,253 @@
 """
 Document upload and management API endpoints
 """
+import asyncio
 import logging
+import uuid
+from datetime import datetime
 from typing import List, Optional
-from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Query, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.datastructures import UploadFile
 
-from ..core.database import get_db
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal, cache_delete, cache_get, cache_set, get_db
+from ..core.pagination import PaginationInfo, decode_cursor, next_cursor
+from ..core.responses import not_modified, record_etag
 from .auth import get_current_user
-from ..services.document_service import document_service
+from ..services.document_service import document_service, stats_cache_key
+from ..tasks.document_tasks import process_document_task
 from ..models.user import User
 from ..models.document import Document
+from ..utils.file_storage import FileTooLargeError
+from ..utils.multipart_stream import MultipartFileStream
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/documents", tags=["documents"])
 
+# Per-user statistics are cached briefly and dropped whenever the user's documents change
+STATS_CACHE_TTL_SECONDS = 60
 
-@router.post("/upload", status_code=status.HTTP_201_CREATED)
+
+class DocumentPublic(BaseModel):
+    """Document response model, read straight from ORM objects or list rows"""
+    model_config = ConfigDict(from_attributes=True)
+    
+    id: uuid.UUID
+    user_id: uuid.UUID
+    filename: str
+    file_type: str
+    file_size: int
+    processing_status: str
+    ocr_confidence: Optional[float] = None
+    processing_started_at: Optional[datetime] = None
+    processing_completed_at: Optional[datetime] = None
+    error_message: Optional[str] = None
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+    
+    @field_validator("ocr_confidence", mode="before")
+    @classmethod
+    def permille_to_ratio(cls, v):
+        # Stored as an integer x 1000; exposed as a 0-1 ratio
+        return v / 1000 if isinstance(v, int) else v
+
+
+class DocumentDetailResponse(BaseModel):
+    """Single document response model"""
+    document: DocumentPublic
+
+
+class DocumentListResponse(BaseModel):
+    """Document listing response model"""
+    documents: List[DocumentPublic]
+    pagination: PaginationInfo
+
+
+class BatchProcessRequest(BaseModel):
+    """Request model for processing several documents at once"""
+    document_ids: List[uuid.UUID] = Field(..., min_length=1, max_length=50, description="Documents to process")
+
+
+@router.post(
+    "/upload",
+    status_code=status.HTTP_201_CREATED,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["file"],
+                        "properties": {"file": {"type": "string", "format": "binary"}}
+                    }
+                }
+            }
+        }
+    }
+)
 async def upload_document(
-    file: UploadFile = File(...),
+    request: Request,
+    response: Response,
     process_immediately: bool = Query(True, description="Process document immediately after upload"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Upload a document for analysis
     
     - **file**: PDF or image file to upload
     - **process_immediately**: Whether to start OCR processing immediately
+    
+    With UPLOAD_STREAMING_ENABLED the multipart body is parsed as it arrives and the
+    file is written straight to storage; otherwise the framework's UploadFile is used.
+    With OCR_TASK_QUEUE_ENABLED, processing runs on a Celery worker: the upload is
+    answered with 202 right away and the document can be polled for its status.
     """
+    queue_processing = process_immediately and settings.ocr_task_queue_enabled
+    process_inline = process_immediately and not queue_processing
     try:
-        # Validate file
-        if not file.filename:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="No file provided"
-            )
-        
-        # Check file size
-        contents = await file.read()
-        file_size = len(contents)
-        
-        if not document_service.file_storage.check_file_size(file_size):
-            raise HTTPException(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail=f"File size exceeds limit: {file_size} bytes"
-            )
-        
-        # Reset file pointer
-        await file.seek(0)
+        if settings.upload_streaming_enabled:
+            result = await _upload_streamed(request, current_user, db, process_inline)
+        else:
+            result = await _upload_buffered(request, current_user, db, process_inline)
+        await cache_delete(stats_cache_key(current_user.id))
         
-        # Upload and process document
-        result = await document_service.upload_document(
-            file=file.file,
-            filename=file.filename,
-            user_id=str(current_user.id),
-            db=db,
-            process_immediately=process_immediately
-        )
+        # Nothing to queue when the OCR results of an identical upload were reused
+        if queue_processing and "duplicate_of" not in result:
+            return await _enqueue_processing(result, request, response, current_user, db)
         
         return {
             "message": "Document uploaded successfully",
             "document": result
         }
         
+    except HTTPException:
+        raise
+    except FileTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
     except ValueError as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e)
         )
     except Exception as e:
-        logger.error(f"Document upload error: {e}")
+        logger.error("Document upload error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to upload document"
         )
 
 
-@router.get("/{document_id}")
+async def _enqueue_processing(
+    result: dict,
+    request: Request,
+    response: Response,
+    current_user: User,
+    db: AsyncSession
+) -> dict:
+    """
+    Hand a freshly uploaded document's OCR to a Celery worker
+    
+    If the broker is unreachable the document is processed inline instead.
+    """
+    document_id = result["document_id"]
+    try:
+        # Publishing talks to the broker synchronously, keep it off the event loop
+        await asyncio.to_thread(process_document_task.delay, document_id, str(current_user.id))
+    except Exception as e:
+        logger.error("Failed to queue processing of document %s, running inline: %s", document_id, e)
+        try:
+            result.update(await document_service.process_document(uuid.UUID(document_id), db))
+        finally:
+            await cache_delete(stats_cache_key(current_user.id))
+        return {
+            "message": "Document uploaded successfully",
+            "document": result
+        }
+    
+    response.status_code = status.HTTP_202_ACCEPTED
+    return {
+        "message": "Document uploaded, processing queued",
+        "document": result,
+        "status_url": str(request.url_for("get_document", document_id=document_id))
+    }
+
+
+async def _upload_streamed(
+    request: Request,
+    current_user: User,
+    db: AsyncSession,
+    process_immediately: bool
+) -> dict:
+    """Parse the multipart body incrementally and stream the file into storage"""
+    upload = MultipartFileStream(request.headers.get("content-type", ""), request.stream())
+    filename = await upload.open()
+    if not filename:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="No file provided"
+        )
+    
+    return await document_service.upload_document_stream(
+        chunks=upload.chunks(),
+        filename=filename,
+        user_id=str(current_user.id),
+        db=db,
+        process_immediately=process_immediately
+    )
+
+
+async def _upload_buffered(
+    request: Request,
+    current_user: User,
+    db: AsyncSession,
+    process_immediately: bool
+) -> dict:
+    """Parse the body with the framework's form parser and save the spooled UploadFile"""
+    form = await request.form()
+    try:
+        file = form.get("file")
+        if not isinstance(file, UploadFile) or not file.filename:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No file provided"
+            )
+        
+        # The form parser has already spooled the whole file, so its size is known
+        if file.size is not None and not document_service.file_storage.check_file_size(file.size):
+            raise FileTooLargeError(
+                f"File size exceeds limit: {document_service.file_storage.max_file_size} bytes"
+            )
+        
+        return await document_service.upload_document(
+            file=file.file,
+            filename=file.filename,
+            user_id=str(current_user.id),
+            db=db,
+            process_immediately=process_immediately
+        )
+    finally:
+        await form.close()
+
+
+@router.get("/{document_id}", response_model=DocumentDetailResponse)
 async def get_document(
     document_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get document details by ID
     """
-    document = document_service.get_document(
+    document = await document_service.get_document(
         document_id=document_id,
         db=db,
         user_id=str(current_user.id)
@@ -101,20 +260,22 @@ async def get_document(
         )
     
     return {
-        "document": document.to_dict()
+        "document": document
     }
 
 
 @router.get("/{document_id}/content")
 async def get_document_content(
     document_id: str,
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get extracted text content from document
     """
-    document = document_service.get_document(
+    document = await document_service.get_document(
         document_id=document_id,
         db=db,
         user_id=str(current_user.id)
@@ -132,25 +293,38 @@ async def get_document_content(
             detail=f"Document processing not completed. Status: {document.processing_status}"
         )
     
+    # The extracted text only changes when the document row does
+    etag = record_etag(document.id, document.updated_at)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    response.headers["ETag"] = etag
+    
     return {
         "document_id": str(document.id),
-        "extracted_text": document.extracted_text,
-        "page_count": document.page_count,
-        "processing_metadata": document.ocr_metadata
+        "ocr_text": document.ocr_text,
+        "ocr_confidence": document.ocr_confidence_score,
+        "processing_started_at": document.processing_started_at,
+        "processing_completed_at": document.processing_completed_at
     }
 
 
 @router.post("/{document_id}/process")
 async def process_document(
     document_id: str,
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Process document for text extraction (if not already processed)
+    
+    With OCR_TASK_QUEUE_ENABLED the OCR runs on a Celery worker: the response is
+    202 with a status_url to poll, as for uploads.
     """
     # Check if document exists and belongs to user
-    document = document_service.get_document(
+    document = await document_service.get_document(
         document_id=document_id,
         db=db,
         user_id=str(current_user.id)
@@ -176,9 +350,18 @@ async def process_document(
             "processing_status": "processing"
         }
     
+    if settings.ocr_task_queue_enabled and not await _queue_processing([document.id], current_user):
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {
+            "message": "Document processing queued",
+            "document_id": str(document.id),
+            "processing_status": document.processing_status,
+            "status_url": str(request.url_for("get_document", document_id=str(document.id)))
+        }
+    
     try:
         # Start processing
-        result = await document_service.process_document(document_id, db)
+        result = await document_service.process_document(document.id, db)
         
         return {
             "message": "Document processing completed",
@@ -186,38 +369,129 @@ async def process_document(
         }
         
     except Exception as e:
-        logger.error(f"Document processing error: {e}")
+        logger.error("Document processing error: %s", e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to process document"
         )
+    finally:
+        # Processing changes the status breakdown whether it succeeds or fails
+        await cache_delete(stats_cache_key(current_user.id))
+
+
+@router.post("/process-batch")
+async def process_documents_batch(
+    request: BatchProcessRequest,
+    response: Response,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Process several documents for text extraction, running their OCR concurrently
+    
+    Documents that are missing, not owned by the user, already processed or
+    still being processed are skipped. With OCR_TASK_QUEUE_ENABLED each
+    document is queued for a Celery worker and the response is 202; poll
+    GET /documents/{document_id} for progress.
+    """
+    document_ids = list(dict.fromkeys(request.document_ids))
+    pending_ids = await document_service.get_unprocessed_document_ids(
+        document_ids, current_user.id, db
+    )
+    pending = set(pending_ids)
+    skipped = [str(document_id) for document_id in document_ids if document_id not in pending]
+    
+    unqueued = pending_ids
+    if settings.ocr_task_queue_enabled:
+        unqueued = await _queue_processing(pending_ids, current_user)
+        if not unqueued:
+            response.status_code = status.HTTP_202_ACCEPTED
+            return {
+                "message": "Document batch processing queued",
+                "queued": [str(document_id) for document_id in pending_ids],
+                "skipped": skipped
+            }
+    
+    try:
+        results = await document_service.process_documents_batch(unqueued, db)
+    finally:
+        await cache_delete(stats_cache_key(current_user.id))
+    
+    queued = pending_ids[:len(pending_ids) - len(unqueued)]
+    return {
+        "message": "Document batch processing completed",
+        "queued": [str(document_id) for document_id in queued],
+        "results": results,
+        "skipped": skipped
+    }
+
+
+async def _queue_processing(document_ids: List[uuid.UUID], current_user: User) -> List[uuid.UUID]:
+    """
+    Hand documents' OCR to Celery workers
+    
+    Returns:
+        The documents that could not be queued because the broker is
+        unreachable; the caller processes those inline instead
+    """
+    for index, document_id in enumerate(document_ids):
+        try:
+            # Publishing talks to the broker synchronously, keep it off the event loop
+            await asyncio.to_thread(process_document_task.delay, str(document_id), str(current_user.id))
+        except Exception as e:
+            logger.error("Failed to queue processing of document %s, running inline: %s", document_id, e)
+            return document_ids[index:]
+    return []
 
 
-@router.get("/")
+@router.get("/", response_model=DocumentListResponse)
 async def list_documents(
     limit: int = Query(20, ge=1, le=100, description="Number of documents to return"),
-    offset: int = Query(0, ge=0, description="Number of documents to skip"),
+    offset: int = Query(0, ge=0, description="Number of documents to skip (ignored when cursor is set)"),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page, for keyset pagination"),
     status: Optional[str] = Query(None, description="Filter by processing status"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     List user's documents with pagination and filtering
     """
-    documents = document_service.get_user_documents(
-        user_id=str(current_user.id),
-        db=db,
-        limit=limit,
-        offset=offset,
-        status_filter=status
-    )
+    page_cursor = decode_cursor(cursor)
+    
+    def fetch_page():
+        return document_service.get_user_documents(
+            user_id=str(current_user.id),
+            db=db,
+            limit=limit,
+            offset=offset,
+            status_filter=status,
+            cursor=page_cursor
+        )
+    
+    def count(session: AsyncSession):
+        return document_service.count_user_documents(
+            user_id=str(current_user.id),
+            db=session,
+            status_filter=status
+        )
+    
+    if db.bind.dialect.name == "sqlite":
+        # The SQLite engine shares one connection (StaticPool), which cannot overlap queries
+        documents = await fetch_page()
+        total = await count(db)
+    else:
+        # The count runs on its own session so both queries can be in flight at
+        # once, at the cost of a second pooled connection per request
+        async with AsyncSessionLocal() as count_db:
+            documents, total = await asyncio.gather(fetch_page(), count(count_db))
     
     return {
-        "documents": [doc.to_dict() for doc in documents],
+        "documents": documents,
         "pagination": {
             "limit": limit,
             "offset": offset,
-            "total": len(documents)
+            "total": total,
+            "next_cursor": next_cursor(documents, limit)
         }
     }
 
@@ -226,12 +500,12 @@ async def list_documents(
 async def delete_document(
     document_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Delete a document and its associated file
     """
-    success = document_service.delete_document(
+    success = await document_service.delete_document(
         document_id=document_id,
         db=db,
         user_id=str(current_user.id)
@@ -242,6 +516,7 @@ async def delete_document(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Document not found or could not be deleted"
         )
+    await cache_delete(stats_cache_key(current_user.id))
     
     return {
         "message": "Document deleted successfully",
@@ -252,17 +527,22 @@ async def delete_document(
 @router.get("/stats/summary")
 async def get_document_stats(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Get document statistics for the current user
     """
-    stats = document_service.get_document_stats(
-        user_id=str(current_user.id),
-        db=db
-    )
+    cache_key = stats_cache_key(current_user.id)
+    stats = await cache_get(cache_key)
+    if stats is None:
+        stats = await document_service.get_document_stats(
+            user_id=str(current_user.id),
+            db=db
+        )
+        await cache_set(cache_key, stats, STATS_CACHE_TTL_SECONDS)
     
     return {
         "user_id": str(current_user.id),
         "statistics": stats
-    }
\ No newline at end of file
+    }
+
@@ -0,0 +1,37 @@
+"""
+Celery application for background processing in Legal Statute Analysis System
+"""
+from celery import Celery
+
+from .config import settings
+
+celery_app = Celery(
+    "legal_statute_analysis",
+    broker=settings.celery_broker_url or settings.redis_url,
+    include=["src.main.python.tasks.analysis_tasks", "src.main.python.tasks.document_tasks"]
+)
+
+celery_app.conf.update(
+    task_serializer="json",
+    accept_content=["json"],
+    # Results are written to the database, so the result backend is not needed
+    task_ignore_result=True,
+    # Long-running LLM and OCR calls: only take one job at a time and ack once finished
+    task_acks_late=True,
+    worker_prefetch_multiplier=1,
+    # OCR gets its own queue: PaddleOCR's memory keeps growing in long-lived
+    # processes, so those workers are recycled (--max-tasks-per-child), while
+    # analysis workers stay up and keep their in-memory semantic cache
+    task_routes={"documents.*": {"queue": settings.celery_ocr_queue}},
+    # Periodic OpenAI Batch API submission and polling (run `celery beat` to enable)
+    beat_schedule={
+        "submit-analysis-batches": {
+            "task": "analysis.submit_batches",
+            "schedule": settings.llm_batch_submit_interval_seconds
+        },
+        "collect-analysis-batches": {
+            "task": "analysis.collect_batches",
+            "schedule": settings.llm_batch_poll_interval_seconds
+        }
+    }
+)
@@ -26,28 +26,78 @@ class Settings(BaseSettings):
     # Security
     secret_key: str
     access_token_expire_minutes: int = 1440  # 24 hours
+    password_cache_ttl_seconds: int = 60  # Reuse successful password checks briefly; 0 disables
+    password_hash_scheme: str = "argon2"  # Scheme for new hashes: argon2 or bcrypt (other hashes upgrade on login)
+    argon2_time_cost: int = 2
+    argon2_memory_cost_kib: int = 65536  # 64 MiB per hash
+    bcrypt_rounds: int = 12
+    auth_user_cache_ttl_seconds: int = 30  # Per-process token -> user cache in front of Redis
+    auth_user_redis_cache_ttl_seconds: int = 60  # Shared token -> user cache; bounds how long stale roles/status linger
     algorithm: str = "HS256"
     
     # Database
     database_url: str
     database_echo: bool = False
+    db_pool_size: Optional[int] = None  # Defaults to workers * 4
+    db_max_overflow: Optional[int] = None  # Defaults to workers * 8
+    db_pool_timeout: int = 5  # Seconds to wait for a pooled connection
+    db_pool_recycle: int = 1800  # Seconds before a connection is recycled
+    db_statement_timeout_ms: int = 5000  # Per-statement limit on PostgreSQL; 0 disables it
     
     # Redis
     redis_url: str = "redis://localhost:6379/0"
     
+    # Background tasks (Celery)
+    celery_broker_url: Optional[str] = None  # Defaults to redis_url
+    analysis_task_queue_enabled: bool = True  # Run question analysis on Celery workers
+    analysis_processing_timeout_seconds: int = 900  # A redelivered analysis still "processing" after this long is rerun
+    ocr_task_queue_enabled: bool = True  # Run upload-time OCR on Celery workers
+    celery_ocr_queue: str = "ocr"  # Document OCR tasks; served by separate, periodically recycled workers
+    
+    # OpenAI Batch API for non-interactive analyses (about half price, done within 24h)
+    llm_batch_dir: str = "data/llm_batches"  # Must be shared by the API and Celery workers
+    llm_batch_submit_interval_seconds: int = 600
+    llm_batch_poll_interval_seconds: int = 300
+    
+    # Rate limiting (requests per minute)
+    login_rate_limit: int = 10  # Per client IP
+    analysis_rate_limit: int = 30  # Per user
+    
     # OpenAI
     openai_api_key: str
     openai_model: str = "gpt-4"
     openai_max_tokens: int = 4000
+    llm_max_concurrency: int = 8  # Concurrent LLM calls per process
+    llm_requests_per_second: float = 5.0  # LLM calls started per second per process; 0 disables
+    llm_response_cache_ttl_seconds: int = 604800  # 7 days; Redis cache of responses to identical prompts; 0 disables
+    
+    # Semantic cache for LLM analyses (needs sentence-transformers)
+    semantic_cache_enabled: bool = True
+    semantic_cache_model: str = "paraphrase-multilingual-MiniLM-L12-v2"
+    semantic_cache_threshold: float = 0.92  # Minimum cosine similarity for a hit
+    semantic_cache_ttl_seconds: int = 86400
+    semantic_cache_max_entries: int = 5000  # Per question type hint / context
+    semantic_cache_max_namespaces: int = 32  # Least recently used hint / context pairs are evicted
     
     # File Storage
     upload_dir: str = "data/uploads"
     max_file_size: int = 10 * 1024 * 1024  # 10MB
     allowed_extensions: str = ".pdf"
+    upload_streaming_enabled: bool = False  # Parse multipart uploads incrementally instead of via UploadFile
     
     # OCR
     ocr_engine: str = "paddleocr"
     ocr_language: str = "ch_tra"
+    ocr_max_concurrency: Optional[int] = None  # OCR jobs at once per process; defaults to min(4, CPU count)
+    ocr_render_zoom: float = 2.0  # PDF page render scale for OCR (1.0 = 72 DPI, 2.0 = 144 DPI)
+    ocr_result_cache_ttl_seconds: int = 2592000  # 30 days; Redis cache of OCR results by file content hash; 0 disables
+    ocr_concurrency: Optional[int] = None  # Tesseract calls (e.g. PDF pages) at once per process; defaults to min(4, CPU count)
+    ocr_enable_mkldnn: bool = True  # PaddleOCR: run CPU inference through oneDNN (MKL-DNN) kernels
+    ocr_cpu_threads: Optional[int] = None  # PaddleOCR inference threads per process; defaults to CPU count
+    # PaddleOCR inference model directories, e.g. INT8-quantized exports; unset uses the bundled FP32 models
+    ocr_det_model_dir: Optional[str] = None
+    ocr_rec_model_dir: Optional[str] = None
+    ocr_engine_idle_timeout_seconds: int = 300  # Unload an idle PaddleOCR engine to return its memory; 0 keeps it loaded
     
     # Logging
     log_level: str = "INFO"
@@ -72,11 +122,13 @@ class Settings(BaseSettings):
             raise ValueError("OPENAI_API_KEY must be set")
         return v
     
-    @validator("upload_dir")
-    def validate_upload_dir(cls, v):
-        # Ensure upload directory exists
-        os.makedirs(v, exist_ok=True)
-        return v
+    def ensure_runtime_dirs(self):
+        """Create the upload, batch and log directories (called once at startup, not on construction)"""
+        os.makedirs(self.upload_dir, exist_ok=True)
+        os.makedirs(self.llm_batch_dir, exist_ok=True)
+        log_dir = os.path.dirname(self.log_file)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
     
     class Config:
         env_file = ".env"
@@ -1,10 +1,21 @@
 """
 Database configuration and session management
 """
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+import os
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Optional
+
+import orjson
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+from sqlalchemy import JSON, DateTime, Text, TypeDecorator
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.pool import StaticPool
+from sqlalchemy.sql.functions import FunctionElement
 import logging
 
 from .config import settings
@@ -12,7 +23,102 @@ from .config import settings
 logger = logging.getLogger(__name__)
 
 # SQLAlchemy Base
-Base = declarative_base()
+class Base(DeclarativeBase):
+    pass
+
+
+class JSONBType(TypeDecorator):
+    """JSON column type: binary, indexable JSONB on PostgreSQL; plain JSON elsewhere (SQLite development)"""
+    impl = JSON
+    cache_ok = True
+    
+    def load_dialect_impl(self, dialect):
+        return dialect.type_descriptor(JSONB() if dialect.name == "postgresql" else JSON())
+
+
+class TSVectorType(TypeDecorator):
+    """Full-text search vector: TSVECTOR on PostgreSQL; plain text elsewhere"""
+    impl = Text
+    cache_ok = True
+    
+    def load_dialect_impl(self, dialect):
+        return dialect.type_descriptor(TSVECTOR() if dialect.name == "postgresql" else Text())
+
+
+class EmbeddingType(TypeDecorator):
+    """Embedding vector: pgvector VECTOR(n) on PostgreSQL; a JSON float array elsewhere"""
+    impl = JSON
+    cache_ok = True
+    
+    def __init__(self, dimensions: int):
+        super().__init__()
+        self.dimensions = dimensions
+    
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            from pgvector.sqlalchemy import Vector
+            
+            return dialect.type_descriptor(Vector(self.dimensions))
+        return dialect.type_descriptor(JSON())
+    
+    def process_bind_param(self, value, dialect):
+        # pgvector accepts numpy arrays as they are; JSON needs a plain list
+        if value is not None and dialect.name != "postgresql" and hasattr(value, "tolist"):
+            return value.tolist()
+        return value
+
+
+class simple_tsvector(FunctionElement):
+    """Generated-column expression indexing a text column with the 'simple' FTS config"""
+    type = TSVectorType()
+    inherit_cache = True
+
+
+@compiles(simple_tsvector)
+def _compile_simple_tsvector(element, compiler, **kw):
+    return "to_tsvector('simple', coalesce(%s, ''))" % compiler.process(element.clauses, **kw)
+
+
+@compiles(simple_tsvector, "sqlite")
+def _compile_simple_tsvector_sqlite(element, compiler, **kw):
+    # No full-text search on SQLite; keep the column so the schema matches
+    return "coalesce(%s, '')" % compiler.process(element.clauses, **kw)
+
+
+class utcnow(FunctionElement):
+    """Current timestamp evaluated by the database server, for column defaults"""
+    type = DateTime(timezone=True)
+    inherit_cache = True
+
+
+@compiles(utcnow)
+def _compile_utcnow(element, compiler, **kw):
+    return "now()"
+
+
+@compiles(utcnow, "sqlite")
+def _compile_utcnow_sqlite(element, compiler, **kw):
+    # CURRENT_TIMESTAMP on SQLite only has second precision. Datetimes are stored
+    # as text there, so match SQLAlchemy's own "YYYY-MM-DD HH:MM:SS.ffffff" format
+    # exactly, or comparisons against bound datetimes (keyset cursors) go wrong.
+    return "(strftime('%Y-%m-%d %H:%M:%S', 'now') || substr(strftime('%f', 'now'), 3) || '000')"
+
+
+# Async drivers used for each database backend
+_ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+def _get_async_database_url() -> str:
+    """Get the database URL rewritten to use an async driver"""
+    url = make_url(settings.database_url)
+    backend = url.get_backend_name()
+    if backend in _ASYNC_DRIVERS and url.drivername != _ASYNC_DRIVERS[backend]:
+        url = url.set(drivername=_ASYNC_DRIVERS[backend])
+    return url.render_as_string(hide_password=False)
+
 
 # Database Engine
 def _get_engine_args():
@@ -25,60 +131,161 @@ def _get_engine_args():
         }
     elif "postgresql" in settings.database_url:
         # PostgreSQL specific configuration
+        # The engine is a module-level singleton, so this pool is shared by
+        # every request in the worker process; never create engines per request.
         return {
-            "pool_size": 10,
-            "max_overflow": 20,
+            "pool_size": settings.db_pool_size or settings.workers * 4,
+            "max_overflow": settings.db_max_overflow or settings.workers * 8,
             "pool_pre_ping": True,
-            "pool_recycle": 300
+            "pool_recycle": settings.db_pool_recycle,
+            "pool_timeout": settings.db_pool_timeout,
+            # LIFO keeps the most recently used connections warm
+            "pool_use_lifo": True,
+            # Session settings sent with the asyncpg startup packet, so they cost no
+            # extra round trip. The queries here are short OLTP lookups: JIT compile
+            # time would dwarf their runtime, and commits need not wait for standbys.
+            "connect_args": {
+                "server_settings": {
+                    "jit": "off",
+                    "synchronous_commit": "local",
+                    "statement_timeout": str(settings.db_statement_timeout_ms)
+                }
+            }
         }
     else:
         # Default configuration
         return {}
 
-engine = create_engine(
-    settings.database_url,
+
+def _json_serializer(value) -> str:
+    """Serialize JSON columns with orjson (the driver expects str, not bytes)"""
+    return orjson.dumps(value).decode()
+
+engine = create_async_engine(
+    _get_async_database_url(),
     echo=settings.database_echo,
+    json_serializer=_json_serializer,
+    json_deserializer=orjson.loads,
     **_get_engine_args()
 )
 
 # Session Factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(
+    bind=engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+# Redis client shared by the process (connections are pooled internally)
+redis_client = Redis.from_url(settings.redis_url)
 
 
-def get_db() -> Session:
+async def get_db() -> AsyncIterator[AsyncSession]:
     """
     Database session dependency for FastAPI
     """
-    db = SessionLocal()
-    try:
-        yield db
-    except Exception as e:
-        logger.error(f"Database session error: {e}")
-        db.rollback()
-        raise
-    finally:
-        db.close()
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+        except Exception as e:
+            logger.error("Database session error: %s", e)
+            await db.rollback()
+            raise
 
 
-def create_tables():
+async def create_tables():
     """
     Create all database tables
     """
     try:
-        Base.metadata.create_all(bind=engine)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
         logger.info("Database tables created successfully")
     except Exception as e:
-        logger.error(f"Error creating database tables: {e}")
+        logger.error("Error creating database tables: %s", e)
         raise
 
 
-def drop_tables():
+async def drop_tables():
     """
     Drop all database tables (use with caution!)
     """
     try:
-        Base.metadata.drop_all(bind=engine)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
         logger.info("Database tables dropped successfully")
     except Exception as e:
-        logger.error(f"Error dropping database tables: {e}")
-        raise
\ No newline at end of file
+        logger.error("Error dropping database tables: %s", e)
+        raise
+
+
+async def cache_get(key: str) -> Optional[Any]:
+    """
+    Get a JSON value from the Redis cache
+
+    Returns:
+        Decoded value, or None on cache miss or when Redis is unavailable
+    """
+    try:
+        cached = await redis_client.get(key)
+    except RedisError as e:
+        logger.warning("Redis cache read failed for %s: %s", key, e)
+        return None
+    return orjson.loads(cached) if cached is not None else None
+
+
+async def cache_set(key: str, value: Any, ttl_seconds: int) -> None:
+    """
+    Store a JSON-serializable value in the Redis cache with a TTL
+    """
+    try:
+        await redis_client.setex(key, ttl_seconds, orjson.dumps(value))
+    except RedisError as e:
+        logger.warning("Redis cache write failed for %s: %s", key, e)
+
+
+async def cache_delete(*keys: str) -> None:
+    """
+    Remove keys from the Redis cache
+    """
+    try:
+        await redis_client.delete(*keys)
+    except RedisError as e:
+        logger.warning("Redis cache delete failed for %s: %s", keys, e)
+
+
+# Deletes the lock only if it still holds this caller's token, so a holder whose
+# TTL ran out cannot release a lock that has since been taken by someone else
+_RELEASE_LOCK_SCRIPT = (
+    "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+)
+
+
+@asynccontextmanager
+async def redis_lock(key: str, ttl_seconds: int) -> AsyncIterator[bool]:
+    """
+    Hold a Redis lock (SET NX EX) for the duration of the block
+
+    The TTL bounds how long a crashed holder can keep others out. Unlike the
+    cache helpers this fails closed: when Redis is unavailable the lock is
+    reported as not acquired.
+
+    Yields:
+        True if this caller holds the lock, False otherwise
+    """
+    token = os.urandom(16).hex()
+    try:
+        acquired = bool(await redis_client.set(key, token, nx=True, ex=ttl_seconds))
+    except RedisError as e:
+        logger.warning("Redis lock %s unavailable: %s", key, e)
+        acquired = False
+    
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                await redis_client.eval(_RELEASE_LOCK_SCRIPT, 1, key, token)
+            except RedisError as e:
+                logger.warning("Redis lock release failed for %s: %s", key, e)
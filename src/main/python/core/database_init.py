@@ -2,17 +2,35 @@
 Database initialization and management utilities
 """
 import logging
-from sqlalchemy import inspect, text
+import re
+import time
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, func, inspect, select, text
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import configure_mappers
+from sqlalchemy.schema import CreateIndex
 
-from .database import engine, Base, SessionLocal
+from .database import engine, Base, AsyncSessionLocal
 from .config import settings
 from ..models import User, Document, LegalArticle, QuestionAnalysis
 
 logger = logging.getLogger(__name__)
 
+# Table names reflected from the database, cached per process: (fetched_at, names)
+TABLE_CACHE_TTL_SECONDS = 60
+_table_cache: Optional[Tuple[float, List[str]]] = None
+
+# Advisory lock name serializing schema creation across workers (PostgreSQL only)
+SCHEMA_INIT_LOCK = "schema_init"
+
+# Advisory lock name ensuring only one worker builds missing indexes (PostgreSQL only)
+INDEX_BUILD_LOCK = "index_build"
 
-def check_database_connection() -> bool:
+_CREATE_INDEX = re.compile(r"^CREATE (UNIQUE )?INDEX")
+
+
+async def check_database_connection() -> bool:
     """
     Check if database connection is working
     
@@ -20,127 +38,238 @@ def check_database_connection() -> bool:
         bool: True if connection is successful, False otherwise
     """
     try:
-        with engine.connect() as connection:
-            # Simple query to test connection
-            result = connection.execute(text("SELECT 1"))
-            return result.fetchone() is not None
-    except SQLAlchemyError as e:
-        logger.error(f"Database connection failed: {e}")
+        # Checking out a connection is the test: the pool pre-pings it (or
+        # opens a new one), so an extra SELECT 1 would only add a round-trip
+        async with engine.connect():
+            return True
+    except (SQLAlchemyError, OSError) as e:
+        # asyncpg raises OSError directly when the server is unreachable
+        logger.error("Database connection failed: %s", e)
         return False
 
 
-def get_existing_tables() -> list:
+async def get_existing_tables(use_cache: bool = True) -> list:
     """
     Get list of existing tables in the database
     
+    Args:
+        use_cache: Reuse names reflected within the last TABLE_CACHE_TTL_SECONDS
+    
     Returns:
         list: List of table names
     """
+    global _table_cache
+    
+    if use_cache and _table_cache and time.monotonic() - _table_cache[0] < TABLE_CACHE_TTL_SECONDS:
+        return list(_table_cache[1])
+    
     try:
-        inspector = inspect(engine)
-        return inspector.get_table_names()
+        async with engine.connect() as connection:
+            # The inspector is sync-only, so run it on the connection's greenlet
+            table_names = await connection.run_sync(
+                lambda sync_connection: inspect(sync_connection).get_table_names()
+            )
     except SQLAlchemyError as e:
-        logger.error(f"Failed to get table names: {e}")
+        logger.error("Failed to get table names: %s", e)
         return []
+    
+    _table_cache = (time.monotonic(), table_names)
+    return list(table_names)
+
+
+def invalidate_table_cache():
+    """Forget cached table names after DDL changes the schema"""
+    global _table_cache
+    _table_cache = None
 
 
-def create_database_tables():
+async def schema_is_present() -> bool:
+    """
+    Check whether every mapped table exists
+    
+    On PostgreSQL this is a single to_regclass() query instead of a catalog
+    reflection; other databases fall back to get_existing_tables().
+    """
+    table_names = list(Base.metadata.tables)
+    
+    if engine.dialect.name == "postgresql":
+        async with engine.connect() as connection:
+            return bool(await connection.scalar(
+                select(and_(*(func.to_regclass(name).isnot(None) for name in table_names)))
+            ))
+    
+    return set(table_names).issubset(await get_existing_tables())
+
+
+async def create_database_tables():
     """
     Create all database tables if they don't exist
+    
+    On PostgreSQL a transaction-scoped advisory lock serializes concurrent
+    workers, so only the first one to start actually runs the DDL.
     """
     try:
         logger.info("Creating database tables...")
         
-        # Import all models to ensure they're registered with Base
-        from ..models import User, Document, LegalArticle, QuestionAnalysis
-        
-        # Create all tables
-        Base.metadata.create_all(bind=engine)
+        # All DDL runs in one transaction; checkfirst skips tables that already exist
+        async with engine.begin() as connection:
+            if connection.dialect.name == "postgresql":
+                # DDL (and waiting on the lock) may outlast the OLTP statement timeout
+                await connection.execute(text("SET LOCAL statement_timeout = 0"))
+                await connection.execute(
+                    select(func.pg_advisory_xact_lock(func.hashtext(SCHEMA_INIT_LOCK)))
+                )
+            await connection.run_sync(Base.metadata.create_all, checkfirst=True)
         
-        # Verify tables were created
-        existing_tables = get_existing_tables()
-        expected_tables = ['users', 'documents', 'legal_articles', 'question_analyses']
-        
-        for table in expected_tables:
-            if table in existing_tables:
-                logger.info(f"✓ Table '{table}' created successfully")
-            else:
-                logger.warning(f"✗ Table '{table}' was not created")
-        
-        logger.info("Database tables creation completed")
+        logger.info("Database tables ready: %s", sorted(Base.metadata.tables.keys()))
         
     except SQLAlchemyError as e:
-        logger.error(f"Failed to create database tables: {e}")
+        logger.error("Failed to create database tables: %s", e)
         raise
+    finally:
+        invalidate_table_cache()
 
 
-def drop_database_tables():
+async def drop_database_tables():
     """
     Drop all database tables (use with caution!)
     """
     try:
         logger.warning("Dropping all database tables...")
-        Base.metadata.drop_all(bind=engine)
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.drop_all)
         logger.info("All database tables dropped")
     except SQLAlchemyError as e:
-        logger.error(f"Failed to drop database tables: {e}")
+        logger.error("Failed to drop database tables: %s", e)
         raise
+    finally:
+        invalidate_table_cache()
 
 
-def reset_database():
+async def reset_database():
     """
     Reset database by dropping and recreating all tables
     """
     logger.warning("Resetting database...")
-    drop_database_tables()
-    create_database_tables()
+    await drop_database_tables()
+    await create_database_tables()
     logger.info("Database reset completed")
 
 
-def initialize_database():
+async def initialize_database():
     """
     Initialize database with tables and basic data
     """
     logger.info("Initializing database...")
     
-    # Check connection
-    if not check_database_connection():
-        raise ConnectionError("Cannot connect to database")
+    # One query doubles as the connection test and the schema check
+    try:
+        schema_present = await schema_is_present()
+    except (SQLAlchemyError, OSError) as e:
+        logger.error("Database connection failed: %s", e)
+        raise ConnectionError("Cannot connect to database") from e
     
-    logger.info("✓ Database connection successful")
+    if schema_present:
+        logger.info("✓ Database schema already present")
+    else:
+        # Create the missing tables (a no-op for tables that already exist)
+        await create_database_tables()
     
-    # Get existing tables
-    existing_tables = get_existing_tables()
-    logger.info(f"Existing tables: {existing_tables}")
+    logger.info("Database initialization completed successfully")
+
+
+async def build_missing_indexes():
+    """
+    Build model indexes that are missing from existing tables (PostgreSQL only)
     
-    # Create tables if they don't exist
-    expected_tables = ['users', 'documents', 'legal_articles', 'question_analyses']
-    tables_to_create = [table for table in expected_tables if table not in existing_tables]
+    create_all only indexes the tables it creates, so an index added to a model
+    later never reaches a populated database. Missing ones are built with
+    CREATE INDEX CONCURRENTLY, which does not block writes but cannot run in a
+    transaction and can take minutes on a large table, so this runs in
+    autocommit mode and is meant to be started as a background task. Only the
+    worker holding the advisory lock does the work.
     
-    if tables_to_create:
-        logger.info(f"Creating missing tables: {tables_to_create}")
-        create_database_tables()
-    else:
-        logger.info("All required tables already exist")
+    A concurrent build that fails or is cancelled (e.g. by a shutdown) leaves
+    an INVALID index behind under the final name; those are dropped and
+    rebuilt rather than treated as present.
+    """
+    if engine.dialect.name != "postgresql":
+        return
     
-    # Initialize default data if needed
+    lock_id = func.hashtext(INDEX_BUILD_LOCK)
     try:
-        with SessionLocal() as db:
-            # Check if we have any users
-            user_count = db.query(User).count()
-            if user_count == 0:
-                logger.info("No users found, database is ready for first-time setup")
-            else:
-                logger.info(f"Database initialized with {user_count} existing users")
+        async with engine.connect() as connection:
+            connection = await connection.execution_options(isolation_level="AUTOCOMMIT")
+            if not await connection.scalar(select(func.pg_try_advisory_lock(lock_id))):
+                return
+            
+            try:
+                existing = dict((await connection.execute(text(
+                    "SELECT c.relname, i.indisvalid FROM pg_index i "
+                    "JOIN pg_class c ON c.oid = i.indexrelid "
+                    "JOIN pg_namespace n ON n.oid = c.relnamespace "
+                    "WHERE n.nspname = current_schema()"
+                ))).all())
+                await connection.execute(text("SET statement_timeout = 0"))
+                
+                for table in Base.metadata.sorted_tables:
+                    for index in sorted(table.indexes, key=lambda index: index.name):
+                        if existing.get(index.name):
+                            continue
+                        if index.name in existing:
+                            logger.warning("Index %s is INVALID; rebuilding it", index.name)
+                            await _drop_index_concurrently(connection, index)
+                        await _build_index_concurrently(connection, index)
+            finally:
+                await connection.execute(text("RESET statement_timeout"))
+                await connection.execute(select(func.pg_advisory_unlock(lock_id)))
+    except (SQLAlchemyError, OSError) as e:
+        logger.error("Background index build failed: %s", e)
+
+
+async def _build_index_concurrently(connection, index):
+    """Issue CREATE INDEX CONCURRENTLY for one index, logging rather than raising on failure"""
+    ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=connection.dialect))
+    ddl = _CREATE_INDEX.sub(r"\g<0> CONCURRENTLY", ddl, count=1)
     
+    logger.info("Building index %s on %s...", index.name, index.table.name)
+    started = time.monotonic()
+    try:
+        await connection.execute(text(ddl))
     except SQLAlchemyError as e:
-        logger.error(f"Error checking database state: {e}")
-        raise
+        # A failed concurrent build leaves an INVALID index that must be dropped before retrying
+        logger.warning("Failed to build index %s: %s", index.name, e)
+        await _drop_index_concurrently(connection, index)
+        return
+    logger.info("Index %s built in %.1fs", index.name, time.monotonic() - started)
+
+
+async def _drop_index_concurrently(connection, index):
+    """Drop a leftover INVALID index so the next build can reuse its name"""
+    name = connection.dialect.identifier_preparer.quote(index.name)
+    try:
+        await connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    except SQLAlchemyError as e:
+        logger.warning("Failed to drop invalid index %s: %s", index.name, e)
+
+
+async def warm_up_orm():
+    """
+    Configure all mappers and prime the statement compile cache at startup
     
-    logger.info("Database initialization completed successfully")
+    Otherwise the first request touching each model pays for resolving the
+    relationship graph and compiling its SELECT.
+    """
+    configure_mappers()
+    
+    async with AsyncSessionLocal() as db:
+        for model in (User, Document, LegalArticle, QuestionAnalysis):
+            await db.execute(select(model).limit(0))
+    
+    logger.info("ORM mappers configured and compile cache primed")
 
 
-def get_database_info():
+async def get_database_info():
     """
     Get information about the current database state
     
@@ -148,21 +277,24 @@ def get_database_info():
         dict: Database information
     """
     info = {
-        "connection_status": check_database_connection(),
-        "existing_tables": get_existing_tables(),
+        "connection_status": await check_database_connection(),
+        "existing_tables": await get_existing_tables(),
         "database_url": settings.database_url,
         "table_counts": {}
     }
     
     if info["connection_status"]:
         try:
-            with SessionLocal() as db:
-                info["table_counts"]["users"] = db.query(User).count()
-                info["table_counts"]["documents"] = db.query(Document).count()
-                info["table_counts"]["legal_articles"] = db.query(LegalArticle).count()
-                info["table_counts"]["question_analyses"] = db.query(QuestionAnalysis).count()
+            # One round-trip: each count is a scalar subquery in a single SELECT
+            counts = select(*(
+                select(func.count()).select_from(model).scalar_subquery().label(model.__tablename__)
+                for model in (User, Document, LegalArticle, QuestionAnalysis)
+            ))
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(counts)
+                info["table_counts"] = dict(result.mappings().one())
         except SQLAlchemyError as e:
-            logger.error(f"Error getting table counts: {e}")
+            logger.error("Error getting table counts: %s", e)
             info["table_counts"] = {"error": str(e)}
     
     return info
@@ -170,6 +302,7 @@ def get_database_info():
 
 if __name__ == "__main__":
     # This script can be run directly to initialize the database
+    import asyncio
     import sys
     from pathlib import Path
     
@@ -185,15 +318,19 @@ if __name__ == "__main__":
     logger.info("Starting database initialization...")
     
     try:
-        initialize_database()
+        async def _initialize_and_describe():
+            # One event loop for both steps: pooled connections are bound to the loop
+            await initialize_database()
+            return await get_database_info()
+        
+        db_info = asyncio.run(_initialize_and_describe())
         
         # Print database info
-        db_info = get_database_info()
         logger.info("Database Information:")
-        logger.info(f"  Connection: {'✓' if db_info['connection_status'] else '✗'}")
-        logger.info(f"  Tables: {db_info['existing_tables']}")
-        logger.info(f"  Table counts: {db_info['table_counts']}")
+        logger.info("  Connection: %s", '✓' if db_info['connection_status'] else '✗')
+        logger.info("  Tables: %s", db_info['existing_tables'])
+        logger.info("  Table counts: %s", db_info['table_counts'])
         
     except Exception as e:
-        logger.error(f"Database initialization failed: {e}")
+        logger.error("Database initialization failed: %s", e)
         sys.exit(1)
\ No newline at end of file
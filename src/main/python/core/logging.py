@@ -4,15 +4,26 @@ Logging configuration for Legal Statute Analysis System
 import logging
 import logging.handlers
 import os
+import queue
 from pathlib import Path
+from typing import Optional
 
 from .config import settings
 
+# Background thread that drains the log queue into the console and file handlers
+_queue_listener: Optional[logging.handlers.QueueListener] = None
+
 
 def setup_logging():
     """
     Setup application logging configuration
+    
+    Handlers run on a QueueListener thread; the root logger only gets a
+    QueueHandler, so logging from the event loop never waits on disk I/O.
     """
+    global _queue_listener
+    stop_logging()
+    
     # Create logs directory if it doesn't exist
     log_dir = Path(settings.log_file).parent
     log_dir.mkdir(parents=True, exist_ok=True)
@@ -32,7 +43,6 @@ def setup_logging():
         "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     )
     console_handler.setFormatter(console_formatter)
-    root_logger.addHandler(console_handler)
     
     # File handler with rotation
     file_handler = logging.handlers.RotatingFileHandler(
@@ -43,7 +53,14 @@ def setup_logging():
     file_handler.setLevel(getattr(logging, settings.log_level.upper()))
     file_formatter = logging.Formatter(settings.log_format)
     file_handler.setFormatter(file_formatter)
-    root_logger.addHandler(file_handler)
+    
+    # Log calls just enqueue the record; the listener thread does the writing
+    log_queue: queue.Queue = queue.Queue(-1)
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _queue_listener = logging.handlers.QueueListener(
+        log_queue, console_handler, file_handler, respect_handler_level=True
+    )
+    _queue_listener.start()
     
     # Set third-party library log levels
     logging.getLogger("uvicorn").setLevel(logging.INFO)
@@ -53,6 +70,16 @@ def setup_logging():
     logging.info("Logging configuration initialized")
 
 
+def stop_logging():
+    """
+    Flush queued log records and stop the listener thread (call on shutdown)
+    """
+    global _queue_listener
+    if _queue_listener is not None:
+        _queue_listener.stop()
+        _queue_listener = None
+
+
 def get_logger(name: str) -> logging.Logger:
     """
     Get a logger instance with the specified name
@@ -0,0 +1,55 @@
+"""
+Keyset (cursor) pagination helpers for Legal Statute Analysis System
+"""
+import base64
+import uuid
+from datetime import datetime
+from typing import Any, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from pydantic import BaseModel
+
+# Position of the last row on a page: (created_at, id)
+Cursor = Tuple[datetime, uuid.UUID]
+
+
+class PaginationInfo(BaseModel):
+    """Pagination block returned alongside list results"""
+    limit: int
+    offset: int
+    total: int
+    next_cursor: Optional[str] = None
+
+
+def encode_cursor(created_at: datetime, record_id: Any) -> str:
+    """Encode a row position as an opaque URL-safe cursor"""
+    raw = f"{created_at.isoformat()}|{record_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Cursor]:
+    """
+    Decode a cursor produced by encode_cursor
+    
+    Raises:
+        HTTPException: 400 if the cursor is malformed
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, record_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), uuid.UUID(record_id)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor"
+        )
+
+
+def next_cursor(rows: Sequence[Any], limit: int) -> Optional[str]:
+    """Cursor for the page after rows (anything with created_at/id attributes), or None on the last page"""
+    if len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor(last.created_at, last.id)
@@ -0,0 +1,46 @@
+"""
+Redis-backed request rate limiting for Legal Statute Analysis System
+"""
+import logging
+
+from fastapi import HTTPException, status
+from redis.exceptions import RedisError
+
+from .database import redis_client
+
+logger = logging.getLogger(__name__)
+
+
+async def enforce_rate_limit(key: str, limit: int, window_seconds: int = 60) -> None:
+    """
+    Count a request against a fixed-window limit
+    
+    Args:
+        key: Identifier being limited (e.g. "login:<ip>")
+        limit: Maximum number of requests allowed per window
+        window_seconds: Window length in seconds
+        
+    Raises:
+        HTTPException: 429 when the limit has been exceeded
+    """
+    redis_key = f"rl:{key}"
+    try:
+        # INCR and EXPIRE in one MULTI/EXEC: a separate EXPIRE that never ran would
+        # leave a counter without a TTL, locking the key out for good. NX (Redis 7+)
+        # keeps later requests from pushing the window's end back.
+        async with redis_client.pipeline(transaction=True) as pipe:
+            pipe.incr(redis_key)
+            pipe.expire(redis_key, window_seconds, nx=True)
+            count, _ = await pipe.execute()
+    except RedisError as e:
+        # Fail open: an unavailable Redis should not lock users out
+        logger.warning("Rate limit check failed for %s: %s", redis_key, e)
+        return
+    
+    if count > limit:
+        logger.warning("Rate limit exceeded for %s: %s/%s", redis_key, count, limit)
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many requests, please try again later",
+            headers={"Retry-After": str(window_seconds)}
+        )
@@ -0,0 +1,58 @@
+"""
+Response classes for Legal Statute Analysis System
+"""
+import hashlib
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import orjson
+from fastapi import Request, Response, status
+from fastapi.responses import JSONResponse
+
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson (C serializer) instead of stdlib json"""
+    
+    def render(self, content: Any) -> bytes:
+        # Same options as FastAPI's ORJSONResponse: accept non-str dict keys and numpy values
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+
+
+def record_etag(record_id: Any, updated_at: Optional[datetime]) -> str:
+    """Build a weak ETag that changes whenever a record is updated"""
+    version = updated_at.strftime("%Y%m%d%H%M%S%f") if updated_at else "0"
+    return f'W/"{record_id}-{version}"'
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """
+    Check a conditional GET against an ETag
+    
+    Returns:
+        An empty 304 response if the client already has this version, otherwise None
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return None
+    
+    candidates = {tag.strip() for tag in if_none_match.split(",")}
+    if etag in candidates or "*" in candidates:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    return None
+
+
+class StaticJSON:
+    """JSON payload that is fixed for the life of the process, serialized once with a content ETag"""
+    
+    def __init__(self, content: Any, headers: Optional[Dict[str, str]] = None):
+        self.body = orjson.dumps(content)
+        self.etag = f'"{hashlib.blake2b(self.body, digest_size=8).hexdigest()}"'
+        self.headers = {**(headers or {}), "ETag": self.etag}
+    
+    def response(self, request: Request) -> Response:
+        """Serve the pre-rendered bytes, or 304 if the client already has them"""
+        return not_modified(request, self.etag) or Response(
+            content=self.body,
+            media_type="application/json",
+            headers=self.headers
+        )
@@ -1,16 +1,16 @@
 """
 Main FastAPI application for Legal Statute Analysis System
 """
+import asyncio
 import logging
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
 
-from fastapi import FastAPI, status
+from fastapi import FastAPI, Request, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-
 from .core.config import settings
-from .core.logging import setup_logging
-from .core.database_init import initialize_database
+from .core.logging import setup_logging, stop_logging
+from .core.responses import ORJSONResponse, StaticJSON
+from .core.database_init import build_missing_indexes, initialize_database, warm_up_orm
 from .api.auth import router as auth_router
 from .api.documents import router as documents_router
 from .api.analysis import router as analysis_router
@@ -26,20 +26,31 @@ async def lifespan(app: FastAPI):
     FastAPI lifespan events for startup and shutdown
     """
     # Startup
-    logger.info(f"Starting {settings.app_name} v{settings.app_version}")
+    logger.info("Starting %s v%s", settings.app_name, settings.app_version)
+    settings.ensure_runtime_dirs()
     
     try:
         # Initialize database
-        initialize_database()
+        await initialize_database()
         logger.info("Database initialization completed")
+        
+        # Resolve mappers and compile common statements now, not on the first request
+        await warm_up_orm()
     except Exception as e:
-        logger.error(f"Database initialization failed: {e}")
+        logger.error("Database initialization failed: %s", e)
         raise
     
+    # Index builds on populated tables can take minutes; serve requests meanwhile
+    index_build = asyncio.create_task(build_missing_indexes())
+    
     yield
     
-    # Shutdown
+    # Shutdown; an index left INVALID by the cancelled build is rebuilt next startup
+    index_build.cancel()
+    with suppress(asyncio.CancelledError):
+        await index_build
     logger.info("Application shutdown completed")
+    stop_logging()
 
 
 # Create FastAPI application
@@ -48,6 +59,7 @@ app = FastAPI(
     version=settings.app_version,
     description="國考法律題型分析系統 - 結合生成式 AI 和資訊系統整合的法律學習平台",
     debug=settings.debug,
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -67,143 +79,153 @@ app.include_router(documents_router, prefix=settings.api_prefix)
 app.include_router(analysis_router, prefix=settings.api_prefix)
 
 
+# Static endpoint payloads: fixed per process, so serialized once at import time
+_ROOT = StaticJSON({
+    "message": f"Welcome to {settings.app_name}",
+    "version": settings.app_version,
+    "status": "running"
+})
+
+_HEALTH = StaticJSON({
+    "status": "healthy",
+    "service": settings.app_name,
+    "version": settings.app_version
+})
+
+_API_ROOT = StaticJSON({
+    "message": f"{settings.app_name} API",
+    "version": settings.app_version,
+    "api_prefix": settings.api_prefix,
+    "endpoints": {
+        "auth": f"{settings.api_prefix}/auth",
+        "documents": f"{settings.api_prefix}/documents",
+        "docs": "/docs",
+        "health": "/health",
+        "status": f"{settings.api_prefix}/status"
+    }
+})
+
+_STATUS = StaticJSON({
+    "project": settings.app_name,
+    "version": settings.app_version,
+    "development_phase": "第一迭代 MVP 開發",
+    "completion_percentage": "80%",
+    "current_task": "文件處理服務開發",
+    "completed_modules": [
+        {
+            "name": "基礎環境配置",
+            "status": "✅ 完成",
+            "completion_date": "2025-08-17"
+        },
+        {
+            "name": "資料庫架構",
+            "status": "✅ 完成",
+            "completion_date": "2025-08-17",
+            "details": "4張核心表 (users, documents, legal_articles, question_analyses)"
+        },
+        {
+            "name": "用戶認證系統",
+            "status": "✅ 完成",
+            "completion_date": "2025-08-17",
+            "details": "JWT 認證、密碼加密、API 端點"
+        },
+        {
+            "name": "FastAPI 基礎架構",
+            "status": "✅ 完成",
+            "completion_date": "2025-08-17",
+            "details": "CORS、生命週期、異常處理"
+        }
+    ],
+    "in_progress_modules": [
+        {
+            "name": "文件處理服務",
+            "status": "🔄 開發中",
+            "progress": "90%",
+            "estimated_completion": "2025-08-18"
+        }
+    ],
+    "planned_modules": [
+        {
+            "name": "AI 分析服務",
+            "status": "⏳ 規劃中",
+            "estimated_start": "2025-08-18"
+        },
+        {
+            "name": "知識庫服務",
+            "status": "⏳ 規劃中",
+            "estimated_start": "2025-08-19"
+        },
+        {
+            "name": "單元測試",
+            "status": "⏳ 規劃中",
+            "estimated_start": "2025-08-20"
+        }
+    ],
+    "technical_stack": {
+        "backend": "Python 3.11 + FastAPI + SQLAlchemy",
+        "database": "PostgreSQL + Docker",
+        "authentication": "JWT + bcrypt",
+        "dependency_management": "Poetry",
+        "ai_frameworks": "LangChain + OpenAI (規劃中)"
+    },
+    "api_endpoints": {
+        "implemented": [
+            "POST /api/v1/auth/register",
+            "POST /api/v1/auth/login", 
+            "GET /api/v1/auth/verify-token",
+            "GET /api/v1/auth/profile",
+            "PUT /api/v1/auth/profile",
+            "GET /health"
+        ],
+        "planned": [
+            "POST /api/v1/analysis/question",
+            "GET /api/v1/knowledge/search"
+        ],
+        "documents": [
+            "POST /api/v1/documents/upload",
+            "GET /api/v1/documents/",
+            "GET /api/v1/documents/{id}",
+            "GET /api/v1/documents/{id}/content",
+            "POST /api/v1/documents/{id}/process",
+            "DELETE /api/v1/documents/{id}",
+            "GET /api/v1/documents/stats/summary"
+        ]
+    },
+    "last_updated": "2025-08-17T15:23:00Z"
+})
+
+
 # Health check endpoints
 @app.get("/")
-async def root():
+async def root(request: Request):
     """Root endpoint - API status"""
-    return {
-        "message": f"Welcome to {settings.app_name}",
-        "version": settings.app_version,
-        "status": "running"
-    }
+    return _ROOT.response(request)
 
 
 @app.get("/health")
-async def health_check():
+async def health_check(request: Request):
     """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "service": settings.app_name,
-        "version": settings.app_version
-    }
+    return _HEALTH.response(request)
 
 
 @app.get(f"{settings.api_prefix}/")
-async def api_root():
+async def api_root(request: Request):
     """API root endpoint"""
-    return {
-        "message": f"{settings.app_name} API",
-        "version": settings.app_version,
-        "api_prefix": settings.api_prefix,
-        "endpoints": {
-            "auth": f"{settings.api_prefix}/auth",
-            "documents": f"{settings.api_prefix}/documents",
-            "docs": "/docs",
-            "health": "/health",
-            "status": f"{settings.api_prefix}/status"
-        }
-    }
+    return _API_ROOT.response(request)
 
 
 @app.get(f"{settings.api_prefix}/status")
-async def development_status():
+async def development_status(request: Request):
     """Development status and progress endpoint"""
-    return {
-        "project": settings.app_name,
-        "version": settings.app_version,
-        "development_phase": "第一迭代 MVP 開發",
-        "completion_percentage": "80%",
-        "current_task": "文件處理服務開發",
-        "completed_modules": [
-            {
-                "name": "基礎環境配置",
-                "status": "✅ 完成",
-                "completion_date": "2025-08-17"
-            },
-            {
-                "name": "資料庫架構",
-                "status": "✅ 完成",
-                "completion_date": "2025-08-17",
-                "details": "4張核心表 (users, documents, legal_articles, question_analyses)"
-            },
-            {
-                "name": "用戶認證系統",
-                "status": "✅ 完成",
-                "completion_date": "2025-08-17",
-                "details": "JWT 認證、密碼加密、API 端點"
-            },
-            {
-                "name": "FastAPI 基礎架構",
-                "status": "✅ 完成",
-                "completion_date": "2025-08-17",
-                "details": "CORS、生命週期、異常處理"
-            }
-        ],
-        "in_progress_modules": [
-            {
-                "name": "文件處理服務",
-                "status": "🔄 開發中",
-                "progress": "90%",
-                "estimated_completion": "2025-08-18"
-            }
-        ],
-        "planned_modules": [
-            {
-                "name": "AI 分析服務",
-                "status": "⏳ 規劃中",
-                "estimated_start": "2025-08-18"
-            },
-            {
-                "name": "知識庫服務",
-                "status": "⏳ 規劃中",
-                "estimated_start": "2025-08-19"
-            },
-            {
-                "name": "單元測試",
-                "status": "⏳ 規劃中",
-                "estimated_start": "2025-08-20"
-            }
-        ],
-        "technical_stack": {
-            "backend": "Python 3.11 + FastAPI + SQLAlchemy",
-            "database": "PostgreSQL + Docker",
-            "authentication": "JWT + bcrypt",
-            "dependency_management": "Poetry",
-            "ai_frameworks": "LangChain + OpenAI (規劃中)"
-        },
-        "api_endpoints": {
-            "implemented": [
-                "POST /api/v1/auth/register",
-                "POST /api/v1/auth/login", 
-                "GET /api/v1/auth/verify-token",
-                "GET /api/v1/auth/profile",
-                "PUT /api/v1/auth/profile",
-                "GET /health"
-            ],
-            "planned": [
-                "POST /api/v1/analysis/question",
-                "GET /api/v1/knowledge/search"
-            ],
-            "documents": [
-                "POST /api/v1/documents/upload",
-                "GET /api/v1/documents/",
-                "GET /api/v1/documents/{id}",
-                "GET /api/v1/documents/{id}/content",
-                "POST /api/v1/documents/{id}/process",
-                "DELETE /api/v1/documents/{id}",
-                "GET /api/v1/documents/stats/summary"
-            ]
-        },
-        "last_updated": "2025-08-17T15:23:00Z"
-    }
+    return _STATUS.response(request)
 
 
 # Global exception handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     """Global exception handler for unhandled errors"""
-    logger.error(f"Unhandled error: {exc}", exc_info=True)
-    return JSONResponse(
+    logger.error("Unhandled error: %s", exc, exc_info=True)
+    return ORJSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         content={
             "error": "Internal server error",
@@ -3,78 +3,94 @@ Document model for PDF file management and OCR processing
 """
 import uuid
 from datetime import datetime
-from typing import Optional
+from typing import TYPE_CHECKING, List, Optional
 
-from sqlalchemy import Column, String, DateTime, Integer, Text, ForeignKey
+from sqlalchemy import Index, String, DateTime, Integer, SmallInteger, Text, ForeignKey
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from ..core.database import Base
+from ..core.database import Base, utcnow
+from .identifiers import uuid7
+from .serialization import dict_serializer
 
+if TYPE_CHECKING:
+    from .question_analysis import QuestionAnalysis
+    from .user import User
 
+
+@dict_serializer(exclude=("storage_path", "ocr_text"))
 class Document(Base):
     """Document model for uploaded PDF files and OCR results"""
     
     __tablename__ = "documents"
+    __table_args__ = (
+        # Serves list_documents: filter by user (and status), newest first; id is the
+        # keyset tie-breaker, so a (created_at, id) < cursor seek is a pure index range.
+        # On PostgreSQL file_size is carried in the leaf pages, so the per-status
+        # count/size statistics are answered by an index-only scan.
+        Index(
+            "ix_doc_user_status_created_id", "user_id", "processing_status", "created_at", "id",
+            postgresql_include=("file_size",)
+        ),
+        # Unfiltered listing: user's documents newest first without a sort step
+        Index("ix_doc_user_created_id", "user_id", "created_at", "id"),
+        # Upload deduplication: find the user's earlier copy of the same content
+        Index("ix_doc_user_content_sha256", "user_id", "content_sha256"),
+    )
+    # Fetch server-generated timestamps with RETURNING instead of expiring them
+    __mapper_args__ = {"eager_defaults": True}
     
     # Primary key
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7, index=True)
     
     # Foreign keys
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)  # Indexed via the composites above
     
     # File metadata
-    filename = Column(String(255), nullable=False)
-    file_type = Column(String(50), nullable=False)
-    file_size = Column(Integer, nullable=False)
-    storage_path = Column(String(500), nullable=False)
+    filename: Mapped[str] = mapped_column(String(255), nullable=False)
+    file_type: Mapped[str] = mapped_column(String(50), nullable=False)
+    file_size: Mapped[int] = mapped_column(Integer, nullable=False)
+    storage_path: Mapped[str] = mapped_column(String(500), nullable=False)
+    content_sha256: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)  # Hex digest of the file content
     
     # Processing status
-    processing_status = Column(String(20), default="uploaded", nullable=False)
+    processing_status: Mapped[str] = mapped_column(String(20), default="uploaded", nullable=False)
     # Status values: uploaded, processing, completed, failed
     
     # OCR results
-    ocr_text = Column(Text, nullable=True)
-    ocr_confidence = Column(String(10), nullable=True)  # Overall confidence score
+    ocr_text: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    ocr_confidence: Mapped[Optional[int]] = mapped_column(SmallInteger, nullable=True)  # Overall confidence score x 1000 (0-1000)
     
     # Processing metadata
-    processing_started_at = Column(DateTime, nullable=True)
-    processing_completed_at = Column(DateTime, nullable=True)
-    error_message = Column(Text, nullable=True)
+    processing_started_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    processing_completed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    error_message: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
     
     # Timestamps
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=utcnow(), nullable=False)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=utcnow(), onupdate=utcnow())
     
     # Relationships
-    user = relationship("User", back_populates="documents")
-    analyses = relationship("QuestionAnalysis", back_populates="document", cascade="all, delete-orphan")
+    user: Mapped["User"] = relationship("User", back_populates="documents")
+    analyses: Mapped[List["QuestionAnalysis"]] = relationship("QuestionAnalysis", back_populates="document", cascade="all, delete-orphan")
     
     def __repr__(self):
         return f"<Document(id={self.id}, filename={self.filename}, status={self.processing_status})>"
     
-    def to_dict(self):
-        """Convert document to dictionary"""
-        return {
-            "id": str(self.id),
-            "user_id": str(self.user_id),
-            "filename": self.filename,
-            "file_type": self.file_type,
-            "file_size": self.file_size,
-            "processing_status": self.processing_status,
-            "ocr_confidence": self.ocr_confidence,
-            "processing_started_at": self.processing_started_at.isoformat() if self.processing_started_at else None,
-            "processing_completed_at": self.processing_completed_at.isoformat() if self.processing_completed_at else None,
-            "error_message": self.error_message,
-            "created_at": self.created_at.isoformat(),
-            "updated_at": self.updated_at.isoformat(),
-        }
-    
     @property
     def is_processing_complete(self) -> bool:
         """Check if document processing is complete"""
         return self.processing_status == "completed"
     
+    @property
+    def ocr_confidence_score(self) -> Optional[float]:
+        """Overall OCR confidence as a 0-1 ratio"""
+        return None if self.ocr_confidence is None else self.ocr_confidence / 1000
+    
+    @ocr_confidence_score.setter
+    def ocr_confidence_score(self, value: Optional[float]):
+        self.ocr_confidence = None if value is None else round(value * 1000)
+    
     @property
     def has_ocr_text(self) -> bool:
         """Check if document has OCR text available"""
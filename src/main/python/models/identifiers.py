@@ -0,0 +1,41 @@
+"""
+Primary key generation for ORM models
+"""
+import os
+import time
+import uuid
+from typing import Union
+
+_VERSION_MASK = 0xF << 76
+_VARIANT_MASK = 0x3 << 62
+
+
+def uuid7() -> uuid.UUID:
+    """
+    Generate a time-ordered UUID (RFC 9562 version 7)
+
+    The top 48 bits are the Unix time in milliseconds and the rest is random, so
+    new keys land at the right-hand edge of the primary key B-tree instead of at
+    random pages, while still being unguessable and globally unique.
+
+    Returns:
+        uuid.UUID: A version 7 UUID
+    """
+    timestamp_ms = time.time_ns() // 1_000_000
+    value = (timestamp_ms & 0xFFFF_FFFF_FFFF) << 80 | int.from_bytes(os.urandom(10), "big")
+    value = (value & ~_VERSION_MASK) | (0x7 << 76)
+    value = (value & ~_VARIANT_MASK) | (0x2 << 62)
+    return uuid.UUID(int=value)
+
+
+def as_uuid(value: Union[str, uuid.UUID]) -> uuid.UUID:
+    """
+    Parse an ID received as a string (e.g. a path parameter) into a UUID
+
+    UUID columns must be compared with UUID objects: PostgreSQL casts strings,
+    but SQLite's UUID type cannot bind them.
+
+    Raises:
+        ValueError: If ``value`` is not a valid UUID
+    """
+    return value if isinstance(value, uuid.UUID) else uuid.UUID(value)
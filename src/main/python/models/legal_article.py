@@ -3,92 +3,106 @@ Legal Article model for storing and indexing legal statutes
 """
 import uuid
 from datetime import datetime
-from typing import Optional
+from typing import Any, List, Optional
 
-from sqlalchemy import Column, String, DateTime, Text, Integer, JSON
+from sqlalchemy import DDL, Computed, Index, String, DateTime, Text, Integer, event, literal_column
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import Mapped, mapped_column
 
-from ..core.database import Base
+from ..core.database import Base, JSONBType, TSVectorType, simple_tsvector, utcnow
+from .identifiers import uuid7
+from .serialization import dict_serializer
 
 
+@dict_serializer(exclude=("content_tsv",))
 class LegalArticle(Base):
     """Legal Article model for storing legal statutes and regulations"""
     
     __tablename__ = "legal_articles"
+    __table_args__ = (
+        # Trigram index so citation lookups (LIKE/ILIKE/similarity) use an index
+        Index(
+            "ix_legal_articles_citation_trgm", "full_citation",
+            postgresql_using="gin",
+            postgresql_ops={"full_citation": "gin_trgm_ops"}
+        ),
+        # Containment (@>) and key-existence (?) lookups on tags and keywords
+        Index("ix_legal_articles_keywords_gin", "keywords", postgresql_using="gin"),
+        Index("ix_legal_articles_subject_tags_gin", "subject_tags", postgresql_using="gin"),
+        # Trigram index serving substring (ILIKE '%keyword%') searches of the statute body;
+        # CJK text has no word boundaries for the 'simple' tsvector parser to split on
+        Index(
+            "ix_legal_articles_content_trgm", "article_content",
+            postgresql_using="gin",
+            postgresql_ops={"article_content": "gin_trgm_ops"}
+        ).ddl_if(dialect="postgresql"),
+        # Full-text search over the statute body without touching the TOASTed text
+        Index("ix_legal_articles_content_tsv", "content_tsv", postgresql_using="gin").ddl_if(dialect="postgresql"),
+    )
+    # Fetch server-generated timestamps with RETURNING instead of expiring them
+    __mapper_args__ = {"eager_defaults": True}
     
     # Primary key
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7, index=True)
     
     # Article identification
-    law_name = Column(String(255), nullable=False, index=True)  # 法規名稱
-    article_number = Column(String(50), nullable=False, index=True)  # 條文編號
-    article_title = Column(String(500), nullable=True)  # 條文標題
+    law_name: Mapped[str] = mapped_column(String(255), nullable=False, index=True)  # 法規名稱
+    article_number: Mapped[str] = mapped_column(String(50), nullable=False, index=True)  # 條文編號
+    article_title: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)  # 條文標題
+    full_citation: Mapped[str] = mapped_column(
+        String(320),
+        Computed("law_name || ' 第 ' || article_number || ' 條'", persisted=True)
+    )  # 完整引用 (e.g. 民法 第 184 條), maintained by the database
     
     # Content
-    article_content = Column(Text, nullable=False)  # 條文內容
-    article_summary = Column(Text, nullable=True)  # 條文摘要
+    article_content: Mapped[str] = mapped_column(Text, nullable=False)  # 條文內容
+    article_summary: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # 條文摘要
+    content_tsv: Mapped[Optional[str]] = mapped_column(
+        TSVectorType,
+        Computed(simple_tsvector(literal_column("article_content")), persisted=True),
+        deferred=True
+    )  # 全文檢索向量, maintained by the database and never loaded by default
     
     # Classification
-    law_category = Column(String(100), nullable=False, index=True)  # 法規類別
-    subject_tags = Column(JSON, nullable=True)  # 主題標籤
+    law_category: Mapped[str] = mapped_column(String(100), nullable=False, index=True)  # 法規類別
+    subject_tags: Mapped[Optional[List[str]]] = mapped_column(JSONBType, nullable=True)  # 主題標籤
     
     # Hierarchy
-    chapter = Column(String(100), nullable=True)  # 章
-    section = Column(String(100), nullable=True)  # 節
-    subsection = Column(String(100), nullable=True)  # 款
+    chapter: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)  # 章
+    section: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)  # 節
+    subsection: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)  # 款
     
     # Legal metadata
-    effective_date = Column(DateTime, nullable=True)  # 生效日期
-    amendment_date = Column(DateTime, nullable=True)  # 修正日期
-    legal_source = Column(String(255), nullable=True)  # 法源
+    effective_date: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)  # 生效日期
+    amendment_date: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)  # 修正日期
+    legal_source: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)  # 法源
     
     # Search and analysis
-    keywords = Column(JSON, nullable=True)  # 關鍵字
-    related_articles = Column(JSON, nullable=True)  # 相關條文ID
+    keywords: Mapped[Optional[List[str]]] = mapped_column(JSONBType, nullable=True)  # 關鍵字
+    related_articles: Mapped[Optional[List[Any]]] = mapped_column(JSONBType, nullable=True)  # 相關條文ID
     
     # Vector embeddings for semantic search (PostgreSQL with pgvector)
     # Will be enabled when pgvector extension is available
     # from sqlalchemy.dialects.postgresql import ARRAY
     # from pgvector.sqlalchemy import Vector
-    # embedding_vector = Column(Vector(1536), nullable=True)  # OpenAI embedding dimension
+    # embedding_vector: Mapped[Optional[List[float]]] = mapped_column(Vector(1536), nullable=True)  # OpenAI embedding dimension
     
     # Timestamps
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=utcnow(), nullable=False)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=utcnow(), onupdate=utcnow())
     
     def __repr__(self):
         return f"<LegalArticle(id={self.id}, law={self.law_name}, article={self.article_number})>"
     
-    def to_dict(self):
-        """Convert legal article to dictionary"""
-        return {
-            "id": str(self.id),
-            "law_name": self.law_name,
-            "article_number": self.article_number,
-            "article_title": self.article_title,
-            "article_content": self.article_content,
-            "article_summary": self.article_summary,
-            "law_category": self.law_category,
-            "subject_tags": self.subject_tags,
-            "chapter": self.chapter,
-            "section": self.section,
-            "subsection": self.subsection,
-            "effective_date": self.effective_date.isoformat() if self.effective_date else None,
-            "amendment_date": self.amendment_date.isoformat() if self.amendment_date else None,
-            "legal_source": self.legal_source,
-            "keywords": self.keywords,
-            "related_articles": self.related_articles,
-            "created_at": self.created_at.isoformat(),
-            "updated_at": self.updated_at.isoformat(),
-        }
-    
-    @hybrid_property
-    def full_citation(self) -> str:
-        """Get full legal citation"""
-        return f"{self.law_name} 第 {self.article_number} 條"
-    
     @property
     def has_summary(self) -> bool:
         """Check if article has summary"""
-        return self.article_summary is not None and len(self.article_summary.strip()) > 0
\ No newline at end of file
+        return self.article_summary is not None and len(self.article_summary.strip()) > 0
+
+
+# gin_trgm_ops comes from the pg_trgm extension, which must exist before the index
+event.listen(
+    LegalArticle.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql")
+)
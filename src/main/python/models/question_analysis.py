@@ -3,91 +3,107 @@ Question Analysis model for storing AI analysis results
 """
 import uuid
 from datetime import datetime
-from typing import Optional, Dict, Any
-import json
+from typing import TYPE_CHECKING, Optional, Dict, Any, List
 
-from sqlalchemy import Column, String, DateTime, Text, ForeignKey, Float, JSON
+from sqlalchemy import DDL, Enum, Index, String, DateTime, Text, ForeignKey, Float, event
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy.ext.mutable import MutableList
+from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from ..core.database import Base
+from ..core.database import Base, EmbeddingType, JSONBType, utcnow
+from .identifiers import uuid7
+from .serialization import dict_serializer
 
+if TYPE_CHECKING:
+    from .document import Document
+    from .user import User
 
+# Allowed question_difficulty values, from easiest to hardest
+DIFFICULTY_LEVELS = ("初級", "中級", "高級", "專業")
+
+# Size of the question embeddings, as produced by the default SEMANTIC_CACHE_MODEL
+EMBEDDING_DIMENSIONS = 384
+
+
+@dict_serializer(exclude=("embedding",))
 class QuestionAnalysis(Base):
     """Question Analysis model for storing AI analysis results of legal questions"""
     
     __tablename__ = "question_analyses"
+    __table_args__ = (
+        # Serves list_analyses: filter by user (and type), newest first. id is the
+        # keyset tie-breaker, so a (created_at, id) < cursor seek is a pure index range
+        Index("ix_analysis_user_type_created_id", "user_id", "question_type", "created_at", "id"),
+        # Unfiltered listing and recent-activity stats; confidence_score is carried
+        # in the leaf pages on PostgreSQL so the average needs no heap lookups
+        Index(
+            "ix_analysis_user_created_id", "user_id", "created_at", "id",
+            postgresql_include=("confidence_score",)
+        ),
+        # Analyses of a document (by type); also covers the document_id foreign key
+        Index("ix_analysis_document_type", "document_id", "question_type"),
+        # Approximate nearest-neighbour search for similar questions (cosine distance)
+        Index(
+            "ix_analysis_embedding_hnsw", "embedding",
+            postgresql_using="hnsw",
+            postgresql_ops={"embedding": "vector_cosine_ops"}
+        ).ddl_if(dialect="postgresql"),
+    )
+    # Fetch server-generated timestamps with RETURNING instead of expiring them
+    __mapper_args__ = {"eager_defaults": True}
     
     # Primary key
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7, index=True)
     
     # Foreign keys
-    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False, index=True)
-    document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id"), nullable=True, index=True)
+    user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)  # Indexed via the composites above
+    document_id: Mapped[Optional[uuid.UUID]] = mapped_column(UUID(as_uuid=True), ForeignKey("documents.id"), nullable=True)
     
     # Question content
-    question_text = Column(Text, nullable=False)  # 題目原文
-    question_type = Column(String(50), nullable=True, index=True)  # 題型分類
-    question_difficulty = Column(String(20), nullable=True)  # 難度等級
+    question_text: Mapped[str] = mapped_column(Text, nullable=False)  # 題目原文
+    question_type: Mapped[Optional[str]] = mapped_column(String(50), nullable=True, index=True)  # 題型分類
+    question_difficulty: Mapped[Optional[str]] = mapped_column(Enum(*DIFFICULTY_LEVELS, name="question_difficulty"), nullable=True)  # 難度等級
     
     # AI Analysis results
-    analysis_result = Column(JSON, nullable=True)  # AI 分析結果 (JSON格式)
-    confidence_score = Column(Float, nullable=True)  # 信心分數 (0-1)
+    analysis_result: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSONBType, nullable=True)  # AI 分析結果 (JSON格式)
+    confidence_score: Mapped[Optional[float]] = mapped_column(Float, nullable=True)  # 信心分數 (0-1)
     
     # Identified legal concepts
-    relevant_laws = Column(JSON, nullable=True)  # 相關法條 (JSON array)
-    legal_concepts = Column(JSON, nullable=True)  # 法律概念 (JSON array)
-    key_points = Column(JSON, nullable=True)  # 重點分析 (JSON array)
+    relevant_laws: Mapped[Optional[List[Dict[str, Any]]]] = mapped_column(MutableList.as_mutable(JSONBType), nullable=True)  # 相關法條 (JSON array)
+    legal_concepts: Mapped[Optional[List[Dict[str, Any]]]] = mapped_column(MutableList.as_mutable(JSONBType), nullable=True)  # 法律概念 (JSON array)
+    key_points: Mapped[Optional[List[Any]]] = mapped_column(JSONBType, nullable=True)  # 重點分析 (JSON array)
     
     # Study recommendations
-    study_suggestions = Column(Text, nullable=True)  # 學習建議
-    similar_questions = Column(JSON, nullable=True)  # 類似題目 (JSON array)
-    practice_materials = Column(JSON, nullable=True)  # 練習資料 (JSON array)
+    study_suggestions: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # 學習建議
+    similar_questions: Mapped[Optional[List[Dict[str, Any]]]] = mapped_column(JSONBType, nullable=True)  # 類似題目 (JSON array)
+    practice_materials: Mapped[Optional[List[Dict[str, Any]]]] = mapped_column(JSONBType, nullable=True)  # 練習資料 (JSON array)
+    
+    # Question embedding for similar-question search (pgvector on PostgreSQL); only
+    # the nearest-neighbour lookup reads it, so keep it out of ordinary loads
+    embedding: Mapped[Optional[List[float]]] = mapped_column(
+        EmbeddingType(EMBEDDING_DIMENSIONS), nullable=True, deferred=True
+    )  # 題目向量
     
     # Processing metadata
-    ai_model_used = Column(String(100), nullable=True)  # 使用的AI模型
-    processing_time_ms = Column(Float, nullable=True)  # 處理時間(毫秒)
+    status: Mapped[str] = mapped_column(String(20), default="pending", nullable=False)  # pending, processing, completed, failed
+    ai_model_used: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)  # 使用的AI模型
+    processing_time_ms: Mapped[Optional[float]] = mapped_column(Float, nullable=True)  # 處理時間(毫秒)
     
     # User interaction
-    user_rating = Column(Float, nullable=True)  # 用戶評分 (1-5)
-    user_feedback = Column(Text, nullable=True)  # 用戶回饋
+    user_rating: Mapped[Optional[float]] = mapped_column(Float, nullable=True)  # 用戶評分 (1-5)
+    user_feedback: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # 用戶回饋
     
     # Timestamps
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=utcnow(), nullable=False)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=utcnow(), onupdate=utcnow())
     
     # Relationships
-    user = relationship("User", back_populates="analyses")
-    document = relationship("Document", back_populates="analyses")
+    user: Mapped["User"] = relationship("User", back_populates="analyses")
+    document: Mapped[Optional["Document"]] = relationship("Document", back_populates="analyses")
     
     def __repr__(self):
         return f"<QuestionAnalysis(id={self.id}, type={self.question_type}, confidence={self.confidence_score})>"
     
-    def to_dict(self):
-        """Convert question analysis to dictionary"""
-        return {
-            "id": str(self.id),
-            "user_id": str(self.user_id),
-            "document_id": str(self.document_id) if self.document_id else None,
-            "question_text": self.question_text,
-            "question_type": self.question_type,
-            "question_difficulty": self.question_difficulty,
-            "analysis_result": self.analysis_result,
-            "confidence_score": self.confidence_score,
-            "relevant_laws": self.relevant_laws,
-            "legal_concepts": self.legal_concepts,
-            "key_points": self.key_points,
-            "study_suggestions": self.study_suggestions,
-            "similar_questions": self.similar_questions,
-            "practice_materials": self.practice_materials,
-            "ai_model_used": self.ai_model_used,
-            "processing_time_ms": self.processing_time_ms,
-            "user_rating": self.user_rating,
-            "user_feedback": self.user_feedback,
-            "created_at": self.created_at.isoformat(),
-            "updated_at": self.updated_at.isoformat(),
-        }
-    
     def set_analysis_result(self, result: Dict[str, Any]):
         """Set analysis result as JSON"""
         self.analysis_result = result
@@ -97,7 +113,12 @@ class QuestionAnalysis(Base):
         return self.analysis_result
     
     def add_relevant_law(self, law_name: str, article_number: str, relevance_score: float):
-        """Add a relevant law to the analysis"""
+        """
+        Add a relevant law to the analysis
+        
+        The column is a MutableList, so appends are tracked in memory and any
+        number of them are written by a single UPDATE on the next flush.
+        """
         if self.relevant_laws is None:
             self.relevant_laws = []
         
@@ -108,7 +129,7 @@ class QuestionAnalysis(Base):
         })
     
     def add_legal_concept(self, concept: str, description: str, importance: str):
-        """Add a legal concept to the analysis"""
+        """Add a legal concept to the analysis (tracked like add_relevant_law)"""
         if self.legal_concepts is None:
             self.legal_concepts = []
         
@@ -126,4 +147,12 @@ class QuestionAnalysis(Base):
     @property
     def is_rated_by_user(self) -> bool:
         """Check if user has rated this analysis"""
-        return self.user_rating is not None
\ No newline at end of file
+        return self.user_rating is not None
+
+
+# The vector type and its index operator class come from the pgvector extension
+event.listen(
+    QuestionAnalysis.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS vector").execute_if(dialect="postgresql")
+)
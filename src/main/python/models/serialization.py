@@ -0,0 +1,49 @@
+"""
+Generated dictionary serializers for ORM models
+"""
+from typing import Callable, Iterable, Type, TypeVar
+
+from sqlalchemy import DateTime, Uuid
+
+ModelT = TypeVar("ModelT")
+
+
+def _column_expression(key: str, column_type) -> str:
+    """Source expression converting one attribute to its JSON-friendly form"""
+    if isinstance(column_type, Uuid):
+        return f"None if self.{key} is None else str(self.{key})"
+    if isinstance(column_type, DateTime):
+        return f"None if self.{key} is None else self.{key}.isoformat()"
+    return f"self.{key}"
+
+
+def dict_serializer(exclude: Iterable[str] = ()) -> Callable[[Type[ModelT]], Type[ModelT]]:
+    """
+    Class decorator that installs a generated ``to_dict`` method
+    
+    The method body is built once from the table's columns and compiled, so each
+    call is a single dict literal with no per-call introspection. UUIDs become
+    strings and datetimes ISO strings; other values are returned as stored.
+    
+    Args:
+        exclude: Column attribute names to leave out (e.g. sensitive fields)
+    """
+    excluded = frozenset(exclude)
+    
+    def decorate(cls: Type[ModelT]) -> Type[ModelT]:
+        items = ",\n        ".join(
+            f"{column.key!r}: {_column_expression(column.key, column.type)}"
+            for column in cls.__table__.columns
+            if column.key not in excluded
+        )
+        source = f"def to_dict(self):\n    return {{\n        {items}\n    }}\n"
+        
+        namespace: dict = {}
+        exec(compile(source, f"<{cls.__name__}.to_dict>", "exec"), namespace)
+        to_dict = namespace["to_dict"]
+        to_dict.__doc__ = f"Convert {cls.__name__} to dictionary (generated from its columns)"
+        to_dict.__qualname__ = f"{cls.__name__}.to_dict"
+        cls.to_dict = to_dict
+        return cls
+    
+    return decorate
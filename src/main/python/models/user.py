@@ -3,56 +3,52 @@ User model for authentication and user management
 """
 import uuid
 from datetime import datetime
-from typing import Optional
+from typing import TYPE_CHECKING, List, Optional
 
-from sqlalchemy import Column, String, DateTime, Boolean
+from sqlalchemy import String, DateTime, Boolean
 from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from ..core.database import Base
+from ..core.database import Base, utcnow
+from .identifiers import uuid7
+from .serialization import dict_serializer
 
+if TYPE_CHECKING:
+    from .document import Document
+    from .question_analysis import QuestionAnalysis
 
+
+@dict_serializer(exclude=("hashed_password", "is_admin"))
 class User(Base):
     """User model for authentication and profile management"""
     
     __tablename__ = "users"
+    # Fetch server-generated timestamps with RETURNING instead of expiring them
+    __mapper_args__ = {"eager_defaults": True}
     
     # Primary key
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid7, index=True)
     
     # Authentication fields
-    email = Column(String(255), unique=True, index=True, nullable=False)
-    hashed_password = Column(String(255), nullable=False)
+    email: Mapped[str] = mapped_column(String(255), unique=True, index=True, nullable=False)
+    hashed_password: Mapped[str] = mapped_column(String(255), nullable=False)
     
     # Profile fields
-    full_name = Column(String(255), nullable=True)
+    full_name: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
     
     # Subscription and permissions
-    subscription_type = Column(String(20), default="free")
-    is_active = Column(Boolean, default=True)
-    is_admin = Column(Boolean, default=False)
+    subscription_type: Mapped[Optional[str]] = mapped_column(String(20), default="free")
+    is_active: Mapped[Optional[bool]] = mapped_column(Boolean, default=True)
+    is_admin: Mapped[Optional[bool]] = mapped_column(Boolean, default=False)
     
     # Timestamps
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    last_login_at = Column(DateTime, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=utcnow(), nullable=False)
+    updated_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), server_default=utcnow(), onupdate=utcnow())
+    last_login_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
     
     # Relationships
-    documents = relationship("Document", back_populates="user", cascade="all, delete-orphan")
-    analyses = relationship("QuestionAnalysis", back_populates="user", cascade="all, delete-orphan")
+    documents: Mapped[List["Document"]] = relationship("Document", back_populates="user", cascade="all, delete-orphan")
+    analyses: Mapped[List["QuestionAnalysis"]] = relationship("QuestionAnalysis", back_populates="user", cascade="all, delete-orphan")
     
     def __repr__(self):
-        return f"<User(id={self.id}, email={self.email})>"
-    
-    def to_dict(self):
-        """Convert user to dictionary (excluding sensitive fields)"""
-        return {
-            "id": str(self.id),
-            "email": self.email,
-            "full_name": self.full_name,
-            "subscription_type": self.subscription_type,
-            "is_active": self.is_active,
-            "created_at": self.created_at.isoformat(),
-            "updated_at": self.updated_at.isoformat(),
-            "last_login_at": self.last_login_at.isoformat() if self.last_login_at else None,
-        }
\ No newline at end of file
+        return f"<User(id={self.id}, email={self.email})>"
\ No newline at end of file
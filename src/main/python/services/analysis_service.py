@@ -2,35 +2,110 @@
 Analysis service for legal question analysis and management
 """
 import logging
-from datetime import datetime
-from typing import Dict, Any, List, Optional
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, List, Optional, Tuple
 import asyncio
 from pathlib import Path
 
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
+import numpy as np
+import orjson
 
-from ..models.question_analysis import QuestionAnalysis
+from sqlalchemy import Float, and_, func, insert, inspect, literal, or_, select, tuple_, update
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+from ..core.database import AsyncSessionLocal, JSONBType
+from ..models.identifiers import as_uuid, uuid7
+from ..models.question_analysis import DIFFICULTY_LEVELS, QuestionAnalysis
 from ..models.document import Document
 from ..models.legal_article import LegalArticle
 from .llm_service import llm_service, LegalAnalysisResult
+from .semantic_cache import semantic_cache
 from .document_service import document_service
 from ..core.config import settings
+from ..core.pagination import Cursor
 
 logger = logging.getLogger(__name__)
 
 
+# Columns written by bulk inserts; server-generated timestamps are left to the database
+_INSERT_COLUMNS = tuple(
+    column for column in QuestionAnalysis.__table__.columns if column.server_default is None
+)
+
+# Bulk inserts at least this large use COPY on PostgreSQL; below it COPY's setup costs more
+COPY_MIN_ROWS = 1000
+
+# Legal keywords commonly found in Taiwan law, in extraction priority order
+LEGAL_KEYWORDS = (
+    "契約", "財產", "損害", "責任", "權利", "義務", "法律", "條文",
+    "民法", "刑法", "商業", "公司", "消費者", "保護", "管理", "條例"
+)
+
+# Fallback question type cues, in priority order: the first type with any cue wins
+QUESTION_TYPE_KEYWORDS = (
+    ("選擇題", ("選擇", "下列", "何者", "哪個")),
+    ("申論題", ("說明", "解釋", "論述", "分析")),
+    ("案例分析", ("案例", "事實", "情況", "甲乙"))
+)
+
+
+def _build_keyword_automaton(words: Dict[str, Any]):
+    """Aho-Corasick automaton mapping each word to its value, or None if pyahocorasick is not installed"""
+    try:
+        import ahocorasick
+    except ImportError:
+        logger.info("pyahocorasick not installed, using substring keyword scan")
+        return None
+    
+    automaton = ahocorasick.Automaton()
+    for word, value in words.items():
+        automaton.add_word(word, value)
+    automaton.make_automaton()
+    return automaton
+
+
+def _copy_value(column, row: Dict[str, Any]) -> Any:
+    """A row's value for one column in COPY form, applying the column's Python default"""
+    if column.key in row:
+        value = row[column.key]
+    elif column.default is not None:
+        value = column.default.arg(None) if column.default.is_callable else column.default.arg
+    else:
+        value = None
+    
+    # asyncpg takes json/jsonb as serialized text, which the ORM normally does for us
+    if value is not None and isinstance(column.type, JSONBType):
+        value = orjson.dumps(value).decode()
+    return value
+
+
+def stats_cache_key(user_id) -> str:
+    """Redis key holding a user's cached analysis statistics"""
+    return f"astat:{user_id}"
+
+
 class AnalysisService:
     """Service for managing legal question analysis"""
     
     def __init__(self):
         self.llm_service = llm_service
+        self._keyword_automaton = _build_keyword_automaton(
+            {keyword: keyword for keyword in LEGAL_KEYWORDS}
+        )
+        # Maps each question type cue to its type's priority in QUESTION_TYPE_KEYWORDS
+        self._question_type_automaton = _build_keyword_automaton({
+            keyword: priority
+            for priority, (_, keywords) in enumerate(QUESTION_TYPE_KEYWORDS)
+            for keyword in keywords
+        })
     
     async def analyze_question(
         self,
         question_text: str,
         user_id: str,
-        db: Session,
+        db: AsyncSession,
         document_id: Optional[str] = None,
         context: Optional[str] = None,
         question_type_hint: Optional[str] = None
@@ -49,71 +124,291 @@ class AnalysisService:
         Returns:
             Analysis result dictionary
         """
-        logger.info(f"Starting analysis for user {user_id}")
+        logger.info("Starting analysis for user %s", user_id)
         
-        try:
-            # Check if LLM service is available
-            if not self.llm_service.is_available():
-                logger.warning("LLM service not available, using fallback analysis")
-                return await self._fallback_analysis(
-                    question_text, user_id, db, document_id
-                )
+        question_analysis = QuestionAnalysis(
+            user_id=uuid.UUID(user_id),
+            document_id=uuid.UUID(document_id) if document_id else None,
+            question_text=question_text,
+            status="processing"
+        )
+        return await self._run_analysis(question_analysis, db, context, question_type_hint)
+    
+    async def analyze_questions_bulk(
+        self,
+        questions: List[Dict[str, Any]],
+        user_id: str,
+        db: AsyncSession
+    ) -> List[Dict[str, Any]]:
+        """
+        Analyze many questions with concurrent LLM calls
+        
+        Up to LLM_MAX_CONCURRENCY calls are in flight at once, so N questions cost
+        about N / k LLM round trips instead of N, without stampeding the provider.
+        All records are written with one multi-row INSERT and a single commit after
+        every call has returned; a question whose call raised gets the basic fallback.
+        
+        Args:
+            questions: Dicts with question_text and optional document_id, context
+                and question_type_hint
+            user_id: User ID requesting the analyses
+            db: Database session
             
-            # Perform AI analysis
-            analysis_result, metadata = await self.llm_service.analyze_legal_question(
-                question_text=question_text,
-                context=context,
-                question_type_hint=question_type_hint
+        Returns:
+            One summary per question, in input order
+        
+        Raises:
+            ValueError: If user_id or a document_id is not a valid UUID (checked
+                before any LLM call is made)
+        """
+        user_uuid = uuid.UUID(user_id)
+        document_ids = [
+            uuid.UUID(question["document_id"]) if question.get("document_id") else None
+            for question in questions
+        ]
+        semaphore = asyncio.Semaphore(settings.llm_max_concurrency)
+        
+        async def analyze_one(question: Dict[str, Any]):
+            async with semaphore:
+                return await self._analyze_with_cache(
+                    question["question_text"],
+                    question.get("context"),
+                    question.get("question_type_hint")
+                )
+        
+        if self.llm_service.is_available():
+            outcomes = await asyncio.gather(
+                *(analyze_one(question) for question in questions),
+                return_exceptions=True
             )
-            
-            # Create database record
+        else:
+            logger.warning("LLM service not available, using fallback analysis")
+            outcomes = [None] * len(questions)
+        
+        analyses = []
+        for question, document_id, outcome in zip(questions, document_ids, outcomes):
             question_analysis = QuestionAnalysis(
-                user_id=user_id,
+                id=uuid7(),
+                user_id=user_uuid,
                 document_id=document_id,
-                question_text=question_text,
-                question_type=analysis_result.question_type,
-                question_difficulty=analysis_result.difficulty_level,
-                confidence_score=analysis_result.confidence_score,
-                study_suggestions=analysis_result.study_suggestions,
-                ai_model_used=metadata.get("model_used"),
-                processing_time_ms=metadata.get("processing_time_ms")
+                question_text=question["question_text"]
             )
+            if isinstance(outcome, tuple):
+                analysis_result, metadata, question_analysis.embedding = outcome
+                self.apply_analysis_result(question_analysis, analysis_result, metadata)
+            else:
+                if isinstance(outcome, BaseException):
+                    logger.error("Bulk analysis failed for user %s: %s", user_id, outcome)
+                self._apply_fallback_result(
+                    question_analysis,
+                    self._classify_question_basic(question_analysis.question_text),
+                    self._estimate_difficulty_basic(question_analysis.question_text)
+                )
+            analyses.append(question_analysis)
+        
+        # The records were only used to fill in values; insert them as plain rows
+        await self.bulk_insert_analyses(
+            [
+                {column.key: getattr(question_analysis, column.key) for column in _INSERT_COLUMNS}
+                for question_analysis in analyses
+            ],
+            db
+        )
+        
+        logger.info("Bulk analyzed %s questions for user %s", len(analyses), user_id)
+        return [
+            {
+                "analysis_id": str(question_analysis.id),
+                "status": question_analysis.status,
+                "question_type": question_analysis.question_type,
+                "difficulty_level": question_analysis.question_difficulty,
+                "confidence_score": question_analysis.confidence_score
+            }
+            for question_analysis in analyses
+        ]
+    
+    async def create_pending_analysis(
+        self,
+        question_text: str,
+        user_id: str,
+        db: AsyncSession,
+        document_id: Optional[str] = None
+    ) -> QuestionAnalysis:
+        """
+        Create a pending analysis record to be completed by a background worker
+        
+        Args:
+            question_text: The question to analyze
+            user_id: User ID requesting the analysis
+            db: Database session
+            document_id: Optional document ID if question is from a document
             
-            # Set analysis result as JSON
-            question_analysis.set_analysis_result({
-                "answer_approach": analysis_result.answer_approach,
-                "key_points": analysis_result.key_points,
-                "metadata": metadata
-            })
-            
-            # Set relevant laws
-            question_analysis.relevant_laws = analysis_result.relevant_laws
+        Returns:
+            The persisted pending analysis record
+        """
+        question_analysis = QuestionAnalysis(
+            user_id=uuid.UUID(user_id),
+            document_id=uuid.UUID(document_id) if document_id else None,
+            question_text=question_text,
+            status="pending"
+        )
+        db.add(question_analysis)
+        await db.commit()
+        
+        logger.info("Queued analysis %s for user %s", question_analysis.id, user_id)
+        return question_analysis
+    
+    async def bulk_insert_analyses(self, rows: List[Dict[str, Any]], db: AsyncSession) -> int:
+        """
+        Insert many analysis records in one statement
+        
+        Passing a list of parameter dicts to insert() uses SQLAlchemy's bulk
+        "insertmanyvalues" path, which batches rows into multi-VALUES INSERTs
+        instead of flushing one ORM object at a time. Large batches on PostgreSQL
+        are streamed with the COPY protocol instead, skipping statement parsing
+        and parameter binding per row.
+        
+        Args:
+            rows: Column values per analysis (user_id and question_text required)
+            db: Database session
             
-            # Set legal concepts
-            legal_concepts_list = []
-            for concept in analysis_result.legal_concepts:
-                legal_concepts_list.append({
-                    "concept": concept.get("concept", ""),
-                    "description": concept.get("description", ""),
-                    "importance": concept.get("importance", "中等")
-                })
-            question_analysis.legal_concepts = legal_concepts_list
+        Returns:
+            Number of rows inserted
+        """
+        if not rows:
+            return 0
+        
+        # asyncpg has no binary COPY codec for pgvector, so rows with embeddings use INSERT
+        use_copy = len(rows) >= COPY_MIN_ROWS and all(row.get("embedding") is None for row in rows)
+        
+        connection = await db.connection()
+        if connection.dialect.name == "postgresql" and use_copy:
+            await self._copy_analyses(rows, connection)
+        else:
+            await db.execute(insert(QuestionAnalysis), rows)
+        await db.commit()
+        
+        logger.info("Bulk inserted %s analyses", len(rows))
+        return len(rows)
+    
+    async def _copy_analyses(self, rows: List[Dict[str, Any]], connection: AsyncConnection):
+        """Stream rows into question_analyses with asyncpg's binary COPY (in the session's transaction)"""
+        columns = [
+            column for column in _INSERT_COLUMNS
+            if column.default is not None or any(column.key in row for row in rows)
+        ]
+        records = [tuple(_copy_value(column, row) for column in columns) for row in rows]
+        
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            QuestionAnalysis.__tablename__,
+            records=records,
+            columns=[column.name for column in columns]
+        )
+    
+    async def complete_pending_analysis(
+        self,
+        analysis_id: str,
+        db: AsyncSession,
+        context: Optional[str] = None,
+        question_type_hint: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Run the AI analysis for a record created by create_pending_analysis
+        
+        The record is claimed by moving it from pending to processing. Tasks are
+        acknowledged late, so a worker that dies mid-analysis gets its task
+        redelivered; a processing record older than
+        ANALYSIS_PROCESSING_TIMEOUT_SECONDS is treated as orphaned and reclaimed
+        instead of being left stuck.
+        
+        Args:
+            analysis_id: ID of the pending analysis
+            db: Database session
+            context: Additional context
+            question_type_hint: Hint about question type
             
-            # Set key points
-            question_analysis.key_points = analysis_result.key_points
+        Returns:
+            Analysis result dictionary, or None if the record is missing, finished
+            or still being processed by another worker
+        """
+        analysis_uuid = uuid.UUID(analysis_id)
+        stale_before = datetime.now(timezone.utc) - timedelta(
+            seconds=settings.analysis_processing_timeout_seconds
+        )
+        # Conditional UPDATE so two deliveries of the same task cannot both claim it
+        claimed = await db.execute(
+            update(QuestionAnalysis)
+            .where(
+                QuestionAnalysis.id == analysis_uuid,
+                or_(
+                    QuestionAnalysis.status == "pending",
+                    and_(
+                        QuestionAnalysis.status == "processing",
+                        QuestionAnalysis.updated_at < stale_before
+                    )
+                )
+            )
+            .values(status="processing")
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+        if claimed.rowcount == 0:
+            logger.warning("Analysis %s is not pending, skipping", analysis_id)
+            return None
+        
+        question_analysis = await db.get(QuestionAnalysis, analysis_uuid, populate_existing=True)
+        return await self._run_analysis(question_analysis, db, context, question_type_hint)
+    
+    async def mark_analysis_failed(self, analysis_id: str, db: AsyncSession):
+        """Mark an analysis as failed after an unrecoverable error"""
+        question_analysis = await db.get(QuestionAnalysis, uuid.UUID(analysis_id))
+        if question_analysis:
+            question_analysis.status = "failed"
+            await db.commit()
+    
+    async def _run_analysis(
+        self,
+        question_analysis: QuestionAnalysis,
+        db: AsyncSession,
+        context: Optional[str] = None,
+        question_type_hint: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Fill in an analysis record with AI results, falling back to basic classification"""
+        try:
+            # Check if LLM service is available
+            if not self.llm_service.is_available():
+                logger.warning("LLM service not available, using fallback analysis")
+                return await self._fallback_analysis(question_analysis, db)
             
-            # Save to database
-            db.add(question_analysis)
-            db.commit()
-            db.refresh(question_analysis)
+            # Perform AI analysis (or reuse the result for a paraphrased question)
+            analysis_result, metadata, embedding = await self._analyze_with_cache(
+                question_analysis.question_text, context, question_type_hint
+            )
             
             # Enhance with additional analysis
-            await self._enhance_analysis(question_analysis, db)
+            similar_questions, practice_materials = await self._enhance_analysis(
+                question_analysis, analysis_result.question_type, db, embedding
+            )
+            
+            # Fill in the database record
+            legal_concepts_list = self.apply_analysis_result(
+                question_analysis, analysis_result, metadata
+            )
+            question_analysis.embedding = embedding
+            question_analysis.similar_questions = similar_questions
+            question_analysis.practice_materials = practice_materials
             
-            logger.info(f"Analysis completed for question ID: {question_analysis.id}")
+            # Save to database in a single commit
+            db.add(question_analysis)
+            await db.commit()
+            await db.refresh(question_analysis)
+            
+            logger.info("Analysis completed for question ID: %s", question_analysis.id)
             
             return {
                 "analysis_id": str(question_analysis.id),
+                "status": question_analysis.status,
                 "question_type": analysis_result.question_type,
                 "difficulty_level": analysis_result.difficulty_level,
                 "confidence_score": analysis_result.confidence_score,
@@ -127,51 +422,120 @@ class AnalysisService:
             }
             
         except Exception as e:
-            logger.error(f"Analysis failed for user {user_id}: {e}")
+            logger.error("Analysis failed for user %s: %s", question_analysis.user_id, e)
             # Rollback transaction
-            db.rollback()
+            await db.rollback()
+            
+            # A queued record is already persisted; reload it after the rollback
+            if inspect(question_analysis).persistent:
+                await db.refresh(question_analysis)
             
             # Return fallback analysis
-            return await self._fallback_analysis(
-                question_text, user_id, db, document_id
-            )
+            return await self._fallback_analysis(question_analysis, db)
     
-    async def _fallback_analysis(
+    def apply_analysis_result(
+        self,
+        question_analysis: QuestionAnalysis,
+        analysis_result: LegalAnalysisResult,
+        metadata: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        """
+        Copy an LLM analysis onto its record and mark it completed (no commit)
+        
+        Returns:
+            The normalized legal concepts stored on the record
+        """
+        question_analysis.question_type = analysis_result.question_type
+        # The column is an enum; anything the model invents outside it is stored as unknown
+        question_analysis.question_difficulty = (
+            analysis_result.difficulty_level
+            if analysis_result.difficulty_level in DIFFICULTY_LEVELS else None
+        )
+        question_analysis.confidence_score = analysis_result.confidence_score
+        question_analysis.study_suggestions = analysis_result.study_suggestions
+        question_analysis.ai_model_used = metadata.get("model_used")
+        question_analysis.processing_time_ms = metadata.get("processing_time_ms")
+        
+        # Set analysis result as JSON
+        question_analysis.set_analysis_result({
+            "answer_approach": analysis_result.answer_approach,
+            "key_points": analysis_result.key_points,
+            "metadata": metadata
+        })
+        
+        # Set relevant laws
+        question_analysis.relevant_laws = analysis_result.relevant_laws
+        
+        # Set legal concepts
+        legal_concepts_list = []
+        for concept in analysis_result.legal_concepts:
+            legal_concepts_list.append({
+                "concept": concept.get("concept", ""),
+                "description": concept.get("description", ""),
+                "importance": concept.get("importance", "中等")
+            })
+        question_analysis.legal_concepts = legal_concepts_list
+        
+        # Set key points
+        question_analysis.key_points = analysis_result.key_points
+        question_analysis.status = "completed"
+        
+        return legal_concepts_list
+    
+    async def _analyze_with_cache(
         self,
         question_text: str,
-        user_id: str,
-        db: Session,
-        document_id: Optional[str] = None
+        context: Optional[str],
+        question_type_hint: Optional[str]
+    ) -> Tuple[LegalAnalysisResult, Dict[str, Any], Optional[np.ndarray]]:
+        """
+        Run the LLM analysis unless the semantic cache has a close enough match
+        
+        Returns:
+            Tuple of (analysis_result, metadata, embedding); the question embedding is
+            also stored on the record for similar-question search, and is None when
+            embeddings are unavailable
+        """
+        vector = await semantic_cache.embed(question_text)
+        if vector is not None:
+            cached = semantic_cache.get(vector, question_type_hint, context)
+            if cached:
+                return (*cached, vector)
+        
+        analysis_result, metadata = await self.llm_service.analyze_legal_question(
+            question_text=question_text,
+            context=context,
+            question_type_hint=question_type_hint
+        )
+        
+        # Fallback results from a failed LLM call must not be served to later questions
+        if vector is not None and metadata.get("success"):
+            semantic_cache.put(vector, analysis_result, metadata, question_type_hint, context)
+        
+        return analysis_result, metadata, vector
+    
+    async def _fallback_analysis(
+        self,
+        question_analysis: QuestionAnalysis,
+        db: AsyncSession
     ) -> Dict[str, Any]:
         """Fallback analysis when AI service is unavailable"""
+        question_text = question_analysis.question_text
         
         # Basic pattern matching for question types
         question_type = self._classify_question_basic(question_text)
         difficulty = self._estimate_difficulty_basic(question_text)
         
-        # Create minimal analysis record
-        question_analysis = QuestionAnalysis(
-            user_id=user_id,
-            document_id=document_id,
-            question_text=question_text,
-            question_type=question_type,
-            question_difficulty=difficulty,
-            confidence_score=0.3,  # Low confidence for fallback
-            study_suggestions="請諮詢法律專家或使用完整AI分析功能",
-            ai_model_used="fallback_classifier"
-        )
-        
-        question_analysis.set_analysis_result({
-            "method": "fallback",
-            "note": "AI服務暫時不可用，使用基礎分類"
-        })
+        # Fill in a minimal analysis record
+        self._apply_fallback_result(question_analysis, question_type, difficulty)
         
         db.add(question_analysis)
-        db.commit()
-        db.refresh(question_analysis)
+        await db.commit()
+        await db.refresh(question_analysis)
         
         return {
             "analysis_id": str(question_analysis.id),
+            "status": question_analysis.status,
             "question_type": question_type,
             "difficulty_level": difficulty,
             "confidence_score": 0.3,
@@ -184,17 +548,42 @@ class AnalysisService:
             "created_at": question_analysis.created_at.isoformat()
         }
     
+    def _apply_fallback_result(
+        self,
+        question_analysis: QuestionAnalysis,
+        question_type: str,
+        difficulty: str
+    ):
+        """Fill in a record from the basic classifier and mark it completed (no commit)"""
+        question_analysis.question_type = question_type
+        question_analysis.question_difficulty = difficulty
+        question_analysis.confidence_score = 0.3  # Low confidence for fallback
+        question_analysis.study_suggestions = "請諮詢法律專家或使用完整AI分析功能"
+        question_analysis.ai_model_used = "fallback_classifier"
+        question_analysis.status = "completed"
+        
+        question_analysis.set_analysis_result({
+            "method": "fallback",
+            "note": "AI服務暫時不可用，使用基礎分類"
+        })
+    
     def _classify_question_basic(self, question_text: str) -> str:
         """Basic question type classification using pattern matching"""
-        text_lower = question_text.lower()
-        
-        if any(keyword in text_lower for keyword in ["選擇", "下列", "何者", "哪個"]):
-            return "選擇題"
-        elif any(keyword in text_lower for keyword in ["說明", "解釋", "論述", "分析"]):
-            return "申論題"
-        elif any(keyword in text_lower for keyword in ["案例", "事實", "情況", "甲乙"]):
-            return "案例分析"
-        elif "?" in question_text or "？" in question_text:
+        # The cues are CJK, so no case folding is needed
+        if self._question_type_automaton is not None:
+            # One pass over the text for every cue; the highest-priority match wins
+            priority = min(
+                (priority for _, priority in self._question_type_automaton.iter(question_text)),
+                default=None
+            )
+            if priority is not None:
+                return QUESTION_TYPE_KEYWORDS[priority][0]
+        else:
+            for question_type, keywords in QUESTION_TYPE_KEYWORDS:
+                if any(keyword in question_text for keyword in keywords):
+                    return question_type
+        
+        if "?" in question_text or "？" in question_text:
             return "問答題"
         else:
             return "未分類"
@@ -211,238 +600,315 @@ class AnalysisService:
         else:
             return "高級"
     
-    async def _enhance_analysis(self, question_analysis: QuestionAnalysis, db: Session):
-        """Enhance analysis with additional data"""
+    async def _enhance_analysis(
+        self,
+        question_analysis: QuestionAnalysis,
+        question_type: str,
+        db: AsyncSession,
+        embedding: Optional[np.ndarray] = None
+    ) -> Tuple[Optional[List[Dict[str, Any]]], Optional[List[Dict[str, Any]]]]:
+        """
+        Look up similar questions and relevant articles for an analysis (no commit)
+        
+        The two lookups are independent, so each runs in its own short-lived
+        session and their round trips overlap. That also keeps them out of the
+        caller's transaction: a failed lookup only costs the enhancements.
+        
+        Returns:
+            Tuple of (similar_questions, practice_materials), each None if nothing was found
+        """
+        async def find_similar():
+            async with AsyncSessionLocal() as session:
+                return await self._find_similar_analyses(
+                    question_analysis, question_type, session, embedding=embedding
+                )
+        
+        async def find_articles():
+            async with AsyncSessionLocal() as session:
+                return await self._find_relevant_articles(question_analysis.question_text, session)
+        
         try:
-            # Find similar questions in database
-            similar_analyses = await self._find_similar_analyses(
-                question_analysis, db
-            )
-            
-            if similar_analyses:
-                question_analysis.similar_questions = [
-                    {
-                        "id": str(analysis.id),
-                        "question_text": analysis.question_text[:100] + "...",
-                        "question_type": analysis.question_type,
-                        "similarity_score": 0.7  # Placeholder
-                    }
-                    for analysis in similar_analyses[:3]
-                ]
-            
-            # Find relevant legal articles
-            relevant_articles = await self._find_relevant_articles(
-                question_analysis.question_text, db
-            )
-            
-            if relevant_articles:
-                question_analysis.practice_materials = [
-                    {
-                        "title": article.title,
-                        "law_name": article.law_name,
-                        "article_number": article.article_number,
-                        "relevance": "high"
-                    }
-                    for article in relevant_articles[:5]
-                ]
-            
-            db.commit()
-            
+            if db.bind.dialect.name == "sqlite":
+                # The SQLite engine shares one connection (StaticPool), which cannot overlap queries
+                similar_analyses = await find_similar()
+                relevant_articles = await find_articles()
+            else:
+                similar_analyses, relevant_articles = await asyncio.gather(
+                    find_similar(), find_articles()
+                )
         except Exception as e:
-            logger.warning(f"Failed to enhance analysis: {e}")
+            logger.warning("Failed to enhance analysis: %s", e)
+            return None, None
+        
+        similar_questions = [
+            {
+                "id": str(analysis.id),
+                "question_text": analysis.question_text[:100] + "...",
+                "question_type": analysis.question_type,
+                "similarity_score": round(analysis.similarity, 4)
+            }
+            for analysis in similar_analyses[:3]
+        ]
+        practice_materials = [
+            {
+                "title": article.article_title,
+                "law_name": article.law_name,
+                "article_number": article.article_number,
+                "relevance": "high"
+            }
+            for article in relevant_articles[:5]
+        ]
+        return similar_questions or None, practice_materials or None
     
     async def _find_similar_analyses(
         self,
         target_analysis: QuestionAnalysis,
-        db: Session,
-        limit: int = 5
-    ) -> List[QuestionAnalysis]:
-        """Find similar question analyses"""
-        try:
-            # Simple similarity based on question type and concepts
-            similar_analyses = db.query(QuestionAnalysis).filter(
+        question_type: str,
+        db: AsyncSession,
+        limit: int = 5,
+        embedding: Optional[np.ndarray] = None
+    ) -> List[Row]:
+        """
+        Find similar question analyses (as lightweight rows, not ORM instances)
+        
+        With the question's embedding on PostgreSQL this is a top-k lookup on the
+        HNSW index with real cosine similarities; otherwise analyses of the same
+        type are returned with a nominal similarity.
+        """
+        columns = (QuestionAnalysis.id, QuestionAnalysis.question_text, QuestionAnalysis.question_type)
+        if embedding is not None and db.bind.dialect.name == "postgresql":
+            distance = QuestionAnalysis.embedding.op("<=>", return_type=Float)(embedding)
+            result = await db.execute(
+                select(*columns, (1 - distance).label("similarity"))
+                .where(
+                    QuestionAnalysis.id != target_analysis.id,
+                    QuestionAnalysis.embedding.isnot(None)
+                )
+                .order_by(distance)
+                .limit(limit)
+            )
+            return list(result.all())
+        
+        # Simple similarity based on question type and concepts
+        result = await db.execute(
+            select(*columns, literal(0.7).label("similarity")).where(
                 and_(
                     QuestionAnalysis.id != target_analysis.id,
-                    QuestionAnalysis.question_type == target_analysis.question_type,
+                    QuestionAnalysis.question_type == question_type,
                     QuestionAnalysis.confidence_score > 0.5
                 )
-            ).limit(limit).all()
-            
-            return similar_analyses
-            
-        except Exception as e:
-            logger.error(f"Error finding similar analyses: {e}")
-            return []
+            ).limit(limit)
+        )
+        
+        return list(result.all())
     
     async def _find_relevant_articles(
         self,
         question_text: str,
-        db: Session,
+        db: AsyncSession,
         limit: int = 5
-    ) -> List[LegalArticle]:
-        """Find relevant legal articles"""
-        try:
-            # Simple keyword matching for now
-            # In production, this would use vector similarity
-            keywords = self._extract_keywords(question_text)
-            
-            if not keywords:
-                return []
-            
-            # Query legal articles containing keywords
-            articles = []
-            for keyword in keywords[:3]:  # Use top 3 keywords
-                found_articles = db.query(LegalArticle).filter(
-                    LegalArticle.content.ilike(f"%{keyword}%")
-                ).limit(limit).all()
-                articles.extend(found_articles)
-            
-            # Remove duplicates
-            unique_articles = list({article.id: article for article in articles}.values())
-            return unique_articles[:limit]
-            
-        except Exception as e:
-            logger.error(f"Error finding relevant articles: {e}")
+    ) -> List[Row]:
+        """Find relevant legal articles (citation columns only, as lightweight rows)"""
+        # Simple keyword matching for now
+        # In production, this would use vector similarity
+        keywords = self._extract_keywords(question_text)[:3]  # Use top 3 keywords
+        
+        if not keywords:
             return []
+        
+        # One query for all keywords; on PostgreSQL the trigram index on
+        # article_content serves the substring matches. Only the citation
+        # columns are used, so leave the large body unloaded.
+        result = await db.execute(
+            select(
+                LegalArticle.id,
+                LegalArticle.law_name,
+                LegalArticle.article_number,
+                LegalArticle.article_title
+            ).where(
+                or_(*(
+                    LegalArticle.article_content.ilike(f"%{keyword}%")
+                    for keyword in keywords
+                ))
+            ).limit(limit)
+        )
+        
+        return list(result.all())
     
     def _extract_keywords(self, text: str) -> List[str]:
-        """Extract keywords from text (simplified version)"""
-        # Legal keywords commonly found in Taiwan law
-        legal_keywords = [
-            "契約", "財產", "損害", "責任", "權利", "義務", "法律", "條文",
-            "民法", "刑法", "商業", "公司", "消費者", "保護", "管理", "條例"
-        ]
+        """Extract keywords from text (simplified version), in LEGAL_KEYWORDS order"""
+        if self._keyword_automaton is None:
+            return [keyword for keyword in LEGAL_KEYWORDS if keyword in text]
         
-        found_keywords = []
-        for keyword in legal_keywords:
-            if keyword in text:
-                found_keywords.append(keyword)
-        
-        return found_keywords
+        # One pass over the text for all keywords, overlapping matches included
+        found = {keyword for _, keyword in self._keyword_automaton.iter(text)}
+        return [keyword for keyword in LEGAL_KEYWORDS if keyword in found]
     
-    def get_analysis(
+    async def get_analysis(
         self,
         analysis_id: str,
         user_id: str,
-        db: Session
+        db: AsyncSession
     ) -> Optional[QuestionAnalysis]:
         """Get analysis by ID"""
         try:
-            analysis = db.query(QuestionAnalysis).filter(
-                and_(
-                    QuestionAnalysis.id == analysis_id,
-                    QuestionAnalysis.user_id == user_id
+            result = await db.execute(
+                select(QuestionAnalysis).where(
+                    and_(
+                        QuestionAnalysis.id == as_uuid(analysis_id),
+                        QuestionAnalysis.user_id == as_uuid(user_id)
+                    )
                 )
-            ).first()
+            )
             
-            return analysis
+            return result.scalar_one_or_none()
             
         except Exception as e:
-            logger.error(f"Error retrieving analysis {analysis_id}: {e}")
+            logger.error("Error retrieving analysis %s: %s", analysis_id, e)
             return None
     
-    def get_user_analyses(
+    async def get_user_analyses(
         self,
         user_id: str,
-        db: Session,
+        db: AsyncSession,
         limit: int = 20,
         offset: int = 0,
-        question_type_filter: Optional[str] = None
-    ) -> List[QuestionAnalysis]:
-        """Get user's question analyses with pagination"""
+        question_type_filter: Optional[str] = None,
+        cursor: Optional[Cursor] = None
+    ) -> List[Row]:
+        """
+        Get user's question analyses with pagination, as plain rows (no ORM objects)
+        
+        When a cursor (created_at, id of the previous page's last row) is given,
+        rows after it are returned by keyset seek and offset is ignored.
+        """
         try:
-            query = db.query(QuestionAnalysis).filter(
-                QuestionAnalysis.user_id == user_id
+            query = select(*QuestionAnalysis.__table__.columns).where(
+                *self._user_analyses_filter(user_id, question_type_filter)
             )
             
-            if question_type_filter:
-                query = query.filter(
-                    QuestionAnalysis.question_type == question_type_filter
+            if cursor:
+                query = query.where(
+                    tuple_(QuestionAnalysis.created_at, QuestionAnalysis.id) < tuple_(*cursor)
                 )
+            else:
+                query = query.offset(offset)
+            
+            result = await db.execute(
+                query.order_by(
+                    QuestionAnalysis.created_at.desc(),
+                    QuestionAnalysis.id.desc()
+                ).limit(limit)
+            )
             
-            analyses = query.order_by(
-                QuestionAnalysis.created_at.desc()
-            ).offset(offset).limit(limit).all()
-            
-            return analyses
+            return list(result.all())
             
         except Exception as e:
-            logger.error(f"Error retrieving user analyses: {e}")
+            logger.error("Error retrieving user analyses: %s", e)
             return []
     
+    async def count_user_analyses(
+        self,
+        user_id: str,
+        db: AsyncSession,
+        question_type_filter: Optional[str] = None
+    ) -> int:
+        """Count user's question analyses matching the list filters"""
+        try:
+            total = await db.scalar(
+                select(func.count(QuestionAnalysis.id)).where(
+                    *self._user_analyses_filter(user_id, question_type_filter)
+                )
+            )
+            return total or 0
+            
+        except Exception as e:
+            logger.error("Error counting user analyses: %s", e)
+            return 0
+    
+    def _user_analyses_filter(self, user_id: str, question_type_filter: Optional[str]) -> list:
+        """Build the WHERE clauses shared by listing and counting analyses"""
+        conditions = [QuestionAnalysis.user_id == as_uuid(user_id)]
+        if question_type_filter:
+            conditions.append(QuestionAnalysis.question_type == question_type_filter)
+        return conditions
+    
     async def rate_analysis(
         self,
         analysis_id: str,
         user_id: str,
         rating: float,
         feedback: Optional[str],
-        db: Session
+        db: AsyncSession
     ) -> bool:
         """Rate an analysis result"""
         try:
-            analysis = self.get_analysis(analysis_id, user_id, db)
+            # Single UPDATE ... RETURNING instead of SELECT then UPDATE
+            result = await db.execute(
+                update(QuestionAnalysis)
+                .where(
+                    QuestionAnalysis.id == as_uuid(analysis_id),
+                    QuestionAnalysis.user_id == as_uuid(user_id)
+                )
+                .values(
+                    user_rating=rating,
+                    user_feedback=feedback
+                )
+                .returning(QuestionAnalysis.id)
+            )
             
-            if not analysis:
+            if result.scalar_one_or_none() is None:
                 return False
             
-            analysis.user_rating = rating
-            analysis.user_feedback = feedback
-            analysis.updated_at = datetime.utcnow()
+            await db.commit()
             
-            db.commit()
-            
-            logger.info(f"Analysis {analysis_id} rated {rating}/5 by user {user_id}")
+            logger.info("Analysis %s rated %s/5 by user %s", analysis_id, rating, user_id)
             return True
             
         except Exception as e:
-            logger.error(f"Error rating analysis {analysis_id}: {e}")
-            db.rollback()
+            logger.error("Error rating analysis %s: %s", analysis_id, e)
+            await db.rollback()
             return False
     
-    def get_analysis_stats(self, user_id: str, db: Session) -> Dict[str, Any]:
-        """Get analysis statistics for user"""
+    async def get_analysis_stats(self, user_id: str, db: AsyncSession) -> Dict[str, Any]:
+        """
+        Get analysis statistics for user
+        
+        One pass over the user's analyses: per-type counts, confidence sums and
+        recent-activity counts come back in a single grouped query (one row per
+        question type) and are rolled up here.
+        """
         try:
-            total_analyses = db.query(QuestionAnalysis).filter(
-                QuestionAnalysis.user_id == user_id
-            ).count()
-            
-            # Group by question type
-            type_stats = db.query(
-                QuestionAnalysis.question_type,
-                db.func.count(QuestionAnalysis.id).label('count')
-            ).filter(
-                QuestionAnalysis.user_id == user_id
-            ).group_by(QuestionAnalysis.question_type).all()
-            
-            # Average confidence score
-            avg_confidence = db.query(
-                db.func.avg(QuestionAnalysis.confidence_score)
-            ).filter(
-                QuestionAnalysis.user_id == user_id
-            ).scalar()
-            
-            # Recent activity (last 7 days)
-            from datetime import timedelta
-            week_ago = datetime.utcnow() - timedelta(days=7)
-            recent_analyses = db.query(QuestionAnalysis).filter(
-                and_(
-                    QuestionAnalysis.user_id == user_id,
-                    QuestionAnalysis.created_at >= week_ago
-                )
-            ).count()
+            week_ago = datetime.now(timezone.utc) - timedelta(days=7)
+            # Pending, queued and batched analyses have no type yet; JSON keys must be strings
+            question_type = func.coalesce(QuestionAnalysis.question_type, "未分類").label("question_type")
+            type_stats = (await db.execute(
+                select(
+                    question_type,
+                    func.count().label("count"),
+                    func.sum(QuestionAnalysis.confidence_score).label("confidence_sum"),
+                    func.count(QuestionAnalysis.confidence_score).label("confidence_count"),
+                    func.count().filter(QuestionAnalysis.created_at >= week_ago).label("recent")
+                ).where(
+                    QuestionAnalysis.user_id == as_uuid(user_id)
+                ).group_by(question_type)
+            )).all()
+            
+            confidence_count = sum(row.confidence_count for row in type_stats)
+            confidence_sum = sum(row.confidence_sum or 0.0 for row in type_stats)
             
             return {
-                "total_analyses": total_analyses,
+                "total_analyses": sum(row.count for row in type_stats),
                 "question_type_breakdown": {
                     row.question_type: row.count for row in type_stats
                 },
-                "average_confidence": float(avg_confidence) if avg_confidence else 0.0,
-                "recent_activity": recent_analyses,
+                "average_confidence": confidence_sum / confidence_count if confidence_count else 0.0,
+                "recent_activity": sum(row.recent for row in type_stats),
                 "last_analysis": None  # Would add timestamp of last analysis
             }
             
         except Exception as e:
-            logger.error(f"Error getting analysis stats for user {user_id}: {e}")
+            logger.error("Error getting analysis stats for user %s: %s", user_id, e)
             return {
                 "total_analyses": 0,
                 "question_type_breakdown": {},
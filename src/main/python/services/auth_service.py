@@ -1,28 +1,69 @@
 """
 Authentication service for user registration, login, and JWT token management
 """
+import asyncio
+import hashlib
+import hmac
 import logging
+import time
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any
+from functools import lru_cache
+from typing import Optional, Dict, Any, Tuple
 import uuid
 
 from fastapi import HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import JWTError, jwt
+from jose import JWTError, jwk, jwt
+from jose.backends.base import Key
 from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy import exists, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..core.config import settings
+from ..core.database import cache_delete, cache_get, cache_set
 from ..models.user import User
+from ..utils.ttl_cache import TTLCache
 
 logger = logging.getLogger(__name__)
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing context: new hashes use the configured scheme (argon2id by
+# default); hashes in the other scheme still verify and are marked for upgrade
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    default=settings.password_hash_scheme,
+    deprecated="auto",
+    argon2__type="ID",
+    argon2__time_cost=settings.argon2_time_cost,
+    argon2__memory_cost=settings.argon2_memory_cost_kib,
+    argon2__parallelism=1,
+    bcrypt__rounds=settings.bcrypt_rounds
+)
+
+# last_login_at is refreshed only when older than this
+LAST_LOGIN_UPDATE_INTERVAL = timedelta(minutes=5)
 
 # HTTP Bearer token scheme
 security = HTTPBearer()
 
+# User columns cached per token (never includes the password hash)
+_CACHED_USER_FIELDS = (
+    "id", "email", "full_name", "subscription_type", "is_active", "is_admin",
+    "created_at", "updated_at", "last_login_at"
+)
+_CACHED_USER_DATETIME_FIELDS = ("created_at", "updated_at", "last_login_at")
+
+
+@lru_cache(maxsize=10000)
+def _decode_token_claims(token: str, signing_key: Key, algorithm: str) -> Tuple[Optional[str], int]:
+    """
+    Verify a JWT signature once per process and keep only (sub, exp)
+    
+    Invalid tokens raise JWTError and are therefore never cached; expiry of
+    cached tokens must be checked by the caller.
+    """
+    payload = jwt.decode(token, signing_key, algorithms=[algorithm])
+    return payload.get("sub"), payload.get("exp", 0)
+
 
 class AuthService:
     """Authentication service for handling user authentication and authorization"""
@@ -31,7 +72,17 @@ class AuthService:
         self.pwd_context = pwd_context
         self.secret_key = settings.secret_key
         self.algorithm = settings.algorithm
+        # Built once: given a plain secret, jose re-parses it into a key object on every encode/decode
+        self._signing_key = jwk.construct(self.secret_key, self.algorithm)
         self.access_token_expire_minutes = settings.access_token_expire_minutes
+        # Recently verified logins: HMAC of the credentials and stored hash -> True
+        self._verified_passwords: TTLCache[bool] = TTLCache(
+            maxsize=10000, ttl_seconds=settings.password_cache_ttl_seconds
+        )
+        # Per-process first level in front of the Redis user cache: token -> user columns
+        self._token_users: TTLCache[Dict[str, Any]] = TTLCache(
+            maxsize=10000, ttl_seconds=settings.auth_user_cache_ttl_seconds
+        )
     
     def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         """
@@ -47,7 +98,7 @@ class AuthService:
         try:
             return self.pwd_context.verify(plain_password, hashed_password)
         except Exception as e:
-            logger.error(f"Password verification error: {e}")
+            logger.error("Password verification error: %s", e)
             return False
     
     def get_password_hash(self, password: str) -> str:
@@ -63,7 +114,7 @@ class AuthService:
         try:
             return self.pwd_context.hash(password)
         except Exception as e:
-            logger.error(f"Password hashing error: {e}")
+            logger.error("Password hashing error: %s", e)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Error processing password"
@@ -90,10 +141,10 @@ class AuthService:
         to_encode.update({"exp": expire})
         
         try:
-            encoded_jwt = jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
+            encoded_jwt = jwt.encode(to_encode, self._signing_key, algorithm=self.algorithm)
             return encoded_jwt
         except Exception as e:
-            logger.error(f"Token creation error: {e}")
+            logger.error("Token creation error: %s", e)
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Error creating access token"
@@ -113,17 +164,50 @@ class AuthService:
             HTTPException: If token is invalid or expired
         """
         try:
-            payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+            payload = jwt.decode(token, self._signing_key, algorithms=[self.algorithm])
             return payload
         except JWTError as e:
-            logger.error(f"Token verification error: {e}")
+            logger.error("Token verification error: %s", e)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Could not validate credentials",
                 headers={"WWW-Authenticate": "Bearer"}
             )
     
-    def get_user_by_email(self, db: Session, email: str) -> Optional[User]:
+    def verify_token_claims(self, token: str) -> Tuple[Optional[str], int]:
+        """
+        Verify a JWT token, reusing the signature check for tokens seen before
+        
+        Args:
+            token: JWT token to verify
+            
+        Returns:
+            Tuple[Optional[str], int]: (subject user ID, expiry timestamp)
+            
+        Raises:
+            HTTPException: If token is invalid or expired
+        """
+        try:
+            user_id, expires_at = _decode_token_claims(token, self._signing_key, self.algorithm)
+        except JWTError as e:
+            logger.error("Token verification error: %s", e)
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"}
+            )
+        
+        # The decode result may be cached, so expiry is re-checked on every call
+        if expires_at and expires_at <= time.time():
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Could not validate credentials",
+                headers={"WWW-Authenticate": "Bearer"}
+            )
+        
+        return user_id, expires_at
+    
+    async def get_user_by_email(self, db: AsyncSession, email: str) -> Optional[User]:
         """
         Get user by email address
         
@@ -135,12 +219,22 @@ class AuthService:
             Optional[User]: User object if found, None otherwise
         """
         try:
-            return db.query(User).filter(User.email == email).first()
+            result = await db.execute(select(User).where(User.email == email))
+            return result.scalar_one_or_none()
         except Exception as e:
-            logger.error(f"Database error getting user by email: {e}")
+            logger.error("Database error getting user by email: %s", e)
             return None
     
-    def get_user_by_id(self, db: Session, user_id: str) -> Optional[User]:
+    async def email_exists(self, db: AsyncSession, email: str) -> bool:
+        """
+        Check whether an account is registered under an email address
+        
+        An EXISTS probe on the unique email index; unlike get_user_by_email no
+        row is fetched or turned into an ORM object.
+        """
+        return bool(await db.scalar(select(exists().where(User.email == email))))
+    
+    async def get_user_by_id(self, db: AsyncSession, user_id: str) -> Optional[User]:
         """
         Get user by ID
         
@@ -153,12 +247,12 @@ class AuthService:
         """
         try:
             user_uuid = uuid.UUID(user_id)
-            return db.query(User).filter(User.id == user_uuid).first()
+            return await db.get(User, user_uuid)
         except (ValueError, Exception) as e:
-            logger.error(f"Error getting user by ID: {e}")
+            logger.error("Error getting user by ID: %s", e)
             return None
     
-    def authenticate_user(self, db: Session, email: str, password: str) -> Optional[User]:
+    async def authenticate_user(self, db: AsyncSession, email: str, password: str) -> Optional[User]:
         """
         Authenticate user with email and password
         
@@ -170,31 +264,69 @@ class AuthService:
         Returns:
             Optional[User]: User object if authentication successful, None otherwise
         """
-        user = self.get_user_by_email(db, email)
+        user = await self.get_user_by_email(db, email)
         if not user:
-            logger.warning(f"Authentication failed: user not found for email {email}")
+            logger.warning("Authentication failed: user not found for email %s", email)
             return None
         
         if not user.is_active:
-            logger.warning(f"Authentication failed: user account inactive for email {email}")
+            logger.warning("Authentication failed: user account inactive for email %s", email)
             return None
         
-        if not self.verify_password(password, user.hashed_password):
-            logger.warning(f"Authentication failed: invalid password for email {email}")
+        if not await self._verify_password_cached(email, password, user.hashed_password):
+            logger.warning("Authentication failed: invalid password for email %s", email)
             return None
         
-        # Update last login time
-        try:
-            user.last_login_at = datetime.utcnow()
-            db.commit()
-            logger.info(f"User {email} authenticated successfully")
-        except Exception as e:
-            logger.error(f"Error updating last login time: {e}")
-            db.rollback()
+        changed = False
+        
+        # Move legacy or weaker hashes to the current scheme while the password is at hand
+        if self.pwd_context.needs_update(user.hashed_password):
+            user.hashed_password = await asyncio.to_thread(self.get_password_hash, password)
+            logger.info("Upgraded password hash for %s", email)
+            changed = True
+        
+        # Update last login time, at most once per interval so clients that log in
+        # repeatedly don't turn every login into a row write
+        now = datetime.utcnow()
+        if user.last_login_at is None or now - user.last_login_at >= LAST_LOGIN_UPDATE_INTERVAL:
+            user.last_login_at = now
+            changed = True
+        
+        if changed:
+            try:
+                await db.commit()
+            except Exception as e:
+                logger.error("Error updating last login time: %s", e)
+                await db.rollback()
         
+        logger.info("User %s authenticated successfully", email)
         return user
     
-    def create_user(self, db: Session, email: str, password: str, full_name: Optional[str] = None) -> User:
+    async def _verify_password_cached(self, email: str, password: str, hashed_password: str) -> bool:
+        """
+        Verify a password, skipping bcrypt for credentials verified moments ago
+        
+        Only successful checks are cached. The stored hash is part of the key, so
+        changing the password makes every earlier entry for the account unusable.
+        """
+        if settings.password_cache_ttl_seconds <= 0:
+            return await asyncio.to_thread(self.verify_password, password, hashed_password)
+        
+        cache_key = hmac.new(
+            self.secret_key.encode(),
+            "\0".join((email, password, hashed_password)).encode(),
+            hashlib.sha256
+        ).digest()
+        if self._verified_passwords.get(cache_key):
+            return True
+        
+        # bcrypt is deliberately slow; keep it off the event loop
+        verified = await asyncio.to_thread(self.verify_password, password, hashed_password)
+        if verified:
+            self._verified_passwords.set(cache_key, True)
+        return verified
+    
+    async def create_user(self, db: AsyncSession, email: str, password: str, full_name: Optional[str] = None) -> User:
         """
         Create a new user account
         
@@ -211,15 +343,14 @@ class AuthService:
             HTTPException: If user already exists or creation fails
         """
         # Check if user already exists
-        existing_user = self.get_user_by_email(db, email)
-        if existing_user:
+        if await self.email_exists(db, email):
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Email already registered"
             )
         
-        # Hash password
-        hashed_password = self.get_password_hash(password)
+        # Hash password in a worker thread so bcrypt doesn't block the event loop
+        hashed_password = await asyncio.to_thread(self.get_password_hash, password)
         
         # Create user
         user = User(
@@ -233,19 +364,19 @@ class AuthService:
         
         try:
             db.add(user)
-            db.commit()
-            db.refresh(user)
-            logger.info(f"New user created: {email}")
+            await db.commit()
+            await db.refresh(user)
+            logger.info("New user created: %s", email)
             return user
         except Exception as e:
-            logger.error(f"Error creating user: {e}")
-            db.rollback()
+            logger.error("Error creating user: %s", e)
+            await db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Error creating user account"
             )
     
-    def get_current_user(self, db: Session, credentials: HTTPAuthorizationCredentials) -> User:
+    async def get_current_user(self, db: AsyncSession, credentials: HTTPAuthorizationCredentials) -> User:
         """
         Get current user from JWT token
         
@@ -260,9 +391,21 @@ class AuthService:
             HTTPException: If token is invalid or user not found
         """
         token = credentials.credentials
-        payload = self.verify_token(token)
         
-        user_id = payload.get("sub")
+        # Signature checks are memoized per token, so this is cheap on repeat calls
+        # and keeps expiry authoritative even when the user comes from a cache
+        user_id, expires_at = self.verify_token_claims(token)
+        
+        local_user = self._token_users.get(token)
+        if local_user is not None:
+            return self._active_user(self._user_from_cache(local_user))
+        
+        cache_key = self._user_cache_key(token)
+        cached_user = await cache_get(cache_key)
+        if cached_user is not None:
+            self._token_users.set(token, cached_user)
+            return self._active_user(self._user_from_cache(cached_user))
+        
         if user_id is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -270,7 +413,7 @@ class AuthService:
                 headers={"WWW-Authenticate": "Bearer"}
             )
         
-        user = self.get_user_by_id(db, user_id)
+        user = await self.get_user_by_id(db, user_id)
         if user is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -278,15 +421,65 @@ class AuthService:
                 headers={"WWW-Authenticate": "Bearer"}
             )
         
+        self._active_user(user)
+        
+        # Keep entries short-lived so deactivation and permission changes made
+        # elsewhere take effect quickly, and never outlive the token
+        ttl_seconds = min(
+            settings.auth_user_redis_cache_ttl_seconds,
+            int(expires_at - time.time())
+        )
+        if ttl_seconds > 0:
+            cached_user = self._user_to_cache(user)
+            self._token_users.set(token, cached_user)
+            await cache_set(cache_key, cached_user, ttl_seconds)
+        
+        return user
+    
+    def _active_user(self, user: User) -> User:
+        """Reject inactive accounts, whether loaded or served from a cache"""
         if not user.is_active:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="User account is inactive",
                 headers={"WWW-Authenticate": "Bearer"}
             )
-        
         return user
     
+    async def invalidate_cached_user(self, token: str) -> None:
+        """
+        Drop the cached user for a token (e.g. on logout or profile change)
+        
+        Other processes may serve their first-level copy for up to
+        AUTH_USER_CACHE_TTL_SECONDS longer; the shared Redis entry lapses on
+        its own after AUTH_USER_REDIS_CACHE_TTL_SECONDS.
+        
+        Args:
+            token: JWT token whose cached user should be removed
+        """
+        self._token_users.pop(token)
+        await cache_delete(self._user_cache_key(token))
+    
+    def _user_cache_key(self, token: str) -> str:
+        """Build the Redis key for a token's cached user"""
+        return "auth:" + hashlib.sha256(token.encode()).hexdigest()
+    
+    def _user_to_cache(self, user: User) -> Dict[str, Any]:
+        """Serialize the cacheable user columns"""
+        data = {field: getattr(user, field) for field in _CACHED_USER_FIELDS}
+        data["id"] = str(user.id)
+        return data
+    
+    def _user_from_cache(self, data: Dict[str, Any]) -> User:
+        """Rebuild a detached, read-only User from cached columns (Redis or in-process)"""
+        data = dict(data)
+        data["id"] = uuid.UUID(data["id"])
+        for field in _CACHED_USER_DATETIME_FIELDS:
+            # Values read back from Redis are ISO strings; in-process copies are datetimes
+            if isinstance(data.get(field), str):
+                data[field] = datetime.fromisoformat(data[field])
+        return User(**data)
+    
     def require_admin(self, user: User) -> User:
         """
         Require that the user has admin privileges
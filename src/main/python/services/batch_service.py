@@ -0,0 +1,275 @@
+"""
+Batch analysis service submitting non-interactive questions to the OpenAI Batch API
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set
+
+import orjson
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..core.config import settings
+from ..core.database import cache_delete, redis_lock
+from ..models.identifiers import uuid7
+from ..models.question_analysis import QuestionAnalysis
+from .analysis_service import analysis_service, stats_cache_key
+from .llm_service import llm_service
+
+logger = logging.getLogger(__name__)
+
+# Batch states after which OpenAI will not produce any more output
+_TERMINAL_BATCH_STATES = frozenset({"completed", "failed", "expired", "cancelled"})
+
+# IDs per IN (...) clause, well under the drivers' bind parameter limits
+_ID_CHUNK_SIZE = 1000
+
+# Upper bound on one submit or collect run; a crashed run's lock lapses after this
+_BATCH_RUN_LOCK_SECONDS = 30 * 60
+
+
+def _chunks(ids: Sequence[uuid.UUID]) -> Iterator[Sequence[uuid.UUID]]:
+    """Split an ID list into IN-clause sized pieces"""
+    for start in range(0, len(ids), _ID_CHUNK_SIZE):
+        yield ids[start:start + _ID_CHUNK_SIZE]
+
+
+class BatchAnalysisService:
+    """
+    Service routing latency-tolerant analyses through the OpenAI Batch API
+    
+    Batched requests are billed at about half the live rate and complete within
+    24 hours, which suits bulk ingestion but not the interactive endpoint.
+    Requests are appended to a rolling JSONL file; a periodic task rotates it
+    and submits it as one batch, and another polls submitted batches and writes
+    the results onto their QuestionAnalysis rows. The batch directory doubles
+    as the record of in-flight batches (``submitted-<batch_id>.jsonl``), so it
+    must be shared by the API and the Celery workers, like the upload directory.
+    """
+    
+    PENDING_FILE = "pending.jsonl"
+    
+    def __init__(self):
+        self.batch_dir = Path(settings.llm_batch_dir)
+        self._client = None
+    
+    @property
+    def client(self):
+        """OpenAI client, created on first use"""
+        if self._client is None:
+            from openai import AsyncOpenAI
+            
+            self._client = AsyncOpenAI(api_key=settings.openai_api_key)
+        return self._client
+    
+    async def enqueue_for_batch(
+        self,
+        questions: List[Dict[str, Any]],
+        user_id: str,
+        db: AsyncSession
+    ) -> List[str]:
+        """
+        Create pending analyses and queue them for the next batch submission
+        
+        Args:
+            questions: Dicts with question_text and optional document_id, context
+                and question_type_hint
+            user_id: User ID requesting the analyses
+            db: Database session
+        
+        Returns:
+            IDs of the pending analyses, in input order
+        """
+        rows = [
+            {
+                "id": uuid7(),
+                "user_id": uuid.UUID(user_id),
+                "document_id": uuid.UUID(question["document_id"]) if question.get("document_id") else None,
+                "question_text": question["question_text"],
+                "status": "pending"
+            }
+            for question in questions
+        ]
+        await analysis_service.bulk_insert_analyses(rows, db)
+        
+        lines = b"".join(
+            orjson.dumps(llm_service.build_batch_request(
+                custom_id=str(row["id"]),
+                question_text=row["question_text"],
+                context=question.get("context"),
+                question_type_hint=question.get("question_type_hint")
+            )) + b"\n"
+            for row, question in zip(rows, questions)
+        )
+        await asyncio.to_thread(self._append_pending, lines)
+        
+        logger.info("Queued %s analyses for batch submission", len(rows))
+        return [str(row["id"]) for row in rows]
+    
+    async def submit_pending_batches(self, db: AsyncSession) -> List[str]:
+        """
+        Submit everything queued since the last run as a batch
+        
+        Request files left over from a submission that failed are retried too.
+        Runs are serialized with a Redis lock, since two overlapping runs (a slow
+        upload outlasting the schedule interval, a redelivered task, a second
+        beat) would upload and pay for the same file twice; if the lock is held
+        or Redis is unavailable, this run does nothing.
+        
+        Returns:
+            The OpenAI batch IDs submitted
+        """
+        async with redis_lock("lock:batch:submit", _BATCH_RUN_LOCK_SECONDS) as acquired:
+            if not acquired:
+                logger.info("Batch submission already running, skipping")
+                return []
+            
+            await asyncio.to_thread(self._rotate_pending)
+            
+            batch_ids = []
+            for batch_file in sorted(self.batch_dir.glob("batch-*.jsonl")):
+                batch_id = await self._submit_batch_file(batch_file, db)
+                if batch_id is not None:
+                    batch_ids.append(batch_id)
+            return batch_ids
+    
+    async def _submit_batch_file(self, batch_file: Path, db: AsyncSession) -> Optional[str]:
+        """
+        Upload one request file, start its batch and mark its analyses as processing
+        
+        Returns:
+            The batch ID, or None if the file was already taken by another run
+        """
+        try:
+            with batch_file.open("rb") as f:
+                uploaded = await self.client.files.create(file=f, purpose="batch")
+        except FileNotFoundError:
+            logger.warning("Batch file %s vanished, skipping", batch_file.name)
+            return None
+        batch = await self.client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h"
+        )
+        
+        # Keep the request file under the batch ID until the results are in
+        submitted_file = self.batch_dir / f"submitted-{batch.id}.jsonl"
+        os.replace(batch_file, submitted_file)
+        
+        analysis_ids = self._read_custom_ids(submitted_file)
+        for chunk in _chunks(analysis_ids):
+            await db.execute(
+                update(QuestionAnalysis)
+                .where(QuestionAnalysis.id.in_(chunk))
+                .values(status="processing")
+            )
+        await db.commit()
+        
+        logger.info("Submitted batch %s with %s analyses", batch.id, len(analysis_ids))
+        return batch.id
+    
+    async def collect_finished_batches(self, db: AsyncSession) -> int:
+        """
+        Apply the results of every submitted batch that has finished
+        
+        Serialized with a Redis lock like submit_pending_batches, so a batch's
+        results are applied once.
+        
+        Returns:
+            Number of analyses completed
+        """
+        async with redis_lock("lock:batch:collect", _BATCH_RUN_LOCK_SECONDS) as acquired:
+            if not acquired:
+                logger.info("Batch collection already running, skipping")
+                return 0
+            
+            completed = 0
+            for submitted_file in sorted(self.batch_dir.glob("submitted-*.jsonl")):
+                if not submitted_file.exists():
+                    continue
+                batch_id = submitted_file.stem.removeprefix("submitted-")
+                batch = await self.client.batches.retrieve(batch_id)
+                if batch.status not in _TERMINAL_BATCH_STATES:
+                    continue
+                
+                completed += await self._apply_batch_output(batch, submitted_file, db)
+                submitted_file.unlink(missing_ok=True)
+            
+            return completed
+    
+    async def _apply_batch_output(self, batch, submitted_file: Path, db: AsyncSession) -> int:
+        """Write a finished batch's results onto its analyses and fail the ones without output"""
+        analysis_ids = self._read_custom_ids(submitted_file)
+        results: Dict[uuid.UUID, Dict[str, Any]] = {}
+        
+        if batch.output_file_id:
+            output = await self.client.files.content(batch.output_file_id)
+            for line in output.text.splitlines():
+                record = orjson.loads(line)
+                response = record.get("response") or {}
+                if response.get("status_code") == 200:
+                    results[uuid.UUID(record["custom_id"])] = response["body"]
+        
+        user_ids: Set[uuid.UUID] = set()
+        for chunk in _chunks(analysis_ids):
+            analyses = await db.scalars(
+                select(QuestionAnalysis).where(QuestionAnalysis.id.in_(chunk))
+            )
+            for question_analysis in analyses:
+                user_ids.add(question_analysis.user_id)
+                body = results.get(question_analysis.id)
+                if body is None:
+                    # The request errored, or never ran because the batch failed or expired
+                    question_analysis.status = "failed"
+                    continue
+                
+                analysis_result = llm_service.parse_analysis_response(
+                    body["choices"][0]["message"]["content"]
+                )
+                usage = body.get("usage") or {}
+                analysis_service.apply_analysis_result(question_analysis, analysis_result, {
+                    "model_used": body.get("model"),
+                    "processing_time_ms": None,
+                    "prompt_tokens": usage.get("prompt_tokens"),
+                    "response_tokens": usage.get("completion_tokens"),
+                    "batch_id": batch.id,
+                    "success": True
+                })
+        
+        await db.commit()
+        await cache_delete(*(stats_cache_key(user_id) for user_id in user_ids))
+        
+        logger.info(
+            "Batch %s %s: %s of %s analyses completed",
+            batch.id, batch.status, len(results), len(analysis_ids)
+        )
+        return len(results)
+    
+    def _append_pending(self, lines: bytes):
+        """Append request lines to the rolling pending file in a single write"""
+        self.batch_dir.mkdir(parents=True, exist_ok=True)
+        with (self.batch_dir / self.PENDING_FILE).open("ab") as f:
+            f.write(lines)
+    
+    def _rotate_pending(self) -> Optional[Path]:
+        """Atomically move the pending file aside so new requests start a fresh one"""
+        batch_file = self.batch_dir / f"batch-{time.time_ns()}.jsonl"
+        try:
+            os.replace(self.batch_dir / self.PENDING_FILE, batch_file)
+        except FileNotFoundError:
+            return None
+        return batch_file
+    
+    @staticmethod
+    def _read_custom_ids(path: Path) -> List[uuid.UUID]:
+        """Analysis IDs of the requests in a batch input file"""
+        with path.open("rb") as f:
+            return [uuid.UUID(orjson.loads(line)["custom_id"]) for line in f if line.strip()]
+
+
+# Global batch analysis service instance
+batch_analysis_service = BatchAnalysisService()
@@ -1,21 +1,60 @@
 """
 Document processing service for handling file uploads and text extraction
 """
+import asyncio
 import logging
+import uuid
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, List, Dict, Any, BinaryIO
-from sqlalchemy.orm import Session
+from typing import Optional, List, Dict, Any, AsyncIterable, Awaitable, BinaryIO, Tuple
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 
+from ..core.config import settings
+from ..core.database import AsyncSessionLocal, cache_get, cache_set
+from ..core.pagination import Cursor
 from ..models.document import Document
+from ..models.identifiers import as_uuid
 from ..models.user import User
 from ..utils.file_storage import file_storage
 from ..utils.ocr import ocr_processor
-from ..core.database import get_db
 
 logger = logging.getLogger(__name__)
 
+# Columns returned by document listings; skips the bulky OCR text and storage path
+_DOCUMENT_LIST_COLUMNS = (
+    Document.id,
+    Document.user_id,
+    Document.filename,
+    Document.file_type,
+    Document.file_size,
+    Document.processing_status,
+    Document.ocr_confidence,
+    Document.processing_started_at,
+    Document.processing_completed_at,
+    Document.error_message,
+    Document.created_at,
+    Document.updated_at,
+)
+
+# MIME types by lower-case file extension
+_MIME_TYPES = {
+    'pdf': 'application/pdf',
+    'doc': 'application/msword',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'txt': 'text/plain',
+    'png': 'image/png',
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg'
+}
+
+
+def stats_cache_key(user_id) -> str:
+    """Redis key holding a user's cached document statistics"""
+    return f"dstat:{user_id}"
+
 
 class DocumentService:
     """Service for managing document uploads and processing"""
@@ -30,7 +69,7 @@ class DocumentService:
         file: BinaryIO,
         filename: str,
         user_id: str,
-        db: Session,
+        db: AsyncSession,
         process_immediately: bool = True
     ) -> Dict[str, Any]:
         """
@@ -46,67 +85,136 @@ class DocumentService:
         Returns:
             Dict containing upload result and document info
         """
+        return await self._store_and_register(
+            self.file_storage.save_file_async(file, filename), filename, user_id, db, process_immediately
+        )
+    
+    async def upload_document_stream(
+        self,
+        chunks: AsyncIterable[bytes],
+        filename: str,
+        user_id: str,
+        db: AsyncSession,
+        process_immediately: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Upload and process a document whose content arrives as a stream of chunks
+        
+        Args:
+            chunks: File content chunks, written to storage as they arrive
+            filename: Original filename
+            user_id: ID of the uploading user
+            db: Database session
+            process_immediately: Whether to process OCR immediately
+        
+        Returns:
+            Dict containing upload result and document info
+        """
+        return await self._store_and_register(
+            self.file_storage.write_stream(chunks, filename), filename, user_id, db, process_immediately
+        )
+    
+    async def _store_and_register(
+        self,
+        store: Awaitable[Tuple[str, str, int, str]],
+        filename: str,
+        user_id: str,
+        db: AsyncSession,
+        process_immediately: bool
+    ) -> Dict[str, Any]:
+        """
+        Await the storage write, then create the document record and optionally process it
+        
+        If the user already has a processed document with the same content, the new
+        file is hard-linked to it and its OCR results are reused instead of running
+        OCR again.
+        """
         try:
-            # Validate file
-            if not self.file_storage.is_allowed_file(filename):
-                raise ValueError(f"File type not allowed: {Path(filename).suffix}")
-            
-            # Save file to storage
-            unique_filename, file_path = self.file_storage.save_file(file, filename)
-            
-            # Get file info
-            file_info = self.file_storage.get_file_info(unique_filename)
-            if not file_info:
-                raise RuntimeError("Failed to get file information")
+            # Save file to storage (validates file type and size)
+            unique_filename, file_path, file_size, content_sha256 = await store
+            # UUID objects, not strings: SQLite cannot bind the latter
+            user_uuid = uuid.UUID(user_id)
             
             # Create database record
             document = Document(
-                user_id=user_id,
-                original_filename=filename,
-                stored_filename=unique_filename,
-                file_path=file_path,
-                file_size=file_info["size"],
-                mime_type=self._get_mime_type(filename),
-                upload_status="uploaded",
-                processing_status="pending"
+                user_id=user_uuid,
+                filename=filename,
+                file_type=self._get_mime_type(filename),
+                file_size=file_size,
+                storage_path=file_path,
+                content_sha256=content_sha256,
+                processing_status="uploaded"
             )
             
+            original = await self._find_processed_duplicate(user_uuid, content_sha256, db)
+            if original is not None:
+                await asyncio.to_thread(self.file_storage.link_duplicate, file_path, original.storage_path)
+                now = datetime.utcnow()
+                document.ocr_text = original.ocr_text
+                document.ocr_confidence = original.ocr_confidence
+                document.processing_status = "completed"
+                document.processing_started_at = now
+                document.processing_completed_at = now
+                logger.info("Reusing OCR results of identical document %s", original.id)
+            
             db.add(document)
-            db.commit()
-            db.refresh(document)
+            await db.commit()
+            await db.refresh(document)
             
-            logger.info(f"Document uploaded successfully: {document.id}")
+            logger.info("Document uploaded successfully: %s", document.id)
             
             result = {
                 "document_id": str(document.id),
                 "original_filename": filename,
                 "stored_filename": unique_filename,
-                "file_size": file_info["size"],
+                "file_size": file_size,
                 "upload_status": "success",
-                "processing_status": "pending"
+                "processing_status": document.processing_status
             }
             
+            if original is not None:
+                result["duplicate_of"] = str(original.id)
+            
             # Process document if requested
-            if process_immediately:
+            elif process_immediately:
                 processing_result = await self.process_document(document.id, db)
                 result.update(processing_result)
             
             return result
             
         except ValueError as e:
-            logger.warning(f"Document upload validation error: {e}")
+            logger.warning("Document upload validation error: %s", e)
             raise
         except Exception as e:
-            logger.error(f"Document upload error: {e}")
+            logger.error("Document upload error: %s", e)
             # Clean up file if it was saved
             try:
                 if 'unique_filename' in locals():
-                    self.file_storage.delete_file(unique_filename)
+                    await asyncio.to_thread(self.file_storage.delete_file, unique_filename)
             except Exception:
                 pass
             raise RuntimeError(f"Failed to upload document: {str(e)}")
     
-    async def process_document(self, document_id: str, db: Session) -> Dict[str, Any]:
+    async def _find_processed_duplicate(
+        self,
+        user_id: uuid.UUID,
+        content_sha256: str,
+        db: AsyncSession
+    ) -> Optional[Document]:
+        """Return the user's most recent completed document with identical content, if any"""
+        result = await db.execute(
+            select(Document)
+            .where(
+                Document.user_id == user_id,
+                Document.content_sha256 == content_sha256,
+                Document.processing_status == "completed"
+            )
+            .order_by(Document.created_at.desc())
+            .limit(1)
+        )
+        return result.scalar_one_or_none()
+    
+    async def process_document(self, document_id: str, db: AsyncSession) -> Dict[str, Any]:
         """
         Process uploaded document for text extraction
         
@@ -119,64 +227,154 @@ class DocumentService:
         """
         try:
             # Get document record
-            document = db.query(Document).filter(Document.id == document_id).first()
+            document = await db.get(Document, document_id)
             if not document:
                 raise ValueError(f"Document not found: {document_id}")
             
             # Update processing status
             document.processing_status = "processing"
             document.processing_started_at = datetime.utcnow()
-            db.commit()
+            await db.commit()
             
-            # Get file path
-            file_path = Path(document.file_path)
-            if not file_path.exists():
+            # Get file path (stat off the event loop, storage may be a network mount)
+            file_path = Path(document.storage_path)
+            if not await asyncio.to_thread(file_path.exists):
                 raise FileNotFoundError(f"Document file not found: {file_path}")
             
             # Extract text using OCR
-            logger.info(f"Starting OCR processing for document: {document_id}")
-            ocr_result = await self.ocr_processor.extract_text_async(file_path)
+            logger.info("Starting OCR processing for document: %s", document_id)
+            ocr_result = await self._extract_text(file_path, document.content_sha256)
             
             # Update document with extracted content
-            document.extracted_text = ocr_result.get("text", "")
-            document.page_count = ocr_result["metadata"].get("total_pages", 1)
-            document.ocr_metadata = ocr_result["metadata"]
+            document.ocr_text = ocr_result.get("text", "")
             
             if ocr_result["metadata"].get("success", False):
                 document.processing_status = "completed"
-                logger.info(f"Document processing completed: {document_id}")
+                logger.info("Document processing completed: %s", document_id)
             else:
                 document.processing_status = "failed"
-                logger.warning(f"Document processing failed: {document_id}")
+                logger.warning("Document processing failed: %s", document_id)
             
             document.processing_completed_at = datetime.utcnow()
-            db.commit()
+            await db.commit()
             
             return {
-                "document_id": document_id,
+                "document_id": str(document_id),
                 "processing_status": document.processing_status,
-                "extracted_text": document.extracted_text,
-                "page_count": document.page_count,
-                "processing_metadata": document.ocr_metadata
+                "extracted_text": document.ocr_text,
+                "page_count": ocr_result["metadata"].get("total_pages", 1),
+                "processing_metadata": ocr_result["metadata"]
             }
             
         except Exception as e:
-            logger.error(f"Document processing error: {e}")
+            logger.error("Document processing error: %s", e)
             
             # Update document status to failed
             try:
-                document = db.query(Document).filter(Document.id == document_id).first()
+                await db.rollback()
+                document = await db.get(Document, document_id)
                 if document:
                     document.processing_status = "failed"
                     document.processing_completed_at = datetime.utcnow()
                     document.error_message = str(e)
-                    db.commit()
+                    await db.commit()
             except Exception:
                 pass
             
             raise RuntimeError(f"Failed to process document: {str(e)}")
     
-    def get_document(self, document_id: str, db: Session, user_id: Optional[str] = None) -> Optional[Document]:
+    async def _extract_text(self, file_path: Path, content_sha256: Optional[str]) -> Dict[str, Any]:
+        """
+        Run OCR on a stored file, reusing the cached result for identical content
+        
+        Results are keyed by the upload's content hash (and the OCR settings), so
+        the same file uploaded by another user or re-processed later skips OCR.
+        Only successful extractions by a real engine are cached, never fallback
+        placeholder text.
+        """
+        ttl_seconds = settings.ocr_result_cache_ttl_seconds
+        cache_key = None
+        if content_sha256 and ttl_seconds > 0:
+            cache_key = self.ocr_processor.result_cache_key(content_sha256)
+            cached = await cache_get(cache_key)
+            if cached is not None:
+                logger.info("Using cached OCR result for %s", file_path.name)
+                return cached
+        
+        ocr_result = await self.ocr_processor.extract_text_async(file_path)
+        # The extraction has loaded the engine by now, so this check doesn't block
+        if cache_key and ocr_result["metadata"].get("success", False) and self.ocr_processor.is_available():
+            await cache_set(cache_key, ocr_result, ttl_seconds)
+        return ocr_result
+    
+    async def get_unprocessed_document_ids(
+        self,
+        document_ids: List[str],
+        user_id: str,
+        db: AsyncSession
+    ) -> List[str]:
+        """Return which of the given documents belong to the user and still need processing"""
+        result = await db.execute(
+            select(Document.id).where(
+                Document.id.in_(document_ids),
+                Document.user_id == user_id,
+                Document.processing_status.not_in(("processing", "completed"))
+            )
+        )
+        return list(result.scalars())
+    
+    async def process_documents_batch(self, document_ids: List[str], db: AsyncSession) -> List[Dict[str, Any]]:
+        """
+        Process several uploaded documents, running their OCR concurrently
+        
+        Each document is processed and committed in its own session, so a
+        failure only marks that document as failed and the rest of the batch
+        is kept. At most ``ocr_processor.max_concurrency`` documents are
+        processed at once, matching the OCR thread pool.
+        
+        Args:
+            document_ids: IDs of the documents to process
+            db: Database session (only used to pick the execution strategy)
+        
+        Returns:
+            One processing result per document, in input order; failed
+            documents carry processing_status "failed" and an error message
+        """
+        semaphore = asyncio.Semaphore(self.ocr_processor.max_concurrency)
+        
+        async def process_one(document_id: str) -> Dict[str, Any]:
+            async with semaphore:
+                async with AsyncSessionLocal() as session:
+                    return await self.process_document(document_id, session)
+        
+        if db.bind.dialect.name == "sqlite":
+            # The SQLite engine shares one connection (StaticPool), which cannot overlap transactions
+            outcomes = []
+            for document_id in document_ids:
+                try:
+                    outcomes.append(await process_one(document_id))
+                except Exception as e:
+                    outcomes.append(e)
+        else:
+            outcomes = await asyncio.gather(
+                *(process_one(document_id) for document_id in document_ids),
+                return_exceptions=True
+            )
+        
+        results = []
+        for document_id, outcome in zip(document_ids, outcomes):
+            if isinstance(outcome, BaseException):
+                logger.error("Batch processing failed for document %s: %s", document_id, outcome)
+                outcome = {
+                    "document_id": str(document_id),
+                    "processing_status": "failed",
+                    "error": str(outcome)
+                }
+            results.append(outcome)
+        
+        return results
+    
+    async def get_document(self, document_id: str, db: AsyncSession, user_id: Optional[str] = None) -> Optional[Document]:
         """
         Get document by ID
         
@@ -189,26 +387,28 @@ class DocumentService:
             Document record or None if not found
         """
         try:
-            query = db.query(Document).filter(Document.id == document_id)
+            query = select(Document).where(Document.id == as_uuid(document_id))
             
             # Add user filter if provided
             if user_id:
-                query = query.filter(Document.user_id == user_id)
+                query = query.where(Document.user_id == as_uuid(user_id))
             
-            return query.first()
+            result = await db.execute(query)
+            return result.scalar_one_or_none()
             
         except Exception as e:
-            logger.error(f"Error getting document {document_id}: {e}")
+            logger.error("Error getting document %s: %s", document_id, e)
             return None
     
-    def get_user_documents(
+    async def get_user_documents(
         self,
         user_id: str,
-        db: Session,
+        db: AsyncSession,
         limit: int = 20,
         offset: int = 0,
-        status_filter: Optional[str] = None
-    ) -> List[Document]:
+        status_filter: Optional[str] = None,
+        cursor: Optional[Cursor] = None
+    ) -> List[Row]:
         """
         Get documents for a specific user
         
@@ -218,27 +418,70 @@ class DocumentService:
             limit: Maximum number of documents to return
             offset: Number of documents to skip
             status_filter: Optional status filter ('pending', 'processing', 'completed', 'failed')
+            cursor: (created_at, id) of the previous page's last row; when given,
+                rows after it are returned by keyset seek and offset is ignored
         
         Returns:
-            List of document records
+            List of document summary rows (no ORM objects)
         """
         try:
-            query = db.query(Document).filter(Document.user_id == user_id)
+            query = select(*_DOCUMENT_LIST_COLUMNS).where(
+                *self._user_documents_filter(user_id, status_filter)
+            )
             
-            # Add status filter if provided
-            if status_filter:
-                query = query.filter(Document.processing_status == status_filter)
+            if cursor:
+                query = query.where(tuple_(Document.created_at, Document.id) < tuple_(*cursor))
+            else:
+                query = query.offset(offset)
             
             # Order by creation date (newest first) and apply pagination
-            documents = query.order_by(Document.created_at.desc()).offset(offset).limit(limit).all()
+            result = await db.execute(
+                query.order_by(Document.created_at.desc(), Document.id.desc()).limit(limit)
+            )
             
-            return documents
+            return list(result.all())
             
         except Exception as e:
-            logger.error(f"Error getting user documents: {e}")
+            logger.error("Error getting user documents: %s", e)
             return []
     
-    def delete_document(self, document_id: str, db: Session, user_id: Optional[str] = None) -> bool:
+    async def count_user_documents(
+        self,
+        user_id: str,
+        db: AsyncSession,
+        status_filter: Optional[str] = None
+    ) -> int:
+        """
+        Count documents for a specific user
+        
+        Args:
+            user_id: User ID
+            db: Database session
+            status_filter: Optional status filter, same as get_user_documents
+        
+        Returns:
+            Number of matching documents
+        """
+        try:
+            total = await db.scalar(
+                select(func.count(Document.id)).where(
+                    *self._user_documents_filter(user_id, status_filter)
+                )
+            )
+            return total or 0
+            
+        except Exception as e:
+            logger.error("Error counting user documents: %s", e)
+            return 0
+    
+    def _user_documents_filter(self, user_id: str, status_filter: Optional[str]) -> list:
+        """Build the WHERE clauses shared by listing and counting documents"""
+        conditions = [Document.user_id == as_uuid(user_id)]
+        if status_filter:
+            conditions.append(Document.processing_status == status_filter)
+        return conditions
+    
+    async def delete_document(self, document_id: str, db: AsyncSession, user_id: Optional[str] = None) -> bool:
         """
         Delete a document and its associated file
         
@@ -252,29 +495,30 @@ class DocumentService:
         """
         try:
             # Get document
-            document = self.get_document(document_id, db, user_id)
+            document = await self.get_document(document_id, db, user_id)
             if not document:
-                logger.warning(f"Document not found for deletion: {document_id}")
+                logger.warning("Document not found for deletion: %s", document_id)
                 return False
             
             # Delete file from storage
-            file_deleted = self.file_storage.delete_file(document.stored_filename)
+            stored_filename = Path(document.storage_path).name
+            file_deleted = await asyncio.to_thread(self.file_storage.delete_file, stored_filename)
             if not file_deleted:
-                logger.warning(f"Failed to delete file: {document.stored_filename}")
+                logger.warning("Failed to delete file: %s", stored_filename)
             
             # Delete database record
-            db.delete(document)
-            db.commit()
+            await db.delete(document)
+            await db.commit()
             
-            logger.info(f"Document deleted successfully: {document_id}")
+            logger.info("Document deleted successfully: %s", document_id)
             return True
             
         except Exception as e:
-            logger.error(f"Error deleting document {document_id}: {e}")
-            db.rollback()
+            logger.error("Error deleting document %s: %s", document_id, e)
+            await db.rollback()
             return False
     
-    def get_document_stats(self, user_id: str, db: Session) -> Dict[str, Any]:
+    async def get_document_stats(self, user_id: str, db: AsyncSession) -> Dict[str, Any]:
         """
         Get document statistics for a user
         
@@ -286,33 +530,23 @@ class DocumentService:
             Dict containing document statistics
         """
         try:
-            from sqlalchemy import func
-            
-            # Count documents by status
-            status_counts = db.query(
-                Document.processing_status,
-                func.count(Document.id).label('count')
-            ).filter(Document.user_id == user_id).group_by(Document.processing_status).all()
-            
-            # Total documents and file size
-            total_stats = db.query(
-                func.count(Document.id).label('total_documents'),
-                func.sum(Document.file_size).label('total_size')
-            ).filter(Document.user_id == user_id).first()
-            
-            stats = {
-                "total_documents": total_stats.total_documents or 0,
-                "total_file_size": total_stats.total_size or 0,
-                "status_breakdown": {}
-            }
-            
-            for status, count in status_counts:
-                stats["status_breakdown"][status] = count
+            # Count and size documents by status in one pass; totals are rolled up here
+            status_rows = (await db.execute(
+                select(
+                    Document.processing_status,
+                    func.count(Document.id).label('count'),
+                    func.sum(Document.file_size).label('total_size')
+                ).where(Document.user_id == as_uuid(user_id)).group_by(Document.processing_status)
+            )).all()
             
-            return stats
+            return {
+                "total_documents": sum(row.count for row in status_rows),
+                "total_file_size": sum(row.total_size or 0 for row in status_rows),
+                "status_breakdown": {row.processing_status: row.count for row in status_rows}
+            }
             
         except Exception as e:
-            logger.error(f"Error getting document stats: {e}")
+            logger.error("Error getting document stats: %s", e)
             return {
                 "total_documents": 0,
                 "total_file_size": 0,
@@ -321,17 +555,10 @@ class DocumentService:
     
     def _get_mime_type(self, filename: str) -> str:
         """Get MIME type based on file extension"""
-        ext = Path(filename).suffix.lower()
-        mime_types = {
-            '.pdf': 'application/pdf',
-            '.doc': 'application/msword',
-            '.docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            '.txt': 'text/plain',
-            '.png': 'image/png',
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg'
-        }
-        return mime_types.get(ext, 'application/octet-stream')
+        _, dot, ext = filename.rpartition('.')
+        if not dot:
+            return 'application/octet-stream'
+        return _MIME_TYPES.get(ext.lower(), 'application/octet-stream')
 
 
 # Global document service instance
@@ -1,10 +1,25 @@
 """
 LLM (Large Language Model) service for AI-powered legal analysis
 """
+import asyncio
+import hashlib
 import logging
 import time
-from typing import Dict, Any, List, Optional, Tuple
-import json
+from contextlib import aclosing
+from typing import Callable, Dict, Any, List, Optional, Tuple, TypeVar
+
+import httpx
+import numpy as np
+import orjson
+import tiktoken
+from openai import APIConnectionError, AsyncOpenAI, RateLimitError
+from tenacity import (
+    before_sleep_log,
+    retry,
+    retry_if_exception_type,
+    stop_after_attempt,
+    wait_exponential,
+)
 
 from langchain.chat_models import ChatOpenAI
 from langchain.schema import HumanMessage, SystemMessage
@@ -13,9 +28,25 @@ from langchain.output_parsers import PydanticOutputParser
 from pydantic import BaseModel, Field
 
 from ..core.config import settings
+from ..core.database import cache_get, cache_set
+from ..utils.rate_limiter import AsyncRateLimiter
 
 logger = logging.getLogger(__name__)
 
+# Low temperature for consistent legal analysis
+ANALYSIS_TEMPERATURE = 0.1
+LLM_REQUEST_TIMEOUT_SECONDS = 60
+
+# Throttled or dropped requests are retried with exponential backoff
+LLM_RETRY_ATTEMPTS = 3
+LLM_RETRY_MIN_WAIT_SECONDS = 1
+LLM_RETRY_MAX_WAIT_SECONDS = 20
+
+# Questions returned by a similar-question search
+SIMILAR_QUESTION_LIMIT = 5
+
+T = TypeVar("T")
+
 
 class LegalAnalysisResult(BaseModel):
     """Structured output for legal analysis"""
@@ -29,6 +60,60 @@ class LegalAnalysisResult(BaseModel):
     confidence_score: float = Field(description="分析信心分數 (0-1)", ge=0.0, le=1.0)
 
 
+class _JsonStreamScanner:
+    """
+    Accumulates streamed reply text until its first complete JSON object or array
+    
+    Brackets are counted outside of strings as chunks arrive; when they balance,
+    the candidate is confirmed with a real parse, so stray brackets in any prose
+    before the JSON only restart the scan.
+    """
+    
+    def __init__(self):
+        self.text = ""
+        self._start = -1
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+    
+    def feed(self, chunk: str) -> bool:
+        """Append a chunk; returns True once a complete JSON value has been received"""
+        offset = len(self.text)
+        self.text += chunk
+        for index, char in enumerate(chunk, offset):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif self._start == -1:
+                if char in "{[":
+                    self._start, self._depth = index, 1
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    if self._is_json(self.text[self._start:index + 1]):
+                        self.text = self.text[:index + 1]
+                        return True
+                    self._start = -1
+        return False
+    
+    @staticmethod
+    def _is_json(candidate: str) -> bool:
+        """Check whether a bracket-balanced candidate actually parses"""
+        try:
+            orjson.loads(candidate)
+        except orjson.JSONDecodeError:
+            return False
+        return True
+
+
 class LLMService:
     """LLM service for legal text analysis using OpenAI GPT"""
     
@@ -36,6 +121,13 @@ class LLMService:
         self.model_name = settings.openai_model
         self.max_tokens = settings.openai_max_tokens
         self._llm = None
+        self._encoding: Optional[tiktoken.Encoding] = None
+        self._parser = PydanticOutputParser(pydantic_object=LegalAnalysisResult)
+        # Shared by every caller in the process, so concurrent requests draw on one budget
+        self._semaphore = asyncio.Semaphore(settings.llm_max_concurrency)
+        self._rate_limiter = AsyncRateLimiter(settings.llm_requests_per_second)
+        # Requests currently being generated, by response cache key
+        self._in_flight: Dict[str, asyncio.Future] = {}
         self._init_llm()
     
     def _init_llm(self):
@@ -45,23 +137,145 @@ class LLMService:
                 logger.warning("OpenAI API key not configured, LLM functionality will be limited")
                 return
             
+            async_client = AsyncOpenAI(
+                api_key=settings.openai_api_key,
+                timeout=LLM_REQUEST_TIMEOUT_SECONDS,
+                max_retries=0,
+                http_client=self._build_http_client()
+            )
             self._llm = ChatOpenAI(
                 model_name=self.model_name,
                 openai_api_key=settings.openai_api_key,
                 max_tokens=self.max_tokens,
-                temperature=0.1,  # Low temperature for consistent legal analysis
-                request_timeout=60
+                temperature=ANALYSIS_TEMPERATURE,
+                request_timeout=LLM_REQUEST_TIMEOUT_SECONDS,
+                max_retries=0,  # Retries are handled by _generate
+                async_client=async_client.chat.completions
             )
-            logger.info(f"LLM service initialized with model: {self.model_name}")
+            logger.info("LLM service initialized with model: %s", self.model_name)
+            self._init_encoding()
             
         except Exception as e:
-            logger.error(f"Failed to initialize LLM service: {e}")
+            logger.error("Failed to initialize LLM service: %s", e)
             self._llm = None
     
+    @staticmethod
+    def _build_http_client() -> httpx.AsyncClient:
+        """
+        Connection pool for all async API calls, sized to the process-wide concurrency cap
+        
+        HTTP/2 lets concurrent calls share one TLS connection; without the h2
+        package httpx cannot speak it, so the pool falls back to HTTP/1.1 keep-alive.
+        """
+        options = {
+            "limits": httpx.Limits(
+                max_connections=settings.llm_max_concurrency,
+                max_keepalive_connections=settings.llm_max_concurrency
+            ),
+            "timeout": LLM_REQUEST_TIMEOUT_SECONDS,
+            "follow_redirects": True
+        }
+        try:
+            return httpx.AsyncClient(http2=True, **options)
+        except ImportError:
+            logger.info("h2 not installed, LLM API calls use HTTP/1.1")
+            return httpx.AsyncClient(**options)
+    
+    def _init_encoding(self):
+        """Load the model's tokenizer once for token counting"""
+        try:
+            try:
+                self._encoding = tiktoken.encoding_for_model(self.model_name)
+            except KeyError:
+                # Model name unknown to this tiktoken release
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # The BPE file is downloaded on first use, which fails when offline
+            logger.warning("Failed to load tokenizer for %s, token counts are approximate: %s", self.model_name, e)
+            self._encoding = None
+    
+    def count_tokens(self, text: str) -> int:
+        """Count the model tokens in a text, or its words when no tokenizer is loaded"""
+        if self._encoding is None:
+            return len(text.split())
+        return len(self._encoding.encode(text, disallowed_special=()))
+    
     def is_available(self) -> bool:
         """Check if LLM service is available"""
         return self._llm is not None
     
+    async def _complete(self, messages: List[Any], parse: Callable[[str], T]) -> Tuple[T, str]:
+        """
+        Get a chat completion and parse it, reusing the cached response to an identical prompt
+        
+        A response is only cached once ``parse`` accepts it, so a malformed reply is
+        requested again next time instead of being served for the cache lifetime.
+        An identical prompt that is still being generated is joined rather than sent
+        again, which covers the window before the first response is cached.
+        
+        Returns:
+            Tuple of (parsed response, response text)
+        """
+        cache_key = self._response_cache_key(messages)
+        ttl_seconds = settings.llm_response_cache_ttl_seconds
+        
+        if ttl_seconds > 0:
+            cached_text = await cache_get(cache_key)
+            if cached_text is not None:
+                return parse(cached_text), cached_text
+        
+        response_text = await self._generate_shared(cache_key, messages)
+        parsed = parse(response_text)
+        if ttl_seconds > 0:
+            await cache_set(cache_key, response_text, ttl_seconds)
+        return parsed, response_text
+    
+    async def _generate_shared(self, cache_key: str, messages: List[Any]) -> str:
+        """Generate a response, or wait for the identical request already in flight"""
+        pending = self._in_flight.get(cache_key)
+        if pending is None:
+            pending = self._in_flight[cache_key] = asyncio.ensure_future(self._generate(messages))
+            pending.add_done_callback(lambda _: self._in_flight.pop(cache_key, None))
+        
+        # A caller that gives up must not cancel the request for the others waiting on it
+        return await asyncio.shield(pending)
+    
+    def _response_cache_key(self, messages: List[Any]) -> str:
+        """Redis key for the response to a prompt under the current model settings"""
+        prompt = orjson.dumps([
+            self.model_name,
+            self.max_tokens,
+            ANALYSIS_TEMPERATURE,
+            [[message.type, message.content] for message in messages]
+        ])
+        return f"llm:{hashlib.sha256(prompt).hexdigest()}"
+    
+    @retry(
+        retry=retry_if_exception_type((RateLimitError, APIConnectionError)),
+        wait=wait_exponential(min=LLM_RETRY_MIN_WAIT_SECONDS, max=LLM_RETRY_MAX_WAIT_SECONDS),
+        stop=stop_after_attempt(LLM_RETRY_ATTEMPTS),
+        before_sleep=before_sleep_log(logger, logging.WARNING),
+        reraise=True
+    )
+    async def _generate(self, messages: List[Any]) -> str:
+        """
+        Stream one chat completion, paced and capped process-wide, and return its text
+        
+        Every prompt asks for JSON, so streaming stops as soon as the reply's first
+        complete JSON value has arrived instead of waiting out any trailing commentary.
+        The stream is closed before the semaphore is released: left to garbage
+        collection, an abandoned stream would keep holding one of the pool's
+        LLM_MAX_CONCURRENCY connections.
+        """
+        scanner = _JsonStreamScanner()
+        async with self._semaphore:
+            await self._rate_limiter.acquire()
+            async with aclosing(self._llm.astream(messages)) as stream:
+                async for chunk in stream:
+                    if scanner.feed(chunk.content):
+                        break
+        return scanner.text
+    
     async def analyze_legal_question(
         self,
         question_text: str,
@@ -86,35 +300,18 @@ class LLMService:
         
         try:
             # Prepare the analysis prompt
-            system_prompt = self._get_system_prompt()
-            user_prompt = self._format_question_prompt(
+            system_prompt, user_prompt = self.build_analysis_prompts(
                 question_text, context, question_type_hint
             )
             
-            # Create parser for structured output
-            parser = PydanticOutputParser(pydantic_object=LegalAnalysisResult)
-            format_instructions = parser.get_format_instructions()
-            
-            # Add format instructions to the prompt
-            user_prompt += f"\\n\\n{format_instructions}"
-            
             # Create messages
             messages = [
                 SystemMessage(content=system_prompt),
                 HumanMessage(content=user_prompt)
             ]
             
-            # Get LLM response
-            response = await self._llm.agenerate([messages])
-            response_text = response.generations[0][0].text
-            
-            # Parse structured output
-            try:
-                analysis_result = parser.parse(response_text)
-            except Exception as parse_error:
-                logger.warning(f"Failed to parse structured output: {parse_error}")
-                # Fallback to basic parsing
-                analysis_result = self._fallback_parse(response_text)
+            # Get and parse the LLM response; an unusable one raises and takes the fallback below
+            analysis_result, response_text = await self._complete(messages, self._parse_analysis_json)
             
             # Calculate processing time
             processing_time = (time.time() - start_time) * 1000  # Convert to ms
@@ -123,17 +320,17 @@ class LLMService:
             metadata = {
                 "model_used": self.model_name,
                 "processing_time_ms": processing_time,
-                "prompt_tokens": len(user_prompt.split()),
-                "response_tokens": len(response_text.split()),
+                "prompt_tokens": self.count_tokens(system_prompt) + self.count_tokens(user_prompt),
+                "response_tokens": self.count_tokens(response_text),
                 "success": True
             }
             
-            logger.info(f"Legal question analysis completed in {processing_time:.2f}ms")
+            logger.info("Legal question analysis completed in %.2fms", processing_time)
             return analysis_result, metadata
             
         except Exception as e:
             error_time = (time.time() - start_time) * 1000
-            logger.error(f"LLM analysis failed after {error_time:.2f}ms: {e}")
+            logger.error("LLM analysis failed after %.2fms: %s", error_time, e)
             
             # Return fallback result
             fallback_result = self._get_fallback_result(question_text)
@@ -146,6 +343,77 @@ class LLMService:
             
             return fallback_result, metadata
     
+    def build_analysis_prompts(
+        self,
+        question_text: str,
+        context: Optional[str] = None,
+        question_type_hint: Optional[str] = None
+    ) -> Tuple[str, str]:
+        """Build the (system, user) prompts for a question analysis"""
+        user_prompt = self._format_question_prompt(question_text, context, question_type_hint)
+        
+        # Add format instructions for structured output
+        user_prompt += f"\\n\\n{self._parser.get_format_instructions()}"
+        
+        return self._get_system_prompt(), user_prompt
+    
+    def parse_analysis_response(self, response_text: str) -> LegalAnalysisResult:
+        """Parse an analysis response, falling back to a placeholder result if it is unusable"""
+        try:
+            return self._parse_analysis_json(response_text)
+        except ValueError:
+            return self._get_unparsed_result()
+    
+    def _parse_analysis_json(self, response_text: str) -> LegalAnalysisResult:
+        """
+        Parse an analysis response, raising ValueError if no usable result is found
+        
+        The JSON object is cut out and parsed with orjson first. langchain's output
+        parser repairs malformed JSON but scans it character by character in Python
+        (tens of milliseconds for a long reply), so it is only the fallback.
+        """
+        try:
+            return self._extract_json_result(response_text)
+        except ValueError:
+            pass
+        
+        try:
+            return self._parser.parse(response_text)
+        except Exception as parse_error:
+            logger.warning("Failed to parse structured output: %s", parse_error)
+            raise ValueError(f"Unusable analysis response: {parse_error}") from parse_error
+    
+    def build_batch_request(
+        self,
+        custom_id: str,
+        question_text: str,
+        context: Optional[str] = None,
+        question_type_hint: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Build one OpenAI Batch API request line for a question analysis
+        
+        Uses the same prompts and model settings as analyze_legal_question, so a
+        batched analysis is parsed exactly like a live one.
+        """
+        system_prompt, user_prompt = self.build_analysis_prompts(
+            question_text, context, question_type_hint
+        )
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": self.model_name,
+                "max_tokens": self.max_tokens,
+                "temperature": ANALYSIS_TEMPERATURE,
+                "messages": [
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ]
+            }
+        }
+    
     def _get_system_prompt(self) -> str:
         """Get the system prompt for legal analysis"""
         return """你是一位專業的法律專家，專門分析臺灣國家考試的法律題目。你的任務是：
@@ -190,21 +458,24 @@ class LLMService:
         
         return prompt
     
-    def _fallback_parse(self, response_text: str) -> LegalAnalysisResult:
-        """Fallback parsing when structured parsing fails"""
+    def _extract_json_result(self, response_text: str) -> LegalAnalysisResult:
+        """Parse the outermost JSON object in a response; raises ValueError if it is not a valid result"""
         try:
-            # Try to extract JSON from response
+            # Skip any markdown fence or commentary around the object
             start_idx = response_text.find('{')
             end_idx = response_text.rfind('}') + 1
             
             if start_idx != -1 and end_idx != -1:
                 json_str = response_text[start_idx:end_idx]
-                data = json.loads(json_str)
+                data = orjson.loads(json_str)
                 return LegalAnalysisResult(**data)
-        except Exception:
-            pass
+        except Exception as e:
+            raise ValueError(f"Unusable analysis response: {e}") from e
         
-        # Ultimate fallback - create basic result
+        raise ValueError("No JSON object in analysis response")
+    
+    def _get_unparsed_result(self) -> LegalAnalysisResult:
+        """Get basic result when an LLM response cannot be parsed"""
         return LegalAnalysisResult(
             question_type="未分類",
             difficulty_level="中級",
@@ -247,23 +518,39 @@ class LLMService:
 格式：[{{"concept": "...", "description": "...", "category": "..."}}]"""
 
             messages = [HumanMessage(content=prompt)]
-            response = await self._llm.agenerate([messages])
-            response_text = response.generations[0][0].text
             
             # Parse JSON response
-            concepts = json.loads(response_text)
+            concepts, _ = await self._complete(messages, orjson.loads)
             return concepts
             
         except Exception as e:
-            logger.error(f"Legal concept extraction failed: {e}")
+            logger.error("Legal concept extraction failed: %s", e)
             return []
     
     async def find_similar_questions(
         self, 
         question_text: str, 
-        question_bank: List[str]
+        question_bank: List[str],
+        limit: int = SIMILAR_QUESTION_LIMIT
     ) -> List[Dict[str, Any]]:
-        """Find similar questions from a question bank"""
+        """
+        Find similar questions from a question bank
+        
+        The whole bank is ranked by cosine similarity of local sentence embeddings
+        (one batched encode and a dot product). Only when embeddings are unavailable
+        are the first 10 questions sent to the LLM to compare instead.
+        """
+        if not question_bank:
+            return []
+        
+        try:
+            similar_questions = await self._rank_by_embedding(question_text, question_bank, limit)
+        except Exception as e:
+            logger.error("Similar question search failed: %s", e)
+            return []
+        if similar_questions is not None:
+            return similar_questions
+        
         if not self.is_available():
             return []
         
@@ -286,15 +573,36 @@ class LLMService:
 格式：[{{"question_number": 1, "similarity_score": 0.8, "reason": "..."}}]"""
 
             messages = [HumanMessage(content=prompt)]
-            response = await self._llm.agenerate([messages])
-            response_text = response.generations[0][0].text
-            
-            similar_questions = json.loads(response_text)
+            similar_questions, _ = await self._complete(messages, orjson.loads)
             return similar_questions
             
         except Exception as e:
-            logger.error(f"Similar question search failed: {e}")
+            logger.error("Similar question search failed: %s", e)
             return []
+    
+    async def _rank_by_embedding(
+        self,
+        question_text: str,
+        question_bank: List[str],
+        limit: int
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Top bank questions by embedding similarity, or None when embeddings are unavailable"""
+        # Imported here because the semantic cache module imports this one
+        from .semantic_cache import semantic_cache
+        
+        vectors = await semantic_cache.embed_many([question_text, *question_bank])
+        if vectors is None:
+            return None
+        
+        scores = vectors[1:] @ vectors[0]
+        return [
+            {
+                "question_number": int(index) + 1,
+                "similarity_score": round(float(scores[index]), 4),
+                "reason": "語意相似度"
+            }
+            for index in np.argsort(-scores)[:limit]
+        ]
 
 
 # Global LLM service instance
@@ -0,0 +1,218 @@
+"""
+Semantic cache for LLM question analyses
+"""
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..core.config import settings
+from .llm_service import LegalAnalysisResult
+
+logger = logging.getLogger(__name__)
+
+
+class _Namespace:
+    """Bounded ring buffer of normalized embeddings and their cached results"""
+    
+    _INITIAL_ROWS = 64
+    
+    def __init__(self, capacity: int, dimensions: int):
+        # Grow towards capacity so rarely used namespaces stay small
+        self.capacity = capacity
+        self.vectors = np.zeros((min(capacity, self._INITIAL_ROWS), dimensions), dtype=np.float32)
+        self.entries: List[Optional[Tuple[float, Dict[str, Any], Dict[str, Any]]]] = []
+        self.size = 0
+        self.next_slot = 0
+    
+    def nearest(self, vector: np.ndarray) -> Tuple[int, float]:
+        """Index and cosine similarity of the closest stored vector"""
+        scores = self.vectors[:self.size] @ vector
+        slot = int(np.argmax(scores))
+        return slot, float(scores[slot])
+    
+    def add(self, vector: np.ndarray, entry: Tuple[float, Dict[str, Any], Dict[str, Any]]):
+        """Store a vector, overwriting the oldest entry once full"""
+        if self.size < self.capacity:
+            if self.size == len(self.vectors):
+                grown = np.zeros((min(self.capacity, self.size * 2), self.vectors.shape[1]), dtype=np.float32)
+                grown[:self.size] = self.vectors
+                self.vectors = grown
+            self.vectors[self.size] = vector
+            self.entries.append(entry)
+            self.size += 1
+            return
+        
+        self.vectors[self.next_slot] = vector
+        self.entries[self.next_slot] = entry
+        self.next_slot = (self.next_slot + 1) % self.capacity
+
+
+class SemanticCache:
+    """
+    Nearest-neighbour cache of LLM analysis results keyed on question embeddings
+    
+    A paraphrase of a recently analyzed question reuses the stored result instead
+    of paying seconds of LLM latency. Entries are namespaced by question type hint
+    and context, since the same question analyzed under a different hint or
+    context legitimately gets a different answer. Since both come from the
+    client, only the ``max_namespaces`` most recently used namespaces are kept.
+    
+    Embeddings are computed locally with sentence-transformers; if it is not
+    installed, or SEMANTIC_CACHE_ENABLED is off, the cache disables itself. The index lives in process memory
+    (one per API or Celery worker process) and is a brute-force dot product
+    over at most ``max_entries`` vectors per namespace, which stays well under a
+    millisecond at this size.
+    """
+    
+    def __init__(
+        self,
+        enabled: bool,
+        model_name: str,
+        threshold: float,
+        ttl_seconds: int,
+        max_entries: int,
+        max_namespaces: int
+    ):
+        self.model_name = model_name
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_namespaces = max_namespaces
+        self._model = None
+        self._disabled = not enabled
+        self._load_lock = threading.Lock()
+        self._namespaces: "OrderedDict[str, _Namespace]" = OrderedDict()
+    
+    async def embed(self, question_text: str) -> Optional[np.ndarray]:
+        """
+        Normalized embedding of a question, computed once per analysis for get/put
+        
+        Returns:
+            The embedding, or None when the cache is disabled or unavailable
+        """
+        vectors = await self.embed_many([question_text])
+        return vectors[0] if vectors is not None else None
+    
+    async def embed_many(self, texts: List[str]) -> Optional[np.ndarray]:
+        """
+        Normalized embeddings of several texts, encoded in one batch
+        
+        Returns:
+            Array with one row per text, or None when the cache is disabled or unavailable
+        """
+        if self._disabled:
+            return None
+        model = self._model
+        if model is None:
+            model = await asyncio.to_thread(self._get_model)
+            if model is None:
+                return None
+        
+        # Encoding is CPU-bound; keep it off the event loop
+        vectors = await asyncio.to_thread(model.encode, texts, normalize_embeddings=True)
+        return np.asarray(vectors, dtype=np.float32)
+    
+    def get(
+        self,
+        vector: np.ndarray,
+        question_type_hint: Optional[str] = None,
+        context: Optional[str] = None
+    ) -> Optional[Tuple[LegalAnalysisResult, Dict[str, Any]]]:
+        """
+        Look up a cached analysis for the question or a close paraphrase of it
+        
+        Returns:
+            Tuple of (analysis_result, metadata) on a hit, otherwise None
+        """
+        key = self._namespace_key(question_type_hint, context)
+        namespace = self._namespaces.get(key)
+        if namespace is None or namespace.size == 0:
+            return None
+        self._namespaces.move_to_end(key)
+        
+        slot, similarity = namespace.nearest(vector)
+        expires_at, result, metadata = namespace.entries[slot]
+        if similarity < self.threshold or expires_at < time.monotonic():
+            return None
+        
+        logger.info("Semantic cache hit (similarity %.3f)", similarity)
+        return (
+            LegalAnalysisResult(**result),
+            {**metadata, "cache_hit": True, "cache_similarity": round(similarity, 4)}
+        )
+    
+    def put(
+        self,
+        vector: np.ndarray,
+        analysis_result: LegalAnalysisResult,
+        metadata: Dict[str, Any],
+        question_type_hint: Optional[str] = None,
+        context: Optional[str] = None
+    ):
+        """Store a successful LLM analysis for later paraphrase lookups"""
+        key = self._namespace_key(question_type_hint, context)
+        namespace = self._namespaces.get(key)
+        if namespace is None:
+            namespace = self._namespaces[key] = _Namespace(self.max_entries, vector.shape[0])
+            if len(self._namespaces) > self.max_namespaces:
+                self._namespaces.popitem(last=False)
+        else:
+            self._namespaces.move_to_end(key)
+        
+        namespace.add(vector, (
+            time.monotonic() + self.ttl_seconds,
+            analysis_result.model_dump(),
+            metadata
+        ))
+    
+    def clear(self):
+        """Drop every cached analysis"""
+        self._namespaces.clear()
+    
+    @staticmethod
+    def _namespace_key(question_type_hint: Optional[str], context: Optional[str]) -> str:
+        """Partition key separating results that must never be shared"""
+        context_digest = hashlib.blake2b((context or "").encode(), digest_size=8).hexdigest()
+        return f"{question_type_hint or ''}:{context_digest}"
+    
+    def _get_model(self):
+        """Load the embedding model on first use (runs in a worker thread)"""
+        if self._model is not None or self._disabled:
+            return self._model
+        
+        with self._load_lock:
+            if self._model is None and not self._disabled:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    
+                    self._model = SentenceTransformer(self.model_name)
+                    logger.info("Semantic cache initialized with model: %s", self.model_name)
+                    
+                except ImportError:
+                    logger.warning(
+                        "sentence-transformers not installed, semantic cache disabled. "
+                        "Install with: pip install sentence-transformers"
+                    )
+                    self._disabled = True
+                except Exception as e:
+                    logger.error("Failed to load semantic cache model: %s", e)
+                    self._disabled = True
+        
+        return self._model
+
+
+# Global semantic cache instance
+semantic_cache = SemanticCache(
+    enabled=settings.semantic_cache_enabled,
+    model_name=settings.semantic_cache_model,
+    threshold=settings.semantic_cache_threshold,
+    ttl_seconds=settings.semantic_cache_ttl_seconds,
+    max_entries=settings.semantic_cache_max_entries,
+    max_namespaces=settings.semantic_cache_max_namespaces
+)
@@ -0,0 +1 @@
+# Background tasks for Legal Statute Analysis System
\ No newline at end of file
@@ -0,0 +1,73 @@
+"""
+Celery tasks for legal question analysis
+"""
+import logging
+from typing import Optional
+
+from ..core.celery_app import celery_app
+from ..core.database import AsyncSessionLocal, cache_delete
+from ..services.analysis_service import analysis_service, stats_cache_key
+from ..services.batch_service import batch_analysis_service
+from .event_loop import run as _run
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(name="analysis.analyze_question")
+def analyze_question_task(
+    analysis_id: str,
+    user_id: str,
+    context: Optional[str] = None,
+    question_type_hint: Optional[str] = None
+):
+    """
+    Complete a pending question analysis created by the API
+    
+    The arguments come from a QuestionAnalysisRequest that was already validated
+    by the endpoint, so they are passed as plain values and not re-validated here.
+    """
+    _run(_analyze_question(analysis_id, user_id, context, question_type_hint))
+
+
+async def _analyze_question(
+    analysis_id: str,
+    user_id: str,
+    context: Optional[str],
+    question_type_hint: Optional[str]
+):
+    async with AsyncSessionLocal() as db:
+        try:
+            await analysis_service.complete_pending_analysis(
+                analysis_id=analysis_id,
+                db=db,
+                context=context,
+                question_type_hint=question_type_hint
+            )
+        except Exception as e:
+            logger.error("Background analysis %s failed: %s", analysis_id, e)
+            await db.rollback()
+            await analysis_service.mark_analysis_failed(analysis_id, db)
+    
+    await cache_delete(stats_cache_key(user_id))
+
+
+@celery_app.task(name="analysis.submit_batches")
+def submit_analysis_batches_task():
+    """Submit analyses queued for the OpenAI Batch API since the last run"""
+    _run(_submit_analysis_batches())
+
+
+async def _submit_analysis_batches():
+    async with AsyncSessionLocal() as db:
+        await batch_analysis_service.submit_pending_batches(db)
+
+
+@celery_app.task(name="analysis.collect_batches")
+def collect_analysis_batches_task():
+    """Write the results of finished OpenAI batches onto their analyses"""
+    _run(_collect_analysis_batches())
+
+
+async def _collect_analysis_batches():
+    async with AsyncSessionLocal() as db:
+        await batch_analysis_service.collect_finished_batches(db)
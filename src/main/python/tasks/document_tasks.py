@@ -0,0 +1,34 @@
+"""
+Celery tasks for document text extraction
+"""
+import logging
+import uuid
+
+from ..core.celery_app import celery_app
+from ..core.database import AsyncSessionLocal, cache_delete
+from ..services.document_service import document_service, stats_cache_key
+from .event_loop import run as _run
+
+logger = logging.getLogger(__name__)
+
+
+@celery_app.task(name="documents.process_document")
+def process_document_task(document_id: str, user_id: str):
+    """
+    Run OCR on an uploaded document
+    
+    process_document commits the processing/completed/failed status
+    transitions itself, so clients poll the document to follow progress.
+    """
+    _run(_process_document(document_id, user_id))
+
+
+async def _process_document(document_id: str, user_id: str):
+    async with AsyncSessionLocal() as db:
+        try:
+            await document_service.process_document(uuid.UUID(document_id), db)
+        except Exception as e:
+            # The document has already been marked as failed
+            logger.error("Background processing of document %s failed: %s", document_id, e)
+    
+    await cache_delete(stats_cache_key(user_id))
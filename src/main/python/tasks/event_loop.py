@@ -0,0 +1,16 @@
+"""
+Event loop shared by the Celery tasks of a worker process
+"""
+import asyncio
+from typing import Optional
+
+# One event loop per worker process, so pooled async DB connections stay usable across tasks
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def run(coro):
+    """Run a coroutine on the worker's event loop"""
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+    return _loop.run_until_complete(coro)
@@ -1,17 +1,28 @@
 """
 File storage utility for handling uploaded documents
 """
+import asyncio
+import hashlib
+import io
 import os
 import uuid
 from pathlib import Path
-from typing import Optional, BinaryIO
-import shutil
+from typing import AsyncIterable, Optional, BinaryIO
 import logging
 
 from ..core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Bytes handed to each sendfile() call when copying uploads in-kernel
+SENDFILE_CHUNK_SIZE = 8 * 1024 * 1024
+# Bytes read per iteration when copying in-memory uploads
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class FileTooLargeError(ValueError):
+    """Raised when an upload exceeds the configured size limit"""
+
 
 class FileStorage:
     """File storage manager for uploaded documents"""
@@ -19,19 +30,21 @@ class FileStorage:
     def __init__(self):
         self.upload_dir = Path(settings.upload_dir)
         self.max_file_size = settings.max_file_size
-        self.allowed_extensions = settings.allowed_extensions.split(',')
+        # Normalized to lower case with a leading dot, e.g. "PDF, .png" -> {".pdf", ".png"}
+        self.allowed_extensions = frozenset(
+            "." + ext.strip().lstrip(".").lower()
+            for ext in settings.allowed_extensions.split(",")
+            if ext.strip()
+        )
         
         # Create upload directory if it doesn't exist
         self.upload_dir.mkdir(parents=True, exist_ok=True)
-        logger.info(f"File storage initialized: {self.upload_dir}")
+        logger.info("File storage initialized: %s", self.upload_dir)
     
     def is_allowed_file(self, filename: str) -> bool:
         """Check if file extension is allowed"""
-        if not filename:
-            return False
-        
-        file_ext = Path(filename).suffix.lower()
-        return file_ext in self.allowed_extensions
+        _, dot, ext = filename.rpartition(".")
+        return bool(dot) and f".{ext.lower()}" in self.allowed_extensions
     
     def check_file_size(self, file_size: int) -> bool:
         """Check if file size is within limits"""
@@ -43,12 +56,12 @@ class FileStorage:
         unique_id = str(uuid.uuid4())
         return f"{unique_id}{file_ext}"
     
-    def save_file(self, file: BinaryIO, original_filename: str) -> tuple[str, str]:
+    def save_file(self, file: BinaryIO, original_filename: str) -> tuple[str, str, int, str]:
         """
-        Save uploaded file to storage
+        Save uploaded file to storage, enforcing the size limit while copying
         
         Returns:
-            tuple[str, str]: (unique_filename, file_path)
+            tuple[str, str, int, str]: (unique_filename, file_path, file_size, sha256 hex digest)
         """
         if not self.is_allowed_file(original_filename):
             raise ValueError(f"File type not allowed: {Path(original_filename).suffix}")
@@ -59,24 +72,139 @@ class FileStorage:
         
         try:
             with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file, buffer)
-            
-            # Verify file size after saving
-            file_size = file_path.stat().st_size
-            if not self.check_file_size(file_size):
-                file_path.unlink()  # Delete the file
-                raise ValueError(f"File size exceeds limit: {file_size} bytes")
+                file_size, digest = self._copy_file(file, buffer, self.max_file_size)
             
-            logger.info(f"File saved successfully: {unique_filename}")
-            return unique_filename, str(file_path)
+            logger.info("File saved successfully: %s", unique_filename)
+            return unique_filename, str(file_path), file_size, digest
             
         except Exception as e:
             # Clean up on error
             if file_path.exists():
                 file_path.unlink()
-            logger.error(f"Error saving file: {e}")
+            logger.error("Error saving file: %s", e)
+            raise
+    
+    @staticmethod
+    def _copy_file(file: BinaryIO, buffer: BinaryIO, max_size: int) -> tuple[int, str]:
+        """
+        Copy an upload into an open destination file
+        
+        When the source is a real file (an upload spooled to disk), its size is
+        known up front and the data is moved with sendfile() without entering user
+        space; in-memory sources are copied chunk by chunk. Either way the copy
+        stops as soon as the upload is known to exceed ``max_size``, so an
+        oversized upload never writes more than the limit to disk.
+        
+        Returns:
+            tuple[int, str]: (bytes copied, sha256 hex digest of the content)
+        
+        Raises:
+            FileTooLargeError: The upload is larger than ``max_size``
+        """
+        too_large = FileTooLargeError(f"File size exceeds limit: {max_size} bytes")
+        
+        # fileno() would force an in-memory SpooledTemporaryFile onto disk first
+        in_fd = None
+        if hasattr(os, "sendfile") and getattr(file, "_rolled", True):
+            try:
+                in_fd = file.fileno()
+            except (AttributeError, OSError, io.UnsupportedOperation):
+                pass
+        
+        if in_fd is None:
+            copied = 0
+            digest = hashlib.sha256()
+            while chunk := file.read(COPY_CHUNK_SIZE):
+                copied += len(chunk)
+                if copied > max_size:
+                    raise too_large
+                digest.update(chunk)
+                buffer.write(chunk)
+            return copied, digest.hexdigest()
+        
+        # Start from the current position, as a read loop would
+        start = offset = file.tell()
+        if os.fstat(in_fd).st_size - start > max_size:
+            raise too_large
+        
+        # The hash needs the bytes in user space; read them from the (page-cached)
+        # spool file, then let sendfile() copy from the same starting offset
+        digest = hashlib.file_digest(file, "sha256").hexdigest()
+        
+        out_fd = buffer.fileno()
+        while True:
+            sent = os.sendfile(out_fd, in_fd, offset, SENDFILE_CHUNK_SIZE)
+            if sent == 0:
+                break
+            offset += sent
+        return offset - start, digest
+    
+    async def save_file_async(self, file: BinaryIO, original_filename: str) -> tuple[str, str, int, str]:
+        """
+        Save uploaded file to storage without blocking the event loop
+        
+        The copy (and size check) runs in a worker thread, so other requests keep
+        being served while a large upload is written to disk.
+        
+        Returns:
+            tuple[str, str, int, str]: (unique_filename, file_path, file_size, sha256 hex digest)
+        """
+        return await asyncio.to_thread(self.save_file, file, original_filename)
+    
+    async def write_stream(self, chunks: AsyncIterable[bytes], original_filename: str) -> tuple[str, str, int, str]:
+        """
+        Write an upload to storage chunk by chunk, enforcing the size limit as it arrives
+        
+        Returns:
+            tuple[str, str, int, str]: (unique_filename, file_path, file_size, sha256 hex digest)
+        """
+        if not self.is_allowed_file(original_filename):
+            raise ValueError(f"File type not allowed: {Path(original_filename).suffix}")
+        
+        unique_filename = self.generate_unique_filename(original_filename)
+        file_path = self.upload_dir / unique_filename
+        file_size = 0
+        digest = hashlib.sha256()
+        
+        try:
+            with open(file_path, "wb") as buffer:
+                async for chunk in chunks:
+                    file_size += len(chunk)
+                    if not self.check_file_size(file_size):
+                        raise FileTooLargeError(f"File size exceeds limit: {self.max_file_size} bytes")
+                    digest.update(chunk)
+                    buffer.write(chunk)
+            
+            logger.info("File saved successfully: %s", unique_filename)
+            return unique_filename, str(file_path), file_size, digest.hexdigest()
+            
+        except Exception as e:
+            # Clean up the partial file
+            await asyncio.to_thread(file_path.unlink, missing_ok=True)
+            logger.error("Error saving file: %s", e)
             raise
     
+    def link_duplicate(self, file_path: str, existing_path: str) -> bool:
+        """
+        Replace a stored file with a hard link to an identical, already stored file
+        
+        Each document keeps its own path, so deleting one copy never affects the
+        other, but the content is only stored once. The swap is atomic; if linking
+        fails (e.g. the existing file is gone), the new copy is left in place.
+        
+        Returns:
+            bool: True if the file now shares storage with ``existing_path``
+        """
+        temp_path = f"{file_path}.link"
+        try:
+            os.link(existing_path, temp_path)
+            os.replace(temp_path, file_path)
+            return True
+        except OSError as e:
+            logger.warning("Could not link %s to %s: %s", file_path, existing_path, e)
+            Path(temp_path).unlink(missing_ok=True)
+            return False
+    
     def get_file_path(self, filename: str) -> Optional[Path]:
         """Get full path to stored file"""
         file_path = self.upload_dir / filename
@@ -86,34 +214,34 @@ class FileStorage:
         """Delete file from storage"""
         file_path = self.upload_dir / filename
         try:
-            if file_path.exists():
-                file_path.unlink()
-                logger.info(f"File deleted: {filename}")
-                return True
+            file_path.unlink()
+            logger.info("File deleted: %s", filename)
+            return True
+        except FileNotFoundError:
             return False
         except Exception as e:
-            logger.error(f"Error deleting file {filename}: {e}")
+            logger.error("Error deleting file %s: %s", filename, e)
             return False
     
     def get_file_info(self, filename: str) -> Optional[dict]:
         """Get file information"""
-        file_path = self.get_file_path(filename)
-        if not file_path:
-            return None
-        
+        file_path = self.upload_dir / filename
         try:
             stat = file_path.stat()
-            return {
-                "filename": filename,
-                "size": stat.st_size,
-                "created_at": stat.st_ctime,
-                "modified_at": stat.st_mtime,
-                "extension": file_path.suffix,
-                "path": str(file_path)
-            }
+        except FileNotFoundError:
+            return None
         except Exception as e:
-            logger.error(f"Error getting file info for {filename}: {e}")
+            logger.error("Error getting file info for %s: %s", filename, e)
             return None
+        
+        return {
+            "filename": filename,
+            "size": stat.st_size,
+            "created_at": stat.st_ctime,
+            "modified_at": stat.st_mtime,
+            "extension": file_path.suffix,
+            "path": str(file_path)
+        }
 
 
 # Global file storage instance
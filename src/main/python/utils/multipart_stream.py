@@ -0,0 +1,108 @@
+"""
+Incremental multipart/form-data parsing for streaming uploads
+"""
+from typing import AsyncIterator, Dict, List, Optional
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+
+class MultipartFileStream:
+    """
+    Parse a multipart/form-data body as it arrives and expose one file field as a chunk stream
+    
+    Unlike form parsing in the framework, the file is never spooled to a temporary
+    file first: each body chunk is parsed and its file data handed straight on.
+    """
+    
+    def __init__(self, content_type: str, body: AsyncIterator[bytes], field_name: str = "file"):
+        media_type, params = parse_options_header(content_type or "")
+        if media_type != b"multipart/form-data" or b"boundary" not in params:
+            raise ValueError("Expected a multipart/form-data body with a boundary")
+        
+        self.field_name = field_name
+        self.filename: Optional[str] = None
+        self._body = body.__aiter__()
+        self._pending: List[bytes] = []
+        self._in_file_part = False
+        self._file_done = False
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._parser = MultipartParser(params[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+        })
+    
+    async def open(self) -> str:
+        """
+        Read the body until the file field's headers have been parsed
+        
+        Returns:
+            The uploaded file's name
+            
+        Raises:
+            ValueError: If the body has no file under the expected field name
+        """
+        while self.filename is None:
+            if not await self._feed():
+                raise ValueError(f"No '{self.field_name}' file in upload")
+        return self.filename
+    
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """Yield the file's content as it is parsed from the body"""
+        while True:
+            if self._pending:
+                data = b"".join(self._pending)
+                self._pending.clear()
+                yield data
+            if self._file_done or not await self._feed():
+                return
+    
+    async def _feed(self) -> bool:
+        """Parse the next body chunk; returns False once the body is exhausted"""
+        try:
+            chunk = await self._body.__anext__()
+        except StopAsyncIteration:
+            self._parser.finalize()
+            return False
+        self._parser.write(chunk)
+        return True
+    
+    def _on_part_begin(self):
+        self._headers = {}
+    
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+    
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+    
+    def _on_header_end(self):
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+    
+    def _on_headers_finished(self):
+        if self.filename is not None:
+            return
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        if options.get(b"name") == self.field_name.encode() and b"filename" in options:
+            self.filename = options[b"filename"].decode("utf-8", errors="replace")
+            self._in_file_part = True
+    
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_file_part:
+            self._pending.append(data[start:end])
+    
+    def _on_part_end(self):
+        if self._in_file_part:
+            self._in_file_part = False
+            self._file_done = True
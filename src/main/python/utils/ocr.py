@@ -1,16 +1,62 @@
 """
 OCR (Optical Character Recognition) utility for document text extraction
 """
+import errno
+import gc
 import logging
+import os
+import threading
+import time
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import TYPE_CHECKING, Optional, List, Dict, Any, Callable, Iterator, Union
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+
+from tenacity import (
+    before_sleep_log,
+    retry,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential,
+)
 
 from ..core.config import settings
 
+if TYPE_CHECKING:
+    from PIL import Image
+
 logger = logging.getLogger(__name__)
 
+# Upper bound on the default OCR concurrency; each job can hold hundreds of MB
+OCR_DEFAULT_MAX_CONCURRENCY = 4
+
+# Tesseract language packs for OCR_LANGUAGE values; others use Tesseract's default
+TESSERACT_LANGUAGES = {"ch_tra": "chi_tra", "ch_sim": "chi_sim"}
+
+# Pages whose text layer has at least this many characters are taken as-is, not OCR'd
+NATIVE_TEXT_MIN_CHARS = 50
+
+# Retry policy for OCR engine calls that fail for lack of resources under load
+OCR_RETRY_ATTEMPTS = 3
+OCR_RETRY_MIN_WAIT_SECONDS = 1
+OCR_RETRY_MAX_WAIT_SECONDS = 10
+# errno values of OSErrors that clear up once other jobs release their resources
+_TRANSIENT_ERRNOS = frozenset({errno.EAGAIN, errno.ENOMEM, errno.EMFILE, errno.ENFILE})
+
+
+def _is_transient_ocr_error(exc: BaseException) -> bool:
+    """Whether an OCR engine error is worth retrying (resource exhaustion, not bad input)"""
+    if isinstance(exc, MemoryError):
+        return True
+    if isinstance(exc, OSError) and exc.errno in _TRANSIENT_ERRNOS:
+        return True
+    # Native engines surface allocation failures as generic errors
+    message = str(exc).lower()
+    return "out of memory" in message or "resource exhausted" in message
+
 
 class OCRProcessor:
     """OCR processor for extracting text from documents"""
@@ -18,10 +64,62 @@ class OCRProcessor:
     def __init__(self):
         self.engine = settings.ocr_engine
         self.language = settings.ocr_language
-        self.executor = ThreadPoolExecutor(max_workers=2)
+        # Documents OCR'd at once per process, whether from uploads, the process
+        # endpoint or batches: every extraction runs on this pool, so further jobs
+        # queue here instead of each holding rendered pages and engine buffers
+        self.max_concurrency = settings.ocr_max_concurrency or min(OCR_DEFAULT_MAX_CONCURRENCY, os.cpu_count() or 1)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        
+        # The engine (PaddlePaddle alone takes seconds to import) is loaded on first
+        # use, so processes that never OCR, e.g. API servers queueing OCR to Celery,
+        # don't pay for it at startup
+        self.ocr_engine = None
+        self._ocr_available = False
+        self._engine_loaded = False
+        self._engine_load_lock = threading.Lock()
+        
+        # Pages of a PDF are OCR'd concurrently when the engine allows it: Tesseract
+        # runs each call in its own subprocess, while a PaddleOCR predictor must not
+        # be shared between threads. The pool is shared by all documents, so it also
+        # caps the page-level work of the whole process.
+        self.page_concurrency = settings.ocr_concurrency or min(OCR_DEFAULT_MAX_CONCURRENCY, os.cpu_count() or 1)
+        if self.engine != "tesseract":
+            self.page_concurrency = 1
+        self.page_executor = None
+        if self.page_concurrency > 1:
+            self.page_executor = ThreadPoolExecutor(
+                max_workers=self.page_concurrency, thread_name_prefix="ocr-page"
+            )
+        # Every engine call holds a slot, including single images OCR'd straight from
+        # the document executor, so the engine never runs more than page_concurrency
+        # calls at once (one for PaddleOCR)
+        self._engine_slots = threading.BoundedSemaphore(self.page_concurrency)
         
-        # Initialize OCR engine
-        self._init_ocr_engine()
+        # PaddleOCR's memory grows over a long-lived process; an engine left idle is
+        # dropped and reloaded on the next call
+        self._last_engine_use = time.monotonic()
+    
+    def is_available(self) -> bool:
+        """Whether a real OCR engine is usable (otherwise placeholder text is returned)"""
+        self._ensure_engine()
+        return self._ocr_available
+    
+    def _ensure_engine(self):
+        """Load the OCR engine the first time it is needed"""
+        if self._engine_loaded:
+            return
+        with self._engine_load_lock:
+            if self._engine_loaded:
+                return
+            self._init_ocr_engine()
+            self._engine_loaded = True
+            if self.engine == "paddleocr" and self._ocr_available:
+                self._last_engine_use = time.monotonic()
+                self._schedule_idle_release(settings.ocr_engine_idle_timeout_seconds)
+    
+    def result_cache_key(self, content_sha256: str) -> str:
+        """Cache key for the OCR result of a file; changes with the engine settings"""
+        return f"ocr:{self.engine}:{self.language}:{settings.ocr_render_zoom}:{content_sha256}"
     
     def _init_ocr_engine(self):
         """Initialize the selected OCR engine"""
@@ -33,16 +131,16 @@ class OCRProcessor:
             elif self.engine == "tesseract":
                 self._init_tesseract()
             else:
-                logger.warning(f"Unsupported OCR engine: {self.engine}, using fallback mode")
+                logger.warning("Unsupported OCR engine: %s, using fallback mode", self.engine)
                 return
                 
-            logger.info(f"OCR engine initialized: {self.engine}")
+            logger.info("OCR engine initialized: %s", self.engine)
             
         except ImportError as e:
-            logger.warning(f"OCR engine {self.engine} not available: {e}")
+            logger.warning("OCR engine %s not available: %s", self.engine, e)
             logger.info("OCR functionality will be limited to basic text extraction")
         except Exception as e:
-            logger.warning(f"Error initializing OCR engine: {e}")
+            logger.warning("Error initializing OCR engine: %s", e)
             logger.info("OCR functionality will work in fallback mode")
     
     def _init_paddleocr(self):
@@ -53,11 +151,25 @@ class OCRProcessor:
             # PaddleOCR supports Chinese Traditional
             lang_code = 'chinese_cht' if self.language == 'ch_tra' else 'ch'
             
+            # Optional replacement models (e.g. INT8-quantized); None keeps the defaults
+            model_dirs = {
+                "det_model_dir": settings.ocr_det_model_dir,
+                "rec_model_dir": settings.ocr_rec_model_dir,
+            }
+            
+            # Calls are serialized on one predictor (see _engine_slots), so it may
+            # use every core; oneDNN kernels cut CPU inference latency
             self.ocr_engine = PaddleOCR(
                 use_angle_cls=True,
                 lang=lang_code,
                 use_gpu=False,  # Set to True if GPU available
-                show_log=False
+                enable_mkldnn=settings.ocr_enable_mkldnn,
+                cpu_threads=settings.ocr_cpu_threads or os.cpu_count() or 1,
+                # On CPU the recognizer runs a batch's crops one after another anyway;
+                # the default batch of 6 only inflates the predictor's memory arena
+                rec_batch_num=1,
+                show_log=False,
+                **{key: path for key, path in model_dirs.items() if path}
             )
             self._ocr_available = True
             
@@ -76,6 +188,10 @@ class OCRProcessor:
             
             self.pytesseract = pytesseract
             self.Image = Image
+            # Page segmentation mode 6: a single uniform block of text
+            self._tesseract_config = '--psm 6'
+            if self.language in TESSERACT_LANGUAGES:
+                self._tesseract_config += f' -l {TESSERACT_LANGUAGES[self.language]}'
             self._ocr_available = True
             
         except ImportError:
@@ -85,78 +201,193 @@ class OCRProcessor:
             logger.warning("Tesseract executable not found. Please install Tesseract OCR")
             raise
     
-    def _extract_text_paddleocr(self, image_path: Path) -> str:
-        """Extract text using PaddleOCR"""
+    @retry(
+        retry=retry_if_exception(_is_transient_ocr_error),
+        wait=wait_exponential(min=OCR_RETRY_MIN_WAIT_SECONDS, max=OCR_RETRY_MAX_WAIT_SECONDS),
+        stop=stop_after_attempt(OCR_RETRY_ATTEMPTS),
+        before_sleep=before_sleep_log(logger, logging.WARNING),
+        reraise=True
+    )
+    def _call_engine(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run one OCR engine call in a concurrency slot
+        
+        Resource exhaustion under load (out of memory, too many processes or open
+        files) is retried with exponential backoff; the slot is released while
+        waiting so other calls can finish and free their resources.
+        """
+        with self._engine_slots:
+            return func(*args, **kwargs)
+    
+    def _run_paddleocr(self, image: Union[str, np.ndarray]) -> Any:
+        """Run PaddleOCR on one image, reloading the engine if it was released while idle"""
+        if self.ocr_engine is None:
+            logger.info("Reloading PaddleOCR engine")
+            self._init_paddleocr()
+            self._schedule_idle_release(settings.ocr_engine_idle_timeout_seconds)
+        self._last_engine_use = time.monotonic()
+        return self.ocr_engine.ocr(image, cls=True)
+    
+    def _schedule_idle_release(self, delay: float):
+        """Check again in ``delay`` seconds whether the engine has gone idle"""
+        if delay <= 0:
+            return
+        timer = threading.Timer(delay, self._release_idle_engine)
+        timer.daemon = True
+        timer.start()
+    
+    def _release_idle_engine(self):
+        """Drop the PaddleOCR engine if unused for the idle timeout, else check again later"""
+        timeout = settings.ocr_engine_idle_timeout_seconds
+        idle = time.monotonic() - self._last_engine_use
+        if idle < timeout:
+            self._schedule_idle_release(timeout - idle)
+            return
+        
+        # PaddleOCR has a single slot: holding it means no call is using the engine
+        if not self._engine_slots.acquire(blocking=False):
+            self._schedule_idle_release(timeout)
+            return
+        try:
+            self.ocr_engine = None
+            gc.collect()
+            logger.info("Released PaddleOCR engine after %.0f s idle", idle)
+        finally:
+            self._engine_slots.release()
+    
+    def _extract_text_paddleocr(self, image: Union[Path, np.ndarray]) -> str:
+        """Extract text using PaddleOCR from an image file or a BGR or grayscale pixel array"""
+        if isinstance(image, Path):
+            image = str(image)
         try:
-            results = self.ocr_engine.ocr(str(image_path), cls=True)
+            results = self._call_engine(self._run_paddleocr, image)
             
             if not results or not results[0]:
                 return ""
             
-            # Extract text from results
-            text_lines = []
-            for line in results[0]:
-                if len(line) >= 2:
-                    text_lines.append(line[1][0])
-            
-            return "\n".join(text_lines)
+            # Extract text from results: each line is [box, (text, confidence)]
+            return "\n".join([line[1][0] for line in results[0] if len(line) >= 2])
             
         except Exception as e:
-            logger.error(f"PaddleOCR extraction error: {e}")
+            logger.error("PaddleOCR extraction error: %s", e)
             return ""
     
-    def _extract_text_tesseract(self, image_path: Path) -> str:
-        """Extract text using Tesseract"""
+    def _extract_text_tesseract(self, image: Union[Path, "Image.Image"]) -> str:
+        """Extract text using Tesseract from an image file or a PIL image"""
         try:
-            # Configure Tesseract for Traditional Chinese
-            config = '--psm 6'
-            if self.language == 'ch_tra':
-                config += ' -l chi_tra'
-            elif self.language == 'ch_sim':
-                config += ' -l chi_sim'
-            
-            image = self.Image.open(image_path)
-            text = self.pytesseract.image_to_string(image, config=config)
+            # A file path goes to the tesseract binary as-is; opening it with PIL first
+            # would only make pytesseract decode it and write it out again
+            if isinstance(image, Path):
+                image = str(image)
+            text = self._call_engine(self.pytesseract.image_to_string, image, config=self._tesseract_config)
             
             return text.strip()
             
         except Exception as e:
-            logger.error(f"Tesseract extraction error: {e}")
+            logger.error("Tesseract extraction error: %s", e)
             return ""
     
-    def _convert_pdf_to_images(self, pdf_path: Path) -> List[Path]:
-        """Convert PDF pages to images for OCR processing"""
-        try:
-            import fitz  # PyMuPDF
-            
-            doc = fitz.open(pdf_path)
-            image_paths = []
-            
-            for page_num in range(doc.page_count):
-                page = doc[page_num]
-                
-                # Render page as image
-                mat = fitz.Matrix(2.0, 2.0)  # 2x zoom for better quality
-                pix = page.get_pixmap(matrix=mat)
-                
-                # Save as PNG
-                image_path = pdf_path.parent / f"{pdf_path.stem}_page_{page_num + 1}.png"
-                pix.save(str(image_path))
-                image_paths.append(image_path)
-            
-            doc.close()
-            return image_paths
-            
-        except ImportError:
-            logger.error("PyMuPDF not installed. Install with: pip install pymupdf")
-            return []
-        except Exception as e:
-            logger.error(f"PDF conversion error: {e}")
-            return []
+    def _iter_pdf_pages(self, pdf_path: Path) -> Iterator[Union[str, np.ndarray]]:
+        """
+        Yield each PDF page's embedded text, or a rendering of it when it needs OCR
+        
+        Text-native pages are read from their text layer, orders of magnitude
+        cheaper than OCR; only pages with little or no text (scans) are rendered,
+        as grayscale pixel arrays (height x width). Renderings are handed to the
+        engine in memory rather than as PNG files, and one byte per pixel is all
+        either engine uses.
+        """
+        import fitz  # PyMuPDF
+        
+        zoom = settings.ocr_render_zoom
+        mat = fitz.Matrix(zoom, zoom)
+        with fitz.open(pdf_path) as doc:
+            for page in doc:
+                text = self._native_page_text(page)
+                if text is not None:
+                    yield text
+                    continue
+                pix = page.get_pixmap(matrix=mat, colorspace=fitz.csGRAY, alpha=False)
+                yield np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+    
+    @staticmethod
+    def _native_page_text(page: Any) -> Optional[str]:
+        """A page's embedded text, or None if it is too short to trust over OCR"""
+        text = page.get_text("text").strip()
+        return text if len(text) >= NATIVE_TEXT_MIN_CHARS else None
+    
+    def _extract_page_text(self, page: Union[str, np.ndarray]) -> str:
+        """Text of one page from _iter_pdf_pages, running OCR on renderings"""
+        if isinstance(page, str):
+            return page
+        
+        if self.engine == "paddleocr":
+            # PaddleOCR expands 2-D arrays to BGR itself
+            return self._extract_text_paddleocr(page)
+        
+        image = self.Image.fromarray(page)
+        # pytesseract passes images to the binary as a temp file in image.format
+        # (PNG by default); uncompressed PPM (PGM for grayscale) skips a DEFLATE
+        # pass per page
+        image.format = "PPM"
+        return self._extract_text_tesseract(image)
+    
+    def _extract_pages(self, pdf_path: Path) -> List[str]:
+        """
+        Extract the text of every page of a PDF, in page order
+        
+        Rendering and OCR overlap: with a page pool, rendering runs at most two
+        pool-fulls of pages ahead of OCR; without one, the next page is rendered on
+        a helper thread while the engine works on the current one. Either way the
+        whole document is never held in memory.
+        """
+        pages = self._iter_pdf_pages(pdf_path)
+        if self.page_executor is None:
+            return self._extract_pages_sequential(pages)
+        
+        texts = []
+        # Text-native pages are queued as-is so results stay in page order
+        pending = deque()
+        for page in pages:
+            pending.append(page if isinstance(page, str) else self.page_executor.submit(self._extract_page_text, page))
+            if len(pending) >= 2 * self.page_concurrency:
+                texts.append(self._page_result(pending.popleft()))
+        texts.extend(self._page_result(item) for item in pending)
+        return texts
+    
+    @staticmethod
+    def _page_result(item: Union[str, Future]) -> str:
+        """Text of a queued page: native text, or the OCR future's result"""
+        return item if isinstance(item, str) else item.result()
+    
+    def _extract_pages_sequential(self, pages: Iterator[Union[str, np.ndarray]]) -> List[str]:
+        """OCR pages one at a time while the following page renders in the background"""
+        texts = []
+        # All PyMuPDF work, including closing the document, stays on the render thread
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="ocr-render") as renderer:
+            try:
+                next_page = renderer.submit(next, pages, None)
+                while (page := next_page.result()) is not None:
+                    next_page = renderer.submit(next, pages, None)
+                    texts.append(self._extract_page_text(page))
+            finally:
+                renderer.submit(pages.close)
+        return texts
+    
+    def _fallback_pdf_pages(self, pdf_path: Path) -> List[str]:
+        """Embedded text per page when no OCR engine is available, placeholders for scans"""
+        import fitz  # PyMuPDF
+        
+        logger.warning("OCR engine not available, using fallback")
+        with fitz.open(pdf_path) as doc:
+            return [
+                self._native_page_text(page) or f"[OCR不可用] 圖片文件: {pdf_path.stem} 第 {page.number + 1} 頁"
+                for page in doc
+            ]
     
     def extract_text_from_image(self, image_path: Path) -> str:
         """Extract text from single image file"""
-        if not self._ocr_available:
+        if not self.is_available():
             logger.warning("OCR engine not available, using fallback")
             return self._fallback_text_extraction(image_path)
         
@@ -169,7 +400,7 @@ class OCRProcessor:
                 return self._fallback_text_extraction(image_path)
                 
         except Exception as e:
-            logger.error(f"Text extraction error: {e}")
+            logger.error("Text extraction error: %s", e)
             return self._fallback_text_extraction(image_path)
     
     def _fallback_text_extraction(self, image_path: Path) -> str:
@@ -208,21 +439,22 @@ class OCRProcessor:
         }
         
         try:
-            # Convert PDF to images
-            image_paths = self._convert_pdf_to_images(pdf_path)
+            # Render the pages and extract text from each one, in page order
+            if self.is_available():
+                texts = self._extract_pages(pdf_path)
+            else:
+                texts = self._fallback_pdf_pages(pdf_path)
             
-            if not image_paths:
-                logger.warning("No images generated from PDF")
+            if not texts:
+                logger.warning("No pages found in PDF")
                 return result
             
-            result["metadata"]["total_pages"] = len(image_paths)
+            result["metadata"]["total_pages"] = len(texts)
             
-            # Extract text from each page image
             all_text = []
             page_texts = []
             
-            for i, image_path in enumerate(image_paths):
-                page_text = self.extract_text_from_image(image_path)
+            for i, page_text in enumerate(texts):
                 page_texts.append({
                     "page": i + 1,
                     "text": page_text
@@ -230,22 +462,19 @@ class OCRProcessor:
                 
                 if page_text:
                     all_text.append(f"=== 第 {i + 1} 頁 ===\n{page_text}")
-                
-                # Clean up temporary image
-                try:
-                    image_path.unlink()
-                except Exception:
-                    pass
             
             # Combine all text
             result["text"] = "\n\n".join(all_text)
             result["pages"] = page_texts
             result["metadata"]["success"] = True
             
-            logger.info(f"PDF text extraction completed: {len(all_text)} pages processed")
+            logger.info("PDF text extraction completed: %s pages processed", len(all_text))
             
+        except ImportError as e:
+            logger.error("PyMuPDF not installed. Install with: pip install pymupdf")
+            result["metadata"]["error"] = str(e)
         except Exception as e:
-            logger.error(f"PDF text extraction error: {e}")
+            logger.error("PDF text extraction error: %s", e)
             result["metadata"]["error"] = str(e)
         
         return result
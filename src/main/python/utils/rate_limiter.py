@@ -0,0 +1,30 @@
+"""
+In-process rate limiter for pacing calls to external APIs
+"""
+import asyncio
+import time
+
+
+class AsyncRateLimiter:
+    """
+    Spaces calls evenly so no more than ``rate`` start per second
+    
+    Each caller reserves the next free slot before sleeping, so concurrent
+    callers queue up in order without a lock. A rate of 0 disables limiting.
+    Not thread-safe: meant to be used from the event loop only.
+    """
+    
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = 0.0
+    
+    async def acquire(self):
+        """Wait until the caller's slot comes up"""
+        if not self.interval:
+            return
+        
+        now = time.monotonic()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
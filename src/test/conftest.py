@@ -0,0 +1,56 @@
+"""
+Shared fixtures for the API tests
+
+The application reads its settings at import time, so the environment is
+pointed at a throwaway SQLite database before anything from src.main is
+imported. Redis is not required: the cache and rate-limit helpers degrade
+to no-ops when it is unreachable.
+"""
+import os
+import tempfile
+import uuid
+
+import pytest
+
+_runtime_dir = tempfile.mkdtemp(prefix="legal-analysis-test-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{_runtime_dir}/test.db",
+    "REDIS_URL": "redis://localhost:1/0",
+    "SECRET_KEY": "test-secret-key-with-at-least-32-characters",
+    "OPENAI_API_KEY": "sk-test",
+    "SEMANTIC_CACHE_ENABLED": "false",
+    "UPLOAD_DIR": f"{_runtime_dir}/uploads",
+    "LLM_BATCH_DIR": f"{_runtime_dir}/llm_batches",
+    "LOG_FILE": f"{_runtime_dir}/logs/app.log",
+})
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from src.main.python.main import app  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    """Test client with the application lifespan (schema creation) running"""
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def register_and_login(client, email: str) -> dict:
+    """Register a user and return the Authorization header for them"""
+    credentials = {"email": email, "password": "password123"}
+    client.post("/api/v1/auth/register", json={**credentials, "full_name": "Tester"})
+    response = client.post("/api/v1/auth/login", json=credentials)
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture(scope="session")
+def auth_headers(client):
+    """Authorization header for a user shared by the whole session"""
+    return register_and_login(client, "tester@example.com")
+
+
+@pytest.fixture
+def fresh_user_headers(client):
+    """Authorization header for a user with no data yet, for exact counts"""
+    return register_and_login(client, f"tester-{uuid.uuid4().hex[:12]}@example.com")
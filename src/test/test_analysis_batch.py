@@ -0,0 +1,41 @@
+"""
+Tests for POST /analysis/batch, analyzed now (defer=false) or queued for the Batch API
+"""
+import pytest
+
+from src.main.python.services.analysis_service import analysis_service
+
+QUESTIONS = [
+    {"question_text": "甲將其所有之土地出賣於乙，未辦理所有權移轉登記，乙之權利為何？"},
+    {"question_text": "公務員違法執行職務侵害人民權利，國家應負何種賠償責任？"},
+]
+
+
+@pytest.fixture(autouse=True)
+def no_llm(monkeypatch):
+    """No network in tests: take the keyword-based fallback instead of calling the LLM"""
+    monkeypatch.setattr(analysis_service.llm_service, "is_available", lambda: False)
+
+
+def test_immediate_batch_analyzes_every_question(client, auth_headers):
+    response = client.post(
+        "/api/v1/analysis/batch?defer=false", json={"questions": QUESTIONS}, headers=auth_headers
+    )
+    
+    assert response.status_code == 201
+    analyses = response.json()["analyses"]
+    assert len(analyses) == len(QUESTIONS)
+    
+    poll = client.get(f"/api/v1/analysis/{analyses[0]['analysis_id']}", headers=auth_headers)
+    assert poll.status_code == 200
+
+
+@pytest.mark.parametrize("defer", ["true", "false"])
+def test_malformed_document_id_is_rejected(client, auth_headers, defer):
+    questions = [{**QUESTIONS[0], "document_id": "not-a-uuid"}]
+    
+    response = client.post(
+        f"/api/v1/analysis/batch?defer={defer}", json={"questions": questions}, headers=auth_headers
+    )
+    
+    assert response.status_code == 400
@@ -0,0 +1,94 @@
+"""
+Tests for question analysis: inline, queued (202 + poll), and recovery of orphaned work
+"""
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import update
+
+from src.main.python.core.config import settings
+from src.main.python.core.database import AsyncSessionLocal
+from src.main.python.models.question_analysis import QuestionAnalysis
+from src.main.python.services.analysis_service import analysis_service
+from src.main.python.tasks import analysis_tasks
+from src.main.python.tasks.analysis_tasks import analyze_question_task
+
+QUESTION = {"question_text": "甲將其所有之土地出賣於乙，未辦理所有權移轉登記，乙之權利為何？"}
+
+
+@pytest.fixture
+def queued_tasks(monkeypatch):
+    """Record analysis tasks instead of publishing them to the broker"""
+    calls = []
+    monkeypatch.setattr(analyze_question_task, "delay", lambda *args: calls.append(args))
+    # No network in tests: take the keyword-based fallback instead of calling the LLM
+    monkeypatch.setattr(analysis_service.llm_service, "is_available", lambda: False)
+    return calls
+
+
+async def _set_status(analysis_id: str, status: str, age: timedelta):
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(QuestionAnalysis)
+            .where(QuestionAnalysis.id == uuid.UUID(analysis_id))
+            .values(status=status, updated_at=datetime.now(timezone.utc) - age)
+        )
+        await db.commit()
+
+
+async def _complete(analysis_id: str):
+    async with AsyncSessionLocal() as db:
+        return await analysis_service.complete_pending_analysis(analysis_id, db)
+
+
+def test_inline_analysis_completes_in_request(client, auth_headers, queued_tasks, monkeypatch):
+    monkeypatch.setattr(settings, "analysis_task_queue_enabled", False)
+    
+    response = client.post("/api/v1/analysis/question", json=QUESTION, headers=auth_headers)
+    
+    assert response.status_code == 201
+    assert not queued_tasks
+    analysis = response.json()["analysis"]
+    assert analysis["status"] == "completed"
+    
+    poll = client.get(f"/api/v1/analysis/{analysis['analysis_id']}", headers=auth_headers)
+    assert poll.status_code == 200
+    assert poll.json()["analysis"]["status"] == "completed"
+
+
+def test_queued_analysis_is_accepted_then_completed(client, auth_headers, queued_tasks):
+    response = client.post("/api/v1/analysis/question", json=QUESTION, headers=auth_headers)
+    
+    assert response.status_code == 202
+    analysis_id = response.json()["analysis_id"]
+    assert response.json()["status"] == "pending"
+    assert queued_tasks and queued_tasks[0][0] == analysis_id
+    
+    poll = client.get(f"/api/v1/analysis/{analysis_id}", headers=auth_headers)
+    assert poll.status_code == 200
+    assert poll.json()["analysis"]["status"] == "pending"
+    
+    # What the Celery worker does with the queued task
+    client.portal.call(analysis_tasks._analyze_question, *queued_tasks[0])
+    
+    poll = client.get(f"/api/v1/analysis/{analysis_id}", headers=auth_headers)
+    assert poll.status_code == 200
+    assert poll.json()["analysis"]["status"] == "completed"
+
+
+def test_redelivered_task_reclaims_only_stale_processing(client, auth_headers, queued_tasks):
+    response = client.post("/api/v1/analysis/question", json=QUESTION, headers=auth_headers)
+    analysis_id = response.json()["analysis_id"]
+    
+    # Another worker is still on it
+    client.portal.call(_set_status, analysis_id, "processing", timedelta(seconds=5))
+    assert client.portal.call(_complete, analysis_id) is None
+    
+    # The worker died long ago and the broker redelivered the task
+    client.portal.call(_set_status, analysis_id, "processing", timedelta(hours=2))
+    result = client.portal.call(_complete, analysis_id)
+    assert result is not None and result["status"] == "completed"
+    
+    # Finished analyses are never rerun
+    assert client.portal.call(_complete, analysis_id) is None
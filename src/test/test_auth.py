@@ -0,0 +1,48 @@
+"""
+Tests for login: upgrading legacy password hashes
+"""
+from passlib.hash import bcrypt
+from sqlalchemy import select, update
+
+from src.main.python.core.database import AsyncSessionLocal
+from src.main.python.models.user import User
+
+EMAIL = "legacy-bcrypt@example.com"
+PASSWORD = "password123"
+
+
+async def _set_hash(hashed_password: str):
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(User).where(User.email == EMAIL).values(hashed_password=hashed_password))
+        await db.commit()
+
+
+async def _get_hash() -> str:
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(select(User.hashed_password).where(User.email == EMAIL))
+
+
+def test_bcrypt_hash_is_upgraded_to_argon2_on_login(client):
+    client.post("/api/v1/auth/register", json={"email": EMAIL, "password": PASSWORD, "full_name": "Legacy"})
+    client.portal.call(_set_hash, bcrypt.using(rounds=4).hash(PASSWORD))
+    
+    response = client.post("/api/v1/auth/login", json={"email": EMAIL, "password": PASSWORD})
+    
+    assert response.status_code == 200
+    upgraded = client.portal.call(_get_hash)
+    assert upgraded.startswith("$argon2id$")
+    
+    # The upgraded hash still verifies
+    again = client.post("/api/v1/auth/login", json={"email": EMAIL, "password": PASSWORD})
+    assert again.status_code == 200
+
+
+def test_wrong_password_does_not_upgrade(client):
+    legacy = bcrypt.using(rounds=4).hash(PASSWORD)
+    client.post("/api/v1/auth/register", json={"email": EMAIL, "password": PASSWORD, "full_name": "Legacy"})
+    client.portal.call(_set_hash, legacy)
+    
+    response = client.post("/api/v1/auth/login", json={"email": EMAIL, "password": "wrong-password"})
+    
+    assert response.status_code == 401
+    assert client.portal.call(_get_hash) == legacy
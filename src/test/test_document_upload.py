@@ -0,0 +1,56 @@
+"""
+Tests for document uploads: reuse of OCR results for identical content
+"""
+import os
+import uuid
+
+from sqlalchemy import update
+
+from src.main.python.core.database import AsyncSessionLocal
+from src.main.python.models.document import Document
+
+CONTENT = b"%PDF-1.4\n% identical upload for dedup\n%%EOF\n"
+
+
+async def _mark_processed(document_id: str):
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(Document)
+            .where(Document.id == uuid.UUID(document_id))
+            .values(processing_status="completed", ocr_text="第一條 本法所稱", ocr_confidence=900)
+        )
+        await db.commit()
+
+
+async def _load(document_id: str) -> Document:
+    async with AsyncSessionLocal() as db:
+        return await db.get(Document, uuid.UUID(document_id))
+
+
+def _upload(client, auth_headers, filename: str):
+    return client.post(
+        "/api/v1/documents/upload?process_immediately=false",
+        files={"file": (filename, CONTENT, "application/pdf")},
+        headers=auth_headers
+    )
+
+
+def test_identical_upload_reuses_processed_document(client, auth_headers):
+    first = _upload(client, auth_headers, "statute.pdf")
+    assert first.status_code == 201
+    first_id = first.json()["document"]["document_id"]
+    client.portal.call(_mark_processed, first_id)
+    
+    second = _upload(client, auth_headers, "statute-copy.pdf")
+    
+    assert second.status_code == 201
+    document = second.json()["document"]
+    assert document["duplicate_of"] == first_id
+    assert document["processing_status"] == "completed"
+    
+    original = client.portal.call(_load, first_id)
+    duplicate = client.portal.call(_load, document["document_id"])
+    assert duplicate.ocr_text == original.ocr_text
+    assert duplicate.storage_path != original.storage_path
+    # Stored once: the new path is a hard link to the original file
+    assert os.path.samefile(duplicate.storage_path, original.storage_path)
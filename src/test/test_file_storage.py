@@ -0,0 +1,54 @@
+"""
+Tests for copying uploads into storage under the size limit
+"""
+import hashlib
+import io
+import tempfile
+
+import pytest
+
+from src.main.python.utils.file_storage import FileStorage, FileTooLargeError
+
+CONTENT = b"%PDF-1.4\n" + bytes(range(256)) * 40
+
+
+@pytest.fixture
+def real_file():
+    """An upload spooled to disk, which takes the sendfile() path"""
+    with tempfile.TemporaryFile() as f:
+        f.write(CONTENT)
+        f.seek(0)
+        yield f
+
+
+@pytest.fixture(params=["memory", "disk"])
+def upload(request, real_file):
+    return io.BytesIO(CONTENT) if request.param == "memory" else real_file
+
+
+def test_copy_within_limit_returns_size_and_digest(upload):
+    with tempfile.TemporaryFile() as destination:
+        copied, digest = FileStorage._copy_file(upload, destination, max_size=len(CONTENT))
+        destination.seek(0)
+        
+        assert copied == len(CONTENT)
+        assert digest == hashlib.sha256(CONTENT).hexdigest()
+        assert destination.read() == CONTENT
+
+
+def test_copy_over_limit_is_rejected_without_writing_past_it(upload):
+    limit = len(CONTENT) - 1
+    with tempfile.TemporaryFile() as destination:
+        with pytest.raises(FileTooLargeError):
+            FileStorage._copy_file(upload, destination, max_size=limit)
+        
+        assert destination.seek(0, io.SEEK_END) <= limit
+
+
+def test_copy_starts_from_current_position(real_file):
+    real_file.seek(9)
+    with tempfile.TemporaryFile() as destination:
+        copied, digest = FileStorage._copy_file(real_file, destination, max_size=len(CONTENT))
+    
+    assert copied == len(CONTENT) - 9
+    assert digest == hashlib.sha256(CONTENT[9:]).hexdigest()
@@ -0,0 +1,70 @@
+"""
+Tests for the per-user listing, count and statistics endpoints
+"""
+import uuid
+
+import pytest
+
+from src.main.python.services.analysis_service import analysis_service
+
+QUESTIONS = [
+    {"question_text": f"第{i}題：甲與乙訂立買賣契約，乙遲未給付價金，甲得如何主張權利？"}
+    for i in range(3)
+]
+
+
+@pytest.fixture(autouse=True)
+def no_llm(monkeypatch):
+    """No network in tests: take the keyword-based fallback instead of calling the LLM"""
+    monkeypatch.setattr(analysis_service.llm_service, "is_available", lambda: False)
+
+
+def test_analysis_list_count_and_stats_cover_the_users_rows(client, fresh_user_headers):
+    created = client.post(
+        "/api/v1/analysis/batch?defer=false", json={"questions": QUESTIONS}, headers=fresh_user_headers
+    )
+    assert created.status_code == 201
+    
+    listing = client.get("/api/v1/analysis/?limit=2", headers=fresh_user_headers).json()
+    assert len(listing["analyses"]) == 2
+    assert listing["pagination"]["total"] == 3
+    
+    stats = client.get("/api/v1/analysis/stats/summary", headers=fresh_user_headers).json()
+    assert stats["statistics"]["total_analyses"] == 3
+
+
+def test_rating_an_analysis(client, fresh_user_headers):
+    created = client.post(
+        "/api/v1/analysis/batch?defer=false", json={"questions": QUESTIONS[:1]}, headers=fresh_user_headers
+    )
+    analysis_id = created.json()["analyses"][0]["analysis_id"]
+    
+    rated = client.post(
+        f"/api/v1/analysis/{analysis_id}/rate", json={"rating": 4}, headers=fresh_user_headers
+    )
+    assert rated.status_code == 200
+    
+    missing = client.post(
+        f"/api/v1/analysis/{uuid.uuid4()}/rate", json={"rating": 4}, headers=fresh_user_headers
+    )
+    assert missing.status_code == 404
+
+
+def test_document_list_count_and_stats_cover_the_users_rows(client, fresh_user_headers):
+    for i in range(2):
+        uploaded = client.post(
+            "/api/v1/documents/upload?process_immediately=false",
+            files={"file": (f"doc{i}.pdf", f"%PDF-1.4 {i}".encode(), "application/pdf")},
+            headers=fresh_user_headers
+        )
+        assert uploaded.status_code == 201
+    
+    listing = client.get("/api/v1/documents/", headers=fresh_user_headers).json()
+    assert len(listing["documents"]) == 2
+    assert listing["pagination"]["total"] == 2
+    
+    document_id = listing["documents"][0]["id"]
+    assert client.get(f"/api/v1/documents/{document_id}", headers=fresh_user_headers).status_code == 200
+    
+    stats = client.get("/api/v1/documents/stats/summary", headers=fresh_user_headers).json()
+    assert stats["statistics"]["total_documents"] == 2
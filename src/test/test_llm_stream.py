@@ -0,0 +1,49 @@
+"""
+Tests for detecting the end of a streamed JSON reply
+"""
+import orjson
+
+from src.main.python.services.llm_service import _JsonStreamScanner
+
+
+def _feed(*chunks: str):
+    scanner = _JsonStreamScanner()
+    for index, chunk in enumerate(chunks):
+        if scanner.feed(chunk):
+            return scanner.text, index
+    return None, len(chunks)
+
+
+def test_stops_at_end_of_first_json_value():
+    text, stopped_at = _feed('{"question_type": "選擇', '題", "score": 0.9}', " and some commentary")
+    
+    assert stopped_at == 1
+    assert orjson.loads(text) == {"question_type": "選擇題", "score": 0.9}
+
+
+def test_skips_prose_with_stray_brackets_before_the_json():
+    text, _ = _feed("Here is the result [see below] {note}:\n", '{"a": [1, {"b": 2}]}')
+    
+    assert orjson.loads(text[text.index('{"a"'):]) == {"a": [1, {"b": 2}]}
+
+
+def test_brackets_and_escaped_quotes_inside_strings_are_ignored():
+    value = {"law": '民法第184條 "}]" \\ 與 {' + "\\" + '"'}
+    encoded = orjson.dumps(value).decode()
+    
+    text, _ = _feed(encoded[:10], encoded[10:25], encoded[25:], "}")
+    
+    assert orjson.loads(text) == value
+
+
+def test_top_level_array():
+    text, stopped_at = _feed("[1, [2, 3]", "] trailing")
+    
+    assert stopped_at == 1
+    assert orjson.loads(text) == [1, [2, 3]]
+
+
+def test_incomplete_reply_never_completes():
+    text, _ = _feed('{"a": ', '"unterminated')
+    
+    assert text is None
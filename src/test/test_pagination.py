@@ -0,0 +1,63 @@
+"""
+Tests for keyset (cursor) pagination
+"""
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from src.main.python.core.pagination import decode_cursor, encode_cursor, next_cursor
+from src.main.python.services.analysis_service import analysis_service
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2026, 3, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+    record_id = uuid.uuid4()
+    
+    cursor = encode_cursor(created_at, record_id)
+    
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, record_id)
+
+
+def test_missing_cursor_decodes_to_none():
+    assert decode_cursor(None) is None
+    assert decode_cursor("") is None
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", encode_cursor(datetime(2026, 1, 1), "nope")])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as excinfo:
+        decode_cursor(cursor)
+    assert excinfo.value.status_code == 400
+
+
+def test_next_cursor_only_on_full_pages():
+    rows = [SimpleNamespace(created_at=datetime(2026, 1, day), id=uuid.uuid4()) for day in (3, 2)]
+    
+    assert next_cursor(rows, limit=3) is None
+    assert decode_cursor(next_cursor(rows, limit=2)) == (rows[-1].created_at, rows[-1].id)
+
+
+def test_cursor_pages_walk_every_row_once(client, fresh_user_headers, monkeypatch):
+    monkeypatch.setattr(analysis_service.llm_service, "is_available", lambda: False)
+    questions = [
+        {"question_text": f"第{i}題：債務人給付遲延時，債權人得請求何種損害賠償？"} for i in range(5)
+    ]
+    client.post("/api/v1/analysis/batch?defer=false", json={"questions": questions}, headers=fresh_user_headers)
+    
+    seen = []
+    cursor = None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/api/v1/analysis/", params=params, headers=fresh_user_headers).json()
+        seen.extend(analysis["id"] for analysis in page["analyses"])
+        cursor = page["pagination"]["next_cursor"]
+        if cursor is None:
+            break
+    
+    by_offset = client.get("/api/v1/analysis/?limit=10", headers=fresh_user_headers).json()
+    assert seen == [analysis["id"] for analysis in by_offset["analyses"]]
+    assert len(seen) == 5
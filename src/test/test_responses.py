@@ -0,0 +1,58 @@
+"""
+Tests for conditional GET support (ETags and 304 responses)
+"""
+from datetime import datetime
+
+from starlette.requests import Request
+
+from src.main.python.core.responses import not_modified, record_etag
+from src.main.python.services.analysis_service import analysis_service
+
+
+def _request(if_none_match=None) -> Request:
+    headers = [(b"if-none-match", if_none_match.encode())] if if_none_match else []
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": headers})
+
+
+def test_record_etag_changes_with_updated_at():
+    first = record_etag("abc", datetime(2026, 1, 1, 0, 0, 0, 1))
+    second = record_etag("abc", datetime(2026, 1, 1, 0, 0, 0, 2))
+    
+    assert first.startswith('W/"abc-')
+    assert first != second
+    assert record_etag("abc", None) == 'W/"abc-0"'
+
+
+def test_not_modified_matches_listed_or_wildcard_tags():
+    etag = record_etag("abc", datetime(2026, 1, 1))
+    
+    response = not_modified(_request(f'W/"other", {etag}'), etag)
+    assert response is not None
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    
+    assert not_modified(_request("*"), etag).status_code == 304
+
+
+def test_not_modified_passes_through_otherwise():
+    etag = record_etag("abc", datetime(2026, 1, 1))
+    
+    assert not_modified(_request(), etag) is None
+    assert not_modified(_request('W/"abc-0"'), etag) is None
+
+
+def test_analysis_detail_answers_304_for_current_etag(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(analysis_service.llm_service, "is_available", lambda: False)
+    created = client.post(
+        "/api/v1/analysis/batch?defer=false",
+        json={"questions": [{"question_text": "行政處分之撤銷與廢止有何不同？請說明之。"}]},
+        headers=auth_headers
+    )
+    url = f"/api/v1/analysis/{created.json()['analyses'][0]['analysis_id']}"
+    
+    first = client.get(url, headers=auth_headers)
+    assert first.status_code == 200
+    
+    cached = client.get(url, headers={**auth_headers, "If-None-Match": first.headers["ETag"]})
+    assert cached.status_code == 304
+    assert cached.content == b""